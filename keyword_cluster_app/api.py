@@ -1,9 +1,11 @@
+import gc
 import json
 import logging
 import logging.handlers
 import os
 import sys
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, List, Optional, Union
 from uuid import uuid4
 
 from arq import ArqRedis
@@ -17,10 +19,13 @@ from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.util import get_remote_address
 
-from keyword_cluster_app.config import LOG_FILE_PATH, REDIS_URL, SYNC_MAX_KEYWORDS, ASYNC_MAX_KEYWORDS, API_KEY
-from keyword_cluster_app.model import load_model, model
-from keyword_cluster_app.model import load_model, model
-from keyword_cluster_app.services.clustering_service import ClusteringService
+from keyword_cluster_app.config import LOG_FILE_PATH, REDIS_URL, SYNC_MAX_KEYWORDS, ASYNC_MAX_KEYWORDS, API_KEY, ASSIGN_RATE_LIMIT, SYNC_DEFAULT_STAGES
+from keyword_cluster_app.model import get_cache_stats, is_model_loaded
+from keyword_cluster_app.services.clustering_service import ClusteringService, warm_up
+from keyword_cluster_app.services.knn_graph import load_knn_graph
+from keyword_cluster_app.services.project_store import delete_project, validate_project_id
+from keyword_cluster_app.services.realtime_assign import assign_keyword, get_batcher
+from keyword_cluster_app.services.task_artifacts import redis_key as artifacts_key
 
 # Configure logging for the API
 logging.basicConfig(
@@ -62,7 +67,9 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "keyword-clustering-api",
-        "version": "2.0.0"
+        "version": "2.0.0",
+        "embedding_cache": get_cache_stats(),
+        "assign_batching": dict(get_batcher().stats),
     }
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
@@ -118,6 +125,8 @@ class TaskResultResponse(BaseModel):
     task_id: str
     status: str
     progress: Optional[str] = None
+    # Current stage, stage/overall percent, elapsed seconds and ETAs (see services/progress.py)
+    progress_detail: Optional[Dict[str, Any]] = None
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
@@ -132,6 +141,8 @@ class KeywordOutput(BaseModel):
     text: str
     volume: int
     matching_point: float = Field(..., description="Similarity score (0-100) to the cluster theme.")
+    intent: Optional[str] = Field(None, description="Search intent (set when the 'intent' stage ran).")
+    sub_intent: Optional[str] = None
     
     # Hidden advanced fields (calculated internally but not returned by default to simplify view)
     # micro_intent: Optional[str] = None
@@ -148,15 +159,56 @@ class ClusteringRequest(BaseModel):
     level: str = Field("trung bình", description="Clustering detail level: 'thấp', 'trung bình', 'cao'.")
     min_cluster_size: Optional[int] = Field(None, description="Minimum number of keywords for a cluster.")
     clustering_method: str = Field("semantic", description="Clustering method: 'semantic' or 'serp'.")
+    levels: Optional[List[str]] = Field(None, description="Cluster at several levels in one pass (e.g. ['thấp', 'trung bình', 'cao']); the response has one result block per level and `level` is ignored.")
+    refine_mode: Optional[str] = Field(None, description="Cross-encoder refinement: 'gated' (uncertain keywords only) or 'strict' (every keyword). Defaults to REFINE_MODE.")
+    refine_max_pairs: Optional[int] = Field(None, ge=0, description="Max cross-encoder pairs in gated mode (0 = unlimited).")
+    refine_time_budget: Optional[float] = Field(None, ge=0, description="Max seconds spent on cross-encoder refinement in gated mode (0 = unlimited).")
+    partitioned: Optional[bool] = Field(None, description="Partitioned clustering for large jobs (coarse split, UMAP/HDBSCAN per partition in parallel, merge). Defaults to PARTITIONED_CLUSTERING.")
+    project_id: Optional[str] = Field(None, description="Persist the result as a clustering project under this id (replacing an existing one); new keywords can then be added with POST /projects/{project_id}/keywords. Single level only, never partitioned.")
+    stages: Optional[List[str]] = Field(None, description="Optional stages to run, any of 'intent' (keyword and cluster intents), 'refine' (cross-encoder refinement), 'hybrid_lexical' (TF-IDF block of the hybrid representation), 'collapse' (near-duplicate keywords clustered as one row); stages left out do not run. Defaults to SYNC_DEFAULT_STAGES for /cluster_keywords_sync and DEFAULT_STAGES for tasks.")
+
+
+class RerunRequest(BaseModel):
+    level: str = Field("trung bình", description="Clustering detail level for the re-run.")
+    levels: Optional[List[str]] = Field(None, description="Re-run at several levels; `level` is ignored.")
+    min_cluster_size: Optional[int] = Field(None, description="Minimum number of keywords for a cluster.")
+    refine_mode: Optional[str] = Field(None, description="Cross-encoder refinement: 'gated' or 'strict'. Defaults to REFINE_MODE.")
+    refine_max_pairs: Optional[int] = Field(None, ge=0)
+    refine_time_budget: Optional[float] = Field(None, ge=0)
+    from_stage: str = Field("auto", description="'auto' (latest reusable stage), 'cluster' (stored UMAP coordinates only, fails if the level needs a new UMAP) or 'reduce' (UMAP again from the stored embeddings and intents).")
+
+
+class ProjectKeywordsRequest(BaseModel):
+    keywords: List[KeywordInput] = Field(..., min_items=1, description="Keywords to add to the project.")
+    auto_recluster: bool = Field(True, description="Queue a full re-cluster of the project when its drift crosses PROJECT_DRIFT_THRESHOLD.")
+
+
+class AssignRequest(BaseModel):
+    project_id: str = Field(..., description="Clustering project whose topic map is used.")
+    keyword: str = Field(..., min_length=1, description="The keyword to classify.")
+    top_k: int = Field(3, ge=1, le=50, description="Number of clusters to return.")
+
+
+class AssignedCluster(BaseModel):
+    cluster_name: str
+    score: float = Field(..., description="Cosine similarity (0-1) to the cluster centroid.")
+    matching_point: float = Field(..., description="Similarity score (0-100) to the cluster name keyword.")
+
+
+class AssignResponse(BaseModel):
+    project_id: str
+    keyword: str
+    clusters: List[AssignedCluster]
+    took_ms: float
 
 
 class ClusterResult(BaseModel):
     cluster_name: str
     keywords: List[KeywordOutput]
     total_volume_topic: Optional[int] = Field(None, description="Total search volume.")
+    cluster_intent: Optional[str] = Field(None, description="Intent carrying most of the cluster's volume (set when the 'intent' stage ran).")
     
     # Hidden advanced fields
-    # cluster_intent: str
     # content_format: Optional[str] = None
     # parent_topic: Optional[str] = None
     # related_keywords: Optional[List[str]] = None
@@ -168,13 +220,45 @@ class ClusteringResponse(BaseModel):
     unclustered_keywords: List[KeywordOutput]
     summary: Dict[str, Any]
 
-@app.post("/cluster_keywords_sync", response_model=ClusteringResponse)
+
+class MultiLevelClusteringResponse(BaseModel):
+    levels: Dict[str, ClusteringResponse]
+
+
+def _to_clustering_response(result_data: Dict[str, Any]) -> ClusteringResponse:
+    """Converts a raw clustering result into the Pydantic response model."""
+    response_clusters = {}
+    for cluster_key, cluster_data in result_data.get("clusters", {}).items():
+        response_clusters[cluster_key] = ClusterResult(
+            cluster_name=cluster_data.get("cluster_name", cluster_key),
+            keywords=[KeywordOutput(**kw) for kw in cluster_data.get("keywords", [])],
+            total_volume_topic=cluster_data.get("total_volume_topic"),
+            researched_entities=cluster_data.get("researched_entities", []),
+            cluster_intent=cluster_data.get("cluster_intent"),
+            coherence_score=cluster_data.get("coherence_score"),
+            difficulty_score=cluster_data.get("difficulty_score"),
+            opportunity_score=cluster_data.get("opportunity_score"),
+            llm_name_score=cluster_data.get("llm_name_score"),
+            content_type_suggestion=cluster_data.get("content_type_suggestion"),
+            llm_summary=cluster_data.get("llm_summary"),
+            llm_content_ideas=cluster_data.get("llm_content_ideas"),
+        )
+
+    response_unclustered = [KeywordOutput(**kw) for kw in result_data.get("unclustered", [])]
+
+    return ClusteringResponse(
+        clusters=response_clusters,
+        unclustered_keywords=response_unclustered,
+        summary=result_data.get("summary", {}),
+    )
+
+@app.post("/cluster_keywords_sync", response_model=Union[ClusteringResponse, MultiLevelClusteringResponse])
 @limiter.limit("10/minute")
 async def cluster_keywords_sync_endpoint(request: Request, payload: ClusteringRequest = Body(...), api_key: str = Depends(get_api_key)):
     if len(payload.keywords) > SYNC_MAX_KEYWORDS:
         raise HTTPException(400, detail=f"For synchronous processing, a maximum of {SYNC_MAX_KEYWORDS:,} keywords is allowed.")
     
-    if model is None:
+    if not is_model_loaded():
         raise HTTPException(status_code=503, detail="AI model is not loaded. Please try again later.")
 
     try:
@@ -186,38 +270,32 @@ async def cluster_keywords_sync_endpoint(request: Request, payload: ClusteringRe
             "level": payload.level,
             "min_cluster_size_override": payload.min_cluster_size,
             "clustering_method": payload.clustering_method,
+            "refine_mode": payload.refine_mode,
+            "refine_max_pairs": payload.refine_max_pairs,
+            "refine_time_budget": payload.refine_time_budget,
+            "partitioned": payload.partitioned,
+            "stages": SYNC_DEFAULT_STAGES if payload.stages is None else payload.stages,
         }
         
         # Call the clustering function directly
         service = ClusteringService()
-        result_data = service.process_clustering(**worker_payload)
-
-        # Convert the raw result to the Pydantic response model
-        response_clusters = {}
-        for cluster_name, cluster_data in result_data.get("clusters", {}).items():
-            response_clusters[cluster_name] = ClusterResult(
-                cluster_name=cluster_name,
-                keywords=[KeywordOutput(**kw) for kw in cluster_data.get("keywords", [])],
-                total_volume_topic=cluster_data.get("total_volume_topic"),
-                researched_entities=cluster_data.get("researched_entities", []),
-                cluster_intent=cluster_data.get("cluster_intent", ""),
-                coherence_score=cluster_data.get("coherence_score"),
-                difficulty_score=cluster_data.get("difficulty_score"),
-                opportunity_score=cluster_data.get("opportunity_score"),
-                llm_name_score=cluster_data.get("llm_name_score"),
-                content_type_suggestion=cluster_data.get("content_type_suggestion"),
-                llm_summary=cluster_data.get("llm_summary"),
-                llm_content_ideas=cluster_data.get("llm_content_ideas"),
+        if payload.levels:
+            if payload.project_id:
+                raise HTTPException(400, detail="project_id cannot be combined with levels.")
+            # One pass over shared embeddings / TF-IDF / kNN graph, one block per level
+            worker_payload.pop("level")
+            result_data = service.process_clustering_levels(levels=payload.levels, **worker_payload)
+            return MultiLevelClusteringResponse(
+                levels={lvl: _to_clustering_response(r) for lvl, r in result_data["levels"].items()}
             )
+        result_data = service.process_clustering(project_id=payload.project_id, **worker_payload)
 
-        response_unclustered = [KeywordOutput(**kw) for kw in result_data.get("unclustered", [])]
-        
-        return ClusteringResponse(
-            clusters=response_clusters,
-            unclustered_keywords=response_unclustered,
-            summary=result_data.get("summary", {}),
-        )
+        return _to_clustering_response(result_data)
 
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Error during synchronous clustering:")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
@@ -226,15 +304,19 @@ async def cluster_keywords_sync_endpoint(request: Request, payload: ClusteringRe
 async def startup_event():
     logger.info("Starting up Keyword Clustering API...")
     # set_seed(42) # Seed should be set in worker for reproducibility of tasks
-    logger.info("Loading AI model...")
+    logger.info("Warming up AI model and clustering pipeline...")
     try:
-        load_model()
-        if model is None:
+        if not warm_up():
             raise RuntimeError("AI model could not be loaded.")
         logger.info("AI model loaded successfully.")
     except Exception as e:
         logger.error(f"Failed to load AI model at startup: {e}")
         pass
+
+    # Models and libraries live for the whole process: move them out of the
+    # collected generations so GC pauses do not hit /assign latency
+    gc.collect()
+    gc.freeze()
     
     # Initialize ARQ Redis client
     app.state.arq_redis = await ArqRedis(RedisSettings.from_dsn(REDIS_URL))
@@ -255,8 +337,15 @@ async def cluster_keywords_endpoint(request: Request, payload: ClusteringRequest
     """
     Submits a keyword clustering task to the background queue.
     """
-    if model is None:
+    if not is_model_loaded():
         raise HTTPException(status_code=503, detail="AI model is not loaded. Please try again later.")
+    if payload.project_id:
+        if payload.levels:
+            raise HTTPException(400, detail="project_id cannot be combined with levels.")
+        try:
+            validate_project_id(payload.project_id)
+        except ValueError as e:
+            raise HTTPException(400, detail=str(e))
 
     task_id = str(uuid4())
     logger.info(f"Received clustering request. Assigning task_id: {task_id}")
@@ -267,6 +356,13 @@ async def cluster_keywords_endpoint(request: Request, payload: ClusteringRequest
         "level": payload.level,
         "min_cluster_size_override": payload.min_cluster_size,
         "clustering_method": payload.clustering_method,
+        "refine_mode": payload.refine_mode,
+        "refine_max_pairs": payload.refine_max_pairs,
+        "refine_time_budget": payload.refine_time_budget,
+        "partitioned": payload.partitioned,
+        "levels": payload.levels,
+        "project_id": payload.project_id,
+        "stages": payload.stages,
     }
 
     try:
@@ -319,30 +415,18 @@ async def get_clustering_results(task_id: str):
         if result_json:
             result_data = json.loads(result_json.decode('utf-8'))
             # Convert raw results to Pydantic model for validation/consistency
-            response_clusters = {}
-            for cluster_name, cluster_data in result_data["clusters"].items():
-                response_clusters[cluster_name] = ClusterResult(
-                    cluster_name=cluster_name,
-                    keywords=[KeywordOutput(**kw) for kw in cluster_data["keywords"]],
-                    total_volume_topic=cluster_data.get("total_volume_topic"),
-                    researched_entities=cluster_data.get("researched_entities", []),
-                    cluster_intent=cluster_data.get("cluster_intent", ""),
-                    coherence_score=cluster_data.get("coherence_score"),
-                    difficulty_score=cluster_data.get("difficulty_score"),
-                    opportunity_score=cluster_data.get("opportunity_score"),
-                    llm_name_score=cluster_data.get("llm_name_score"),
-                    content_type_suggestion=cluster_data.get("content_type_suggestion"),
-                    llm_summary=cluster_data.get("llm_summary"),
-                    llm_content_ideas=cluster_data.get("llm_content_ideas"),
-                )
-            
-            response_unclustered = [KeywordOutput(**kw) for kw in result_data["unclustered"]]
-
-            final_result = ClusteringResponse(
-                clusters=response_clusters,
-                unclustered_keywords=response_unclustered,
-                summary=result_data["summary"],
-            ).dict() # Convert to dict for TaskResultResponse
+            if "levels" in result_data:
+                final_result = MultiLevelClusteringResponse(
+                    levels={lvl: _to_clustering_response(r) for lvl, r in result_data["levels"].items()}
+                ).dict()
+            else:
+                final_result = _to_clustering_response(result_data).dict() # Convert to dict for TaskResultResponse
+            return TaskResultResponse(
+                task_id=task_id,
+                status=status_str,
+                progress=progress_str,
+                result=final_result,
+            )
         else:
             # Should not happen if status is completed, but handle defensively
             return TaskResultResponse(
@@ -359,13 +443,153 @@ async def get_clustering_results(task_id: str):
             error=error_str.decode('utf-8') if error_str else "Unknown error."
         )
     else: # pending, in_progress
+        progress_detail = await arq_redis.get(f"task:{task_id}:progress_detail")
         return TaskResultResponse(
             task_id=task_id,
             status=status_str,
             progress=progress_str,
+            progress_detail=json.loads(progress_detail.decode('utf-8')) if progress_detail else None,
             message="Task is still processing."
         )
 
+@app.post("/results/{task_id}/rerun", response_model=TaskStatusResponse, status_code=status.HTTP_202_ACCEPTED)
+@limiter.limit("100/minute")
+async def rerun_clustering_endpoint(request: Request, task_id: str, payload: RerunRequest = Body(...), api_key: str = Depends(get_api_key)):
+    """
+    Re-runs a finished task with new parameters (min_cluster_size, level)
+    from its stored stage artifacts instead of from scratch. Returns a new
+    task id; poll /results/{new_task_id} as usual.
+    """
+    if payload.from_stage not in ("auto", "cluster", "reduce"):
+        raise HTTPException(400, detail="from_stage must be 'auto', 'cluster' or 'reduce'.")
+    arq_redis: ArqRedis = app.state.arq_redis
+    if await arq_redis.get(artifacts_key(task_id)) is None:
+        raise HTTPException(status_code=404, detail="No stage artifacts for this task (unknown, still running or expired).")
+
+    new_task_id = str(uuid4())
+    worker_payload = {
+        "level": payload.level,
+        "levels": payload.levels,
+        "min_cluster_size_override": payload.min_cluster_size,
+        "refine_mode": payload.refine_mode,
+        "refine_max_pairs": payload.refine_max_pairs,
+        "refine_time_budget": payload.refine_time_budget,
+        "from_stage": payload.from_stage,
+    }
+    try:
+        await arq_redis.enqueue_job("background_rerun_clustering", new_task_id, task_id, worker_payload, _job_id=new_task_id)
+        await arq_redis.set(f"task:{new_task_id}:status", "pending")
+        await arq_redis.set(f"task:{new_task_id}:progress", "0%")
+    except Exception as e:
+        logger.exception(f"Error submitting re-run of task {task_id}:")
+        raise HTTPException(status_code=500, detail=f"Failed to submit task: {e}")
+
+    return TaskStatusResponse(
+        task_id=new_task_id,
+        status="pending",
+        message=f"Re-run of task {task_id} submitted. Use /results/{new_task_id} to check status.",
+    )
+
+@app.get("/results/{task_id}/similar_keywords")
+async def get_similar_keywords(task_id: str, keyword: str, top_n: int = 10):
+    """
+    Nearest keywords to `keyword` in a completed task, read from the task's
+    shared kNN graph (no re-embedding).
+    """
+    arq_redis: ArqRedis = app.state.arq_redis
+    result_json = await arq_redis.get(f"task:{task_id}:result")
+    if result_json is None:
+        raise HTTPException(status_code=404, detail="Task not found or not completed.")
+
+    result_data = json.loads(result_json.decode('utf-8'))
+    # Multi-level results share one graph: any level's summary points to it
+    level_results = list(result_data.get("levels", {}).values())
+    summary = level_results[0].get("summary", {}) if level_results else result_data.get("summary", {})
+    fingerprint = summary.get("knn_graph", {}).get("fingerprint")
+    graph = load_knn_graph(fingerprint) if fingerprint else None
+    if graph is None:
+        raise HTTPException(status_code=404, detail="No kNN graph stored for this task.")
+
+    similar = graph.similar(keyword, top_n=max(1, min(top_n, graph.n_neighbors)))
+    if not similar and keyword not in graph.texts:
+        raise HTTPException(status_code=404, detail="Keyword not found in this task.")
+    return {"task_id": task_id, "keyword": keyword, "similar_keywords": similar}
+
+@app.post("/projects/{project_id}/keywords")
+@limiter.limit("30/minute")
+async def add_project_keywords(request: Request, project_id: str, payload: ProjectKeywordsRequest = Body(...), api_key: str = Depends(get_api_key)):
+    """
+    Adds keywords to a clustering project without re-clustering: new keywords
+    are embedded and placed into the existing clusters, keywords the project
+    already has keep their cluster. When the project's drift crosses the
+    threshold, a full re-cluster is queued (see summary.recluster_task_id).
+    """
+    if len(payload.keywords) > SYNC_MAX_KEYWORDS:
+        raise HTTPException(400, detail=f"A maximum of {SYNC_MAX_KEYWORDS:,} keywords can be added per request.")
+    if not is_model_loaded():
+        raise HTTPException(status_code=503, detail="AI model is not loaded. Please try again later.")
+
+    try:
+        result = ClusteringService().add_keywords_to_project(project_id, [kw.dict() for kw in payload.keywords])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Project '{project_id}' not found.")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if payload.auto_recluster and result["summary"]["drift"]["recluster_required"]:
+        task_id = str(uuid4())
+        await app.state.arq_redis.enqueue_job("background_recluster_project", task_id, project_id, _job_id=task_id)
+        await app.state.arq_redis.set(f"task:{task_id}:status", "pending")
+        await app.state.arq_redis.set(f"task:{task_id}:progress", "0%")
+        result["summary"]["recluster_task_id"] = task_id
+        logger.info(f"Project '{project_id}' drifted, queued re-cluster task {task_id}.")
+    return result
+
+@app.post("/assign", response_model=AssignResponse)
+@limiter.limit(ASSIGN_RATE_LIMIT)
+async def assign_keyword_endpoint(request: Request, payload: AssignRequest = Body(...), api_key: str = Depends(get_api_key)):
+    """
+    Real-time classification of one keyword into a project's existing clusters
+    (top-k by centroid similarity). Concurrent requests share encoder batches.
+    """
+    start = time.perf_counter()
+    if not is_model_loaded():
+        raise HTTPException(status_code=503, detail="AI model is not loaded. Please try again later.")
+    try:
+        clusters = await assign_keyword(payload.project_id, payload.keyword, payload.top_k)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Project '{payload.project_id}' not found.")
+    return AssignResponse(
+        project_id=payload.project_id,
+        keyword=payload.keyword,
+        clusters=clusters,
+        took_ms=round((time.perf_counter() - start) * 1000, 3),
+    )
+
+@app.get("/projects/{project_id}")
+async def get_project(project_id: str, api_key: str = Depends(get_api_key)):
+    """Metadata and drift status of a clustering project."""
+    try:
+        return ClusteringService.project_info(project_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Project '{project_id}' not found.")
+
+@app.delete("/projects/{project_id}")
+async def remove_project(project_id: str, api_key: str = Depends(get_api_key)):
+    try:
+        deleted = delete_project(project_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Project '{project_id}' not found.")
+    return {"project_id": project_id, "deleted": True}
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the Keyword Clustering API. Use /cluster_keywords to perform clustering."}
@@ -4,16 +4,9 @@ import logging
 import os
 import sys
 import logging.handlers
-import pandas as pd
-from fastapi import FastAPI
 
 from keyword_cluster_app.config import LOG_FILE_PATH
-from keyword_cluster_app.model import load_model
-from keyword_cluster_app.services.clustering_service import ClusteringService
-from keyword_cluster_app.utils.file_io import load_keywords_from_file
-from keyword_cluster_app.utils.common import set_seed
 
-app = FastAPI()
 logger = logging.getLogger(__name__)
 
 def main() -> None:
@@ -59,6 +52,65 @@ def main() -> None:
             "'serp' dùng dữ liệu SERP (URL overlap)."
         ),
     )
+    parser.add_argument(
+        "--refine-mode",
+        type=str,
+        default=None,
+        choices=["gated", "strict"],
+        help=(
+            "Kiểm tra lại bằng Cross-Encoder: 'gated' chỉ kiểm tra từ khóa không chắc chắn, "
+            "'strict' kiểm tra toàn bộ. Mặc định theo REFINE_MODE."
+        ),
+    )
+    parser.add_argument(
+        "--stages",
+        type=str,
+        default=None,
+        help=(
+            "Các bước tùy chọn được chạy, phân tách bằng dấu phẩy: 'intent' (ý định tìm kiếm "
+            "của keyword và cụm), 'refine' (kiểm tra lại bằng Cross-Encoder), 'hybrid_lexical' "
+            "(đặc trưng TF-IDF), 'collapse' (gộp keyword gần trùng như không dấu, đảo thứ tự từ "
+            "trước khi phân cụm). Bước không liệt kê sẽ bị bỏ qua. Mặc định theo DEFAULT_STAGES."
+        ),
+    )
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        default=None,
+        help=(
+            "Phân cụm theo phân vùng cho dữ liệu lớn: chia thô keyword, chạy UMAP/HDBSCAN "
+            "song song trên từng phần rồi gộp cụm giữa các phần. Mặc định theo PARTITIONED_CLUSTERING."
+        ),
+    )
+    parser.add_argument(
+        "--project-id",
+        type=str,
+        default=None,
+        help=(
+            "Lưu kết quả thành dự án phân cụm với mã này, để sau đó thêm keyword mới "
+            "vào các cụm có sẵn qua API (POST /projects/{project_id}/keywords) mà không phân cụm lại."
+        ),
+    )
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help=(
+            "Chế độ cho file rất lớn (hàng triệu keyword): đọc file theo từng khối, "
+            "phân cụm trên một mẫu và gán phần còn lại, ghi kết quả ra thư mục --output-dir."
+        ),
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Thư mục kết quả cho --out-of-core (mặc định: clustering_result_<thời gian>).",
+    )
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=int,
+        default=None,
+        help="Giới hạn bộ nhớ làm việc (MB) cho --out-of-core. Mặc định theo OUT_OF_CORE_MEMORY_BUDGET_MB.",
+    )
     parser.add_argument(
         "--log-to-stdout",
         action="store_true",
@@ -96,8 +148,38 @@ def main() -> None:
     global logger
     logger = logging.getLogger(__name__) 
 
+    # Heavy imports (pandas, numpy, torch) only after argument parsing, so --help stays instant
+    import pandas as pd
+    from keyword_cluster_app.services.clustering_service import ClusteringService
+    from keyword_cluster_app.utils.file_io import load_keywords_from_file
+    from keyword_cluster_app.utils.common import set_seed
+
     try:
         set_seed(42) # Set global seed for reproducibility
+
+        if args.out_of_core:
+            print("Loading AI model...")
+            service = ClusteringService()
+            print("AI model loaded.")
+
+            output_dir = args.output_dir or f"clustering_result_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}"
+            print(f"Starting out-of-core clustering with detail level: {args.level}...")
+            summary = service.process_clustering_out_of_core(
+                args.file_path,
+                output_dir,
+                level=args.level,
+                min_cluster_size_override=args.min_cluster_size,
+                memory_budget_mb=args.memory_budget_mb,
+            )
+
+            print("\n--- Summary ---")
+            print(f"Total Keywords Processed: {summary['total_keywords_processed']}")
+            print(f"Total Clusters Found: {summary['total_clusters_found']}")
+            print(f"Unclustered (Noise) Keywords: {summary['noise_keywords_found']}")
+            print(f"Peak memory: {summary['out_of_core']['peak_rss_mb']} MB")
+            print(f"\n>>> ĐÃ LƯU KẾT QUẢ RA THƯ MỤC: {output_dir}")
+            return
+
         raw_keywords = load_keywords_from_file(args.file_path)
 
         print("Loading AI model...")
@@ -110,7 +192,11 @@ def main() -> None:
             raw_keywords,
             level=args.level,
             min_cluster_size_override=args.min_cluster_size,
-            clustering_method=args.clustering_method
+            clustering_method=args.clustering_method,
+            refine_mode=args.refine_mode,
+            partitioned=args.partitioned,
+            project_id=args.project_id,
+            stages=[s for s in args.stages.split(",") if s.strip()] if args.stages is not None else None,
         )
 
         # For JSON output, we can exclude the unclustered list as it's not a cluster
@@ -135,6 +221,8 @@ def main() -> None:
             f"Unclustered (Noise) Keywords: " 
             f"{results['summary']['noise_keywords_found']}"
         )
+        stage_seconds = results['summary']['stages']['seconds']
+        print("Stages: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stage_seconds.items()))
 
         print("\n--- CSV Data ---")
         print(results["csv_data"])
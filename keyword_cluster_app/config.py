@@ -32,19 +32,100 @@ def _get_float_env(key: str, default: float) -> float:
     except ValueError:
         return default
 
+def _get_list_env(key: str, default: str) -> list[str]:
+    value = os.getenv(key, default)
+    return [item.strip().lower() for item in value.split(",") if item.strip()]
+
 # --- Core Model Config ---
 # MODEL TỐT NHẤT CHO TIẾNG VIỆT GIÁO DỤC / BĐS / Y TẾ 2025
 # Đã test trên VN-MTEB + 15 niche thực tế → vượt multilingual-e5-instruct 22% accuracy
 EMBEDDING_MODEL = _get_env("EMBEDDING_MODEL", "bkai-foundation-models/vietnamese-bi-encoder")
 
+# Embedding backend: "torch" (SentenceTransformer, GPU nếu có) hoặc "onnx" (ONNX Runtime CPU, int8)
+EMBEDDING_BACKEND = (_get_env("EMBEDDING_BACKEND", "torch") or "torch").strip().lower()
+ONNX_MODEL_DIR = _get_env("ONNX_MODEL_DIR", os.path.join("/tmp", "onnx_models"))
+ONNX_QUANTIZE_INT8 = _get_bool_env("ONNX_QUANTIZE_INT8", True)
+
+# Length-bucketed encoding: padded tokens per batch (0 = derive from available RAM) and row cap
+EMBEDDING_TOKEN_BUDGET = _get_int_env("EMBEDDING_TOKEN_BUDGET", 0)
+EMBEDDING_MAX_BATCH_SIZE = _get_int_env("EMBEDDING_BATCH_SIZE", 512)
+
+# Multi-process CPU embedding pool (arq worker only; 0 workers = disabled)
+EMBEDDING_POOL_WORKERS = _get_int_env("EMBEDDING_POOL_WORKERS", 0)
+EMBEDDING_POOL_THREADS_PER_WORKER = _get_int_env("EMBEDDING_POOL_THREADS_PER_WORKER", 0) # 0 = cpu_count // workers
+EMBEDDING_POOL_MIN_TEXTS = _get_int_env("EMBEDDING_POOL_MIN_TEXTS", 20000) # below this, encode in-process
+EMBEDDING_POOL_SHARD_SIZE = _get_int_env("EMBEDDING_POOL_SHARD_SIZE", 4096)
+
 # Tắt BERTopic hoàn toàn (đã chứng minh fail nặng trên tiếng Việt niche)
 USE_BERTOPIC = False
 
+# --- Embedding Store (persistent cache across processes/restarts) ---
+ENABLE_EMBEDDING_STORE = _get_bool_env("ENABLE_EMBEDDING_STORE", True)
+EMBEDDING_STORE_PATH = _get_env("EMBEDDING_STORE_PATH", os.path.join("/tmp", "keyword_embeddings.sqlite3"))
+
+# Byte budget for the in-process LRU embedding cache (~85k vectors of 768 dims at 256 MB)
+EMBEDDING_CACHE_MAX_BYTES = _get_int_env("EMBEDDING_CACHE_MAX_BYTES", 256 * 1024 * 1024)
 
 
+# --- Cross-Encoder Refinement ---
+CROSS_ENCODER_MODEL = _get_env("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+CROSS_ENCODER_BATCH_SIZE = _get_int_env("CROSS_ENCODER_BATCH_SIZE", 128)
+CROSS_ENCODER_SCORE_CACHE_SIZE = _get_int_env("CROSS_ENCODER_SCORE_CACHE_SIZE", 200000) # (cluster name, keyword) scores kept in memory
+
+# Refinement policy: "gated" = only uncertain keywords, "strict" = every (cluster name, keyword) pair
+REFINE_MODE = (_get_env("REFINE_MODE", "gated") or "gated").strip().lower()
+REFINE_MIN_MATCHING_POINT = _get_float_env("REFINE_MIN_MATCHING_POINT", 80.0) # bi-encoder matching_point below this is uncertain
+REFINE_MIN_MARGIN = _get_float_env("REFINE_MIN_MARGIN", 0.05) # centroid similarity gap to the runner-up cluster below this is uncertain
+REFINE_MAX_PAIRS = _get_int_env("REFINE_MAX_PAIRS", 0) # 0 = no pair budget
+REFINE_TIME_BUDGET_SECONDS = _get_float_env("REFINE_TIME_BUDGET_SECONDS", 0.0) # 0 = no time budget
+
+# --- Pipeline Stage Plan ---
+# Optional stages a request can select ("stages"); stages left out do not run:
+# "intent" (intent classification, returned per keyword and as each cluster's dominant intent),
+# "refine" (cross-encoder refinement), "hybrid_lexical" (TF-IDF block of the hybrid representation),
+# "collapse" (near-duplicate keywords clustered as one row, see NEAR_DUPLICATE_*).
+OPTIONAL_STAGES = ("intent", "refine", "hybrid_lexical", "collapse")
+DEFAULT_STAGES = _get_list_env("DEFAULT_STAGES", "intent,refine,hybrid_lexical") # async tasks, CLI
+SYNC_DEFAULT_STAGES = _get_list_env("SYNC_DEFAULT_STAGES", "hybrid_lexical") # latency-sensitive /cluster_keywords_sync
+
 # --- Clustering Parameters ---
 ENABLE_HYBRID_EMBEDDINGS = True # Use hybrid semantic + lexical embeddings for clustering
 
+# Hybrid similarity = w * semantic cosine + (1 - w) * lexical cosine, with w = HYBRID_SEMANTIC_WEIGHT.
+# Lexical block: "tfidf" (word 1-2-gram TF-IDF, sparse), "hashed" (fixed HYBRID_HASH_FEATURES width, sparse)
+# or "svd" (TF-IDF compressed to HYBRID_SVD_COMPONENTS dense columns).
+HYBRID_SEMANTIC_WEIGHT = _get_float_env("HYBRID_SEMANTIC_WEIGHT", 0.7)
+HYBRID_LEXICAL_MODE = _get_env("HYBRID_LEXICAL_MODE", "tfidf")
+HYBRID_HASH_FEATURES = _get_int_env("HYBRID_HASH_FEATURES", 4096)
+HYBRID_SVD_COMPONENTS = _get_int_env("HYBRID_SVD_COMPONENTS", 256)
+
+# Run UMAP/HDBSCAN on unique cleaned keywords only (duplicates share the label of their representative)
+CLUSTER_UNIQUE_KEYWORDS_ONLY = _get_bool_env("CLUSTER_UNIQUE_KEYWORDS_ONLY", False)
+
+# Near-duplicate collapsing ("collapse" stage): unique keywords with the same accent-folded word set
+# (stopwords dropped), or with MinHash-estimated character-shingle Jaccard >= NEAR_DUPLICATE_THRESHOLD,
+# are clustered as one row and share its label. Keywords with different numbers are never collapsed.
+NEAR_DUPLICATE_THRESHOLD = _get_float_env("NEAR_DUPLICATE_THRESHOLD", 0.8)
+NEAR_DUPLICATE_NUM_PERM = _get_int_env("NEAR_DUPLICATE_NUM_PERM", 64) # MinHash signature length
+NEAR_DUPLICATE_BANDS = _get_int_env("NEAR_DUPLICATE_BANDS", 16) # LSH bands (NUM_PERM / BANDS rows each)
+
+# Shared kNN graph (built once per job, reused by UMAP, noise reassignment and similar-keyword lookup).
+# KNN_GRAPH_NEIGHBORS should be >= the largest UMAP n_neighbors of any level (30 for 'thấp').
+ENABLE_KNN_GRAPH = _get_bool_env("ENABLE_KNN_GRAPH", True)
+KNN_GRAPH_NEIGHBORS = _get_int_env("KNN_GRAPH_NEIGHBORS", 30)
+
+# Multi-level requests: max UMAP reductions (distinct level settings) running at once
+MULTI_LEVEL_MAX_WORKERS = _get_int_env("MULTI_LEVEL_MAX_WORKERS", 3)
+
+# Partitioned clustering for large jobs: coarse split ("kmeans" on embeddings or "intent" buckets),
+# UMAP/HDBSCAN per partition in a process pool (0 workers = all cores), then clusters whose
+# centroids reach PARTITION_MERGE_THRESHOLD cosine similarity are merged across partitions.
+PARTITIONED_CLUSTERING = _get_bool_env("PARTITIONED_CLUSTERING", False)
+PARTITION_METHOD = _get_env("PARTITION_METHOD", "kmeans")
+PARTITION_TARGET_SIZE = _get_int_env("PARTITION_TARGET_SIZE", 20000)
+PARTITION_MAX_WORKERS = _get_int_env("PARTITION_MAX_WORKERS", 0)
+PARTITION_MERGE_THRESHOLD = _get_float_env("PARTITION_MERGE_THRESHOLD", 0.9)
+
 N_NEIGHBORS = _get_int_env("UMAP_N_NEIGHBORS", 15)
 N_COMPONENTS = _get_int_env("UMAP_N_COMPONENTS", 5) # Default n_components for 'trung bình'
 
@@ -99,8 +180,47 @@ def get_level_config(level: str) -> Dict[str, Any]:
 
 LOG_FILE_PATH = os.path.join("/tmp", "app_v3_debug.log")
 
+# Job artifacts shared by the API and workers (mount the same volume in both)
+ARTIFACTS_DIR = _get_env("ARTIFACTS_DIR", os.path.join("/tmp", "keyword_artifacts"))
+KNN_GRAPH_DIR = os.path.join(ARTIFACTS_DIR, "knn")
+KNN_GRAPH_MAX_FILES = _get_int_env("KNN_GRAPH_MAX_FILES", 200) # oldest graphs are removed beyond this
+
+# Out-of-core mode (million-keyword files): spool directory for memory-mapped embeddings,
+# working-memory budget on top of the loaded models, max clustered sample, rows per chunk (0 = from budget)
+OUT_OF_CORE_DIR = os.path.join(ARTIFACTS_DIR, "out_of_core")
+OUT_OF_CORE_MEMORY_BUDGET_MB = _get_int_env("OUT_OF_CORE_MEMORY_BUDGET_MB", 2048)
+OUT_OF_CORE_SAMPLE_SIZE = _get_int_env("OUT_OF_CORE_SAMPLE_SIZE", 50000)
+OUT_OF_CORE_CHUNK_ROWS = _get_int_env("OUT_OF_CORE_CHUNK_ROWS", 0)
+
+# Stage artifacts of async tasks (embeddings, intents, UMAP coordinates, HDBSCAN trees), so a finished
+# task can be re-run with new parameters from the latest reusable stage. Redis pointers expire after
+# the TTL; directories older than the TTL, and the oldest beyond the max count, are removed.
+ENABLE_TASK_ARTIFACTS = _get_bool_env("ENABLE_TASK_ARTIFACTS", True)
+TASK_ARTIFACTS_DIR = os.path.join(ARTIFACTS_DIR, "tasks")
+TASK_ARTIFACTS_TTL_SECONDS = _get_int_env("TASK_ARTIFACTS_TTL_SECONDS", 86400)
+TASK_ARTIFACTS_MAX_TASKS = _get_int_env("TASK_ARTIFACTS_MAX_TASKS", 50)
+
+# Clustering projects (incremental updates): persisted models per project id. New keywords are
+# placed into the existing clusters; a full re-cluster is due once the share of new keywords that
+# fit no cluster reaches the drift threshold (after a minimum number of new keywords), or the new
+# keywords exceed a fraction of the clustered ones. Loaded projects kept in memory per process.
+PROJECTS_DIR = os.path.join(ARTIFACTS_DIR, "projects")
+PROJECT_DRIFT_THRESHOLD = _get_float_env("PROJECT_DRIFT_THRESHOLD", 0.3)
+PROJECT_DRIFT_MIN_KEYWORDS = _get_int_env("PROJECT_DRIFT_MIN_KEYWORDS", 500)
+PROJECT_MAX_GROWTH = _get_float_env("PROJECT_MAX_GROWTH", 0.5)
+PROJECT_CACHE_SIZE = _get_int_env("PROJECT_CACHE_SIZE", 2)
+
+# Real-time /assign: concurrent requests share one encoder call (up to ASSIGN_MAX_BATCH keywords,
+# waiting at most ASSIGN_BATCH_WAIT_MS for more); centroid indexes re-check their project this often
+ASSIGN_MAX_BATCH = _get_int_env("ASSIGN_MAX_BATCH", 64)
+ASSIGN_BATCH_WAIT_MS = _get_float_env("ASSIGN_BATCH_WAIT_MS", 1.0)
+ASSIGN_INDEX_REFRESH_SECONDS = _get_float_env("ASSIGN_INDEX_REFRESH_SECONDS", 5.0)
+ASSIGN_RATE_LIMIT = _get_env("ASSIGN_RATE_LIMIT", "30000/minute")
+
 # Redis / task queue
 REDIS_URL = _get_env("REDIS_URL", "redis://127.0.0.1:6379/0")
+# Async task progress: stage events are written to Redis at most this often (plus once per stage)
+PROGRESS_UPDATE_INTERVAL_SECONDS = _get_float_env("PROGRESS_UPDATE_INTERVAL_SECONDS", 1.0)
 
 # Request limits (overridable to scale infrastructure)
 SYNC_MAX_KEYWORDS = _get_int_env("SYNC_MAX_KEYWORDS", 5000)
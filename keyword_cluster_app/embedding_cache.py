@@ -0,0 +1,108 @@
+"""
+Bounded in-process embedding cache.
+
+Vectors live in one contiguous float32 slab (rows = slots) instead of one small
+ndarray per keyword, and the slab size is derived from a byte budget so a
+long-running API or arq worker cannot grow without limit.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Rough per-entry bookkeeping cost (key string + dict/OrderedDict slots),
+# counted against the budget together with the vector itself.
+_KEY_OVERHEAD_BYTES = 200
+
+
+class EmbeddingLRUCache:
+    """
+    LRU cache mapping text -> embedding with a fixed memory budget.
+
+    The slab is allocated on the first insert, once the embedding dimension is
+    known. When full, the least recently used entry is evicted and its slot is
+    reused. `get` returns a copy, so callers never see a slot being overwritten.
+    """
+
+    def __init__(self, max_bytes: int, dtype: Any = np.float32):
+        self.max_bytes = max(0, int(max_bytes))
+        self.dtype = np.dtype(dtype)
+        self._slab: Optional[np.ndarray] = None
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._free_slots: List[int] = []
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._slab is None else self._slab.shape[0]
+
+    def _allocate(self, dim: int) -> None:
+        entry_bytes = dim * self.dtype.itemsize + _KEY_OVERHEAD_BYTES
+        capacity = self.max_bytes // entry_bytes
+        self._slab = np.empty((capacity, dim), dtype=self.dtype)
+        self._free_slots = list(range(capacity - 1, -1, -1))
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(key)
+            self.hits += 1
+            return self._slab[slot].copy()
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        vector = np.asarray(vector)
+        with self._lock:
+            if self._slab is None:
+                self._allocate(vector.shape[-1])
+            if self.capacity == 0 or vector.shape[-1] != self._slab.shape[1]:
+                return
+
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._slots.move_to_end(key)
+            elif self._free_slots:
+                slot = self._free_slots.pop()
+                self._slots[key] = slot
+            else:
+                _, slot = self._slots.popitem(last=False)
+                self.evictions += 1
+                self._slots[key] = slot
+            self._slab[slot] = vector
+
+    def put_many(self, keys: List[str], vectors: np.ndarray) -> None:
+        for key, vector in zip(keys, vectors):
+            self.put(key, vector)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slots.clear()
+            self._free_slots = list(range(self.capacity - 1, -1, -1))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        dim = 0 if self._slab is None else self._slab.shape[1]
+        return {
+            "entries": len(self._slots),
+            "capacity": self.capacity,
+            "max_bytes": self.max_bytes,
+            "slab_bytes": 0 if self._slab is None else int(self._slab.nbytes),
+            "used_bytes": len(self._slots) * (dim * self.dtype.itemsize + _KEY_OVERHEAD_BYTES),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,162 @@
+"""
+Multi-process CPU embedding pool for large async jobs.
+
+A persistent pool of worker processes, each holding one model copy with a
+pinned number of CPU threads. Large inputs are sharded across the workers and
+every shard writes its vectors straight into a preallocated shared-memory
+array owned by the caller. The pool is started once by the arq worker
+(`start_embedding_pool`) and reused by every job; below
+EMBEDDING_POOL_MIN_TEXTS, get_embeddings keeps encoding in-process.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from keyword_cluster_app.config import (
+    EMBEDDING_POOL_WORKERS,
+    EMBEDDING_POOL_THREADS_PER_WORKER,
+    EMBEDDING_POOL_MIN_TEXTS,
+    EMBEDDING_POOL_SHARD_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# --- Worker process side ---
+
+def _init_worker(num_threads: int) -> None:
+    """Pins BLAS/torch thread counts, then loads one model copy on CPU."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(num_threads)
+
+    from keyword_cluster_app import model as model_module
+    model_module.load_model(num_threads=num_threads, device="cpu")
+
+
+def _worker_dimension() -> int:
+    from keyword_cluster_app.model import get_model
+    worker_model = get_model()
+    if worker_model is None:
+        raise RuntimeError("Embedding model failed to load in pool worker")
+    return int(np.asarray(worker_model.encode(["dimension"], normalize_embeddings=True)).shape[-1])
+
+
+def _encode_shard(shm_name: str, shape: Tuple[int, int], start: int, texts: List[str], normalize_embeddings: bool) -> int:
+    """Encodes one shard and writes it to rows [start, start + len(texts)) of the shared array."""
+    from keyword_cluster_app.encoding_scheduler import encode_bucketed
+    from keyword_cluster_app.model import get_model
+
+    vectors = encode_bucketed(get_model(), texts, normalize_embeddings=normalize_embeddings)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        output = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        output[start:start + len(texts)] = vectors
+        del output
+    finally:
+        shm.close()
+    return len(texts)
+
+
+# --- Parent process side ---
+
+class EmbeddingPool:
+    """Long-lived pool of model-holding worker processes."""
+
+    def __init__(self, num_workers: int, threads_per_worker: int):
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        # spawn: forking a process that already initialized torch/OpenMP is unsafe
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads_per_worker,),
+        )
+        # Start every worker (and its model copy) now rather than on the first job
+        dimensions = [f.result() for f in [self._executor.submit(_worker_dimension) for _ in range(num_workers)]]
+        self.dimension = dimensions[0]
+        logger.info(
+            f"Embedding pool started: {num_workers} workers x {threads_per_worker} threads, dim={self.dimension}."
+        )
+
+    def encode(
+        self,
+        texts: List[str],
+        normalize_embeddings: bool = True,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ) -> np.ndarray:
+        """
+        Shards texts across the workers and returns the embeddings in input order.
+        `progress_callback(done, total)` is called as shards complete.
+        """
+        n = len(texts)
+        shape = (n, self.dimension)
+        shard_size = min(EMBEDDING_POOL_SHARD_SIZE, max(1, math.ceil(n / (self.num_workers * 4))))
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, n * self.dimension * 4))
+        try:
+            futures = [
+                self._executor.submit(_encode_shard, shm.name, shape, start, texts[start:start + shard_size], normalize_embeddings)
+                for start in range(0, n, shard_size)
+            ]
+            done = 0
+            for future in as_completed(futures):
+                done += future.result()
+                if progress_callback is not None:
+                    progress_callback(done, n)
+
+            shared = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            result = shared.copy()
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+        return result
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool: Optional[EmbeddingPool] = None
+_pool_lock = threading.Lock()
+
+
+def start_embedding_pool() -> Optional[EmbeddingPool]:
+    """
+    Starts the process-wide pool if EMBEDDING_POOL_WORKERS > 0 (idempotent).
+    Intended for the arq worker's on_startup; API processes do not start it.
+    """
+    global _pool
+    if EMBEDDING_POOL_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            threads = EMBEDDING_POOL_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // EMBEDDING_POOL_WORKERS)
+            try:
+                _pool = EmbeddingPool(EMBEDDING_POOL_WORKERS, threads)
+            except Exception as e:
+                logger.error(f"Failed to start embedding pool, encoding stays in-process: {e}")
+                _pool = None
+    return _pool
+
+
+def get_embedding_pool(n_texts: int) -> Optional[EmbeddingPool]:
+    """Returns the running pool if it exists and the input is large enough to shard."""
+    if _pool is None or n_texts < EMBEDDING_POOL_MIN_TEXTS:
+        return None
+    return _pool
+
+
+def shutdown_embedding_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
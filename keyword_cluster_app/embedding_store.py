@@ -0,0 +1,147 @@
+"""
+Persistent on-disk embedding store.
+
+Embeddings are keyed by (model name, normalized keyword text) and stored as
+compact float16 blobs in a SQLite database, so re-clustering the same client
+keyword lists across processes and restarts skips the encoder entirely.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from keyword_cluster_app.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    ONNX_QUANTIZE_INT8,
+    ENABLE_EMBEDDING_STORE,
+    EMBEDDING_STORE_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_CHUNK_SIZE = 500
+
+
+class EmbeddingStore:
+    """
+    SQLite-backed embedding store with float16 vectors.
+
+    A single connection is shared between threads and guarded by a lock; WAL
+    mode lets the API and the arq worker read and write the same file.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Looks up embeddings for the given texts.
+        Returns a dict text -> float32 vector containing only the stored texts.
+        """
+        found: Dict[str, np.ndarray] = {}
+        unique_texts = list(dict.fromkeys(texts))
+
+        with self._lock:
+            for start in range(0, len(unique_texts), _LOOKUP_CHUNK_SIZE):
+                chunk = unique_texts[start:start + _LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text, vector FROM embeddings WHERE model = ? AND text IN ({placeholders})",
+                    [self.model_name, *chunk],
+                ).fetchall()
+                for text, blob in rows:
+                    found[text] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+
+        return found
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """Stores embeddings (one row per text) as float16 blobs."""
+        if len(texts) == 0:
+            return
+
+        vectors16 = np.ascontiguousarray(vectors, dtype=np.float16)
+        dim = vectors16.shape[1]
+        rows = [
+            (self.model_name, text, dim, vectors16[i].tobytes())
+            for i, text in enumerate(texts)
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text, dim, vector) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)
+            ).fetchone()
+        return int(row[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def store_model_key() -> str:
+    """
+    Key under which vectors of the active model/backend are stored. Quantized
+    backends drift slightly from PyTorch, so they get their own namespace.
+    """
+    if EMBEDDING_BACKEND == "onnx":
+        return f"{EMBEDDING_MODEL}#onnx-{'int8' if ONNX_QUANTIZE_INT8 else 'fp32'}"
+    return EMBEDDING_MODEL
+
+
+_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+_store_failed = False
+
+
+def get_embedding_store() -> Optional[EmbeddingStore]:
+    """
+    Returns the process-wide store for EMBEDDING_MODEL, or None if disabled
+    or the database cannot be opened (clustering then runs without it).
+    """
+    global _store, _store_failed
+    if not ENABLE_EMBEDDING_STORE or _store_failed:
+        return None
+    if _store is not None:
+        return _store
+
+    with _store_lock:
+        if _store is None and not _store_failed:
+            try:
+                _store = EmbeddingStore(EMBEDDING_STORE_PATH, store_model_key())
+                logger.info(f"Embedding store opened at {EMBEDDING_STORE_PATH}")
+            except Exception as e:
+                logger.error(f"Failed to open embedding store at {EMBEDDING_STORE_PATH}: {e}")
+                _store_failed = True
+    return _store
@@ -0,0 +1,152 @@
+"""
+Length-bucketed batching for the embedding encoder.
+
+Texts are sorted by token length and grouped into length-homogeneous batches
+whose padded size (rows x longest row) stays under a token budget, so short
+keywords are no longer padded to the longest keyword of a fixed-size batch.
+Results are written back in the original order.
+"""
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from keyword_cluster_app.config import EMBEDDING_TOKEN_BUDGET, EMBEDDING_MAX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Approximate transient activation memory per padded token during a forward
+# pass of a 12-layer, 768-dim encoder (hidden states, attention, FFN buffers).
+_BYTES_PER_TOKEN = 96 * 1024
+# Share of currently available RAM a single encoder batch may use
+_RAM_FRACTION = 0.25
+_MIN_TOKEN_BUDGET = 2048
+_MAX_TOKEN_BUDGET = 65536
+
+
+def _available_memory_bytes() -> Optional[int]:
+    """MemAvailable from /proc/meminfo, falling back to sysconf."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def resolve_token_budget(token_budget: Optional[int] = None) -> int:
+    """
+    Token budget per batch: explicit value, EMBEDDING_TOKEN_BUDGET, or (when
+    both are 0/None) derived from the RAM available right now.
+    """
+    budget = token_budget or EMBEDDING_TOKEN_BUDGET
+    if budget and budget > 0:
+        return int(budget)
+
+    available = _available_memory_bytes()
+    if available is None:
+        return 16384
+    budget = int(available * _RAM_FRACTION / _BYTES_PER_TOKEN)
+    return max(_MIN_TOKEN_BUDGET, min(_MAX_TOKEN_BUDGET, budget))
+
+
+def token_lengths(model: Any, texts: List[str]) -> np.ndarray:
+    """
+    Token count per text (including special tokens, truncated to the model's
+    max length). Falls back to syllable count when the backend has no tokenizer.
+    """
+    tokenizer = getattr(model, "tokenizer", None)
+    max_length = getattr(model, "max_seq_length", None) or 512
+    if tokenizer is not None:
+        try:
+            encoded = tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_length)
+            return np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(texts))
+        except Exception as e:
+            logger.debug(f"Tokenizer length pass failed, using syllable counts: {e}")
+    return np.fromiter((min(len(t.split()) + 2, max_length) for t in texts), dtype=np.int64, count=len(texts))
+
+
+def plan_batches(lengths: np.ndarray, token_budget: int, max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE) -> List[np.ndarray]:
+    """
+    Groups indices into batches of similar length. Indices are visited in
+    ascending length order and a batch is closed once adding the next text
+    would make rows x longest length exceed the token budget.
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches: List[np.ndarray] = []
+    start = 0
+    n = len(order)
+    while start < n:
+        end = start + 1
+        while end < n and end - start < max_batch_size:
+            # lengths are ascending, so the next text is the longest of the batch
+            if (end - start + 1) * lengths[order[end]] > token_budget:
+                break
+            end += 1
+        batches.append(order[start:end])
+        start = end
+    return batches
+
+
+def padding_ratio(lengths: np.ndarray, batches: List[np.ndarray]) -> float:
+    """Fraction of padded positions that are padding (0 = no padding)."""
+    padded = sum(len(b) * int(lengths[b].max()) for b in batches if len(b))
+    if padded == 0:
+        return 0.0
+    return 1.0 - float(lengths.sum()) / padded
+
+
+def encode_bucketed(
+    model: Any,
+    texts: List[str],
+    normalize_embeddings: bool = True,
+    token_budget: Optional[int] = None,
+    max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> np.ndarray:
+    """
+    Encodes texts with length-bucketed, token-budgeted batches and returns the
+    embeddings in input order. `progress_callback(done, total)` is called after
+    each batch; `stats` is filled with batch count and padding counters.
+    """
+    n = len(texts)
+    if n == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    budget = resolve_token_budget(token_budget)
+    lengths = token_lengths(model, texts)
+    batches = plan_batches(lengths, budget, max_batch_size)
+
+    output: Optional[np.ndarray] = None
+    done = 0
+    for batch in batches:
+        vectors = model.encode(
+            [texts[i] for i in batch],
+            batch_size=len(batch),
+            show_progress_bar=False,
+            normalize_embeddings=normalize_embeddings,
+        )
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if output is None:
+            output = np.empty((n, vectors.shape[1]), dtype=np.float32)
+        output[batch] = vectors
+        done += len(batch)
+        if progress_callback is not None:
+            progress_callback(done, n)
+
+    if stats is not None:
+        stats["batches"] = stats.get("batches", 0) + len(batches)
+        stats["real_tokens"] = stats.get("real_tokens", 0) + int(lengths.sum())
+        stats["padded_tokens"] = stats.get("padded_tokens", 0) + sum(len(b) * int(lengths[b].max()) for b in batches)
+        stats["token_budget"] = budget
+        stats["padding_ratio"] = round(1.0 - stats["real_tokens"] / stats["padded_tokens"], 4) if stats["padded_tokens"] else 0.0
+
+    logger.debug(f"Encoded {n} texts in {len(batches)} batches (budget {budget} tokens, padding {padding_ratio(lengths, batches):.1%}).")
+    return output
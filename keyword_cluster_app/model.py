@@ -1,12 +1,32 @@
 
+import json
+import logging
+import os
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Optional, Dict
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Dict, Union
 
-from keyword_cluster_app.config import EMBEDDING_MODEL
+from keyword_cluster_app.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_BACKEND,
+    ONNX_MODEL_DIR,
+    ONNX_QUANTIZE_INT8,
+)
+from keyword_cluster_app.embedding_cache import EmbeddingLRUCache
+from keyword_cluster_app.embedding_store import get_embedding_store
+from keyword_cluster_app.encoding_scheduler import encode_bucketed
+from keyword_cluster_app.embedding_pool import get_embedding_pool
 
-model: Optional[SentenceTransformer] = None
-_embedding_cache: Dict[str, np.ndarray] = {} # In-memory cache for embeddings
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+# Model is loaded lazily (get_model / warm_up), never at import time
+model: Optional[Union["SentenceTransformer", "OnnxEmbeddingBackend"]] = None
+_model_lock = threading.Lock()
+_embedding_cache = EmbeddingLRUCache(EMBEDDING_CACHE_MAX_BYTES) # Bounded in-memory cache for embeddings
 
 def _detect_device() -> str:
     """
@@ -20,79 +40,307 @@ def _detect_device() -> str:
         pass
     return "cpu"
 
-def load_model() -> None:
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = True) -> str:
     """
-    Load SentenceTransformer model vào biến global 'model'.
+    Export transformer của SentenceTransformer sang ONNX (CPU), kèm tokenizer và
+    cấu hình pooling. Nếu quantize=True, lượng tử hóa dynamic int8 cho weights.
+    Trả về đường dẫn file .onnx sẽ được dùng để inference.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    int8_path = os.path.join(output_dir, "model.int8.onnx")
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model
+    tokenizer = st_model.tokenizer
+    pooling_mode = st_model[1].get_pooling_mode_str() if len(st_model) > 1 else "mean"
+
+    class _HiddenStateOnly(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    dummy = tokenizer(["học toán lớp 5"], return_tensors="pt", padding=True)
+    torch.onnx.export(
+        _HiddenStateOnly(transformer).eval(),
+        (dummy["input_ids"], dummy["attention_mask"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "last_hidden_state": {0: "batch", 1: "sequence"},
+        },
+        opset_version=17,
+    )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    with open(os.path.join(output_dir, "embedding_config.json"), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "pooling_mode": pooling_mode,
+            "max_seq_length": st_model.max_seq_length,
+            "dimension": st_model.get_sentence_embedding_dimension(),
+        }, f)
+
+    return int8_path if quantize else fp32_path
+
+
+class OnnxEmbeddingBackend:
+    """
+    Embedding backend chạy trên ONNX Runtime (CPU), mặc định int8 quantized.
+    Giữ cùng contract encode(..., normalize_embeddings=True) như SentenceTransformer.
+    """
+
+    def __init__(self, model_name: str, model_dir: str, quantize: bool = True, num_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        onnx_path = os.path.join(model_dir, "model.int8.onnx" if quantize else "model.onnx")
+        if not os.path.exists(onnx_path):
+            logger.info(f"No ONNX export found at {onnx_path}, exporting {model_name}...")
+            onnx_path = export_onnx_model(model_name, model_dir, quantize=quantize)
+
+        with open(os.path.join(model_dir, "embedding_config.json")) as f:
+            config = json.load(f)
+
+        self.model_name = model_name
+        self.pooling_mode = config.get("pooling_mode", "mean")
+        self.max_seq_length = config.get("max_seq_length") or 256
+        self.dimension = config.get("dimension")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = [i.name for i in self.session.get_inputs()]
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling_mode == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        if self.pooling_mode == "max":
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        # mean pooling (default for sentence-transformers bi-encoders)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False,
+        convert_to_tensor: bool = False,
+        **kwargs: Any,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            batch = list(sentences[start:start + batch_size])
+            encoded = self.tokenizer(
+                batch, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+            outputs.append(self._pool(hidden, encoded["attention_mask"]))
+
+        if outputs:
+            embeddings = np.vstack(outputs).astype(np.float32)
+        else:
+            embeddings = np.zeros((0, self.dimension or 0), dtype=np.float32)
+
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+
+        return embeddings[0] if single else embeddings
+
+
+def onnx_model_dir(model_name: str = EMBEDDING_MODEL) -> str:
+    """Thư mục chứa bản export ONNX của một model."""
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+
+def load_model(num_threads: int = 0, device: Optional[str] = None) -> None:
+    """
+    Load embedding backend (theo EMBEDDING_BACKEND) vào biến global 'model'.
+    - "torch": SentenceTransformer, GPU nếu có (hoặc theo `device`).
+    - "onnx": ONNX Runtime trên CPU, int8 nếu ONNX_QUANTIZE_INT8.
+    `num_threads` > 0 ghim số CPU threads của backend (dùng cho embedding pool).
     """
     global model
-    device = _detect_device()
     try:
-        print(f"Loading {EMBEDDING_MODEL} on {device}...")
-        model = SentenceTransformer(EMBEDDING_MODEL, device=device)
+        if EMBEDDING_BACKEND == "onnx":
+            print(f"Loading {EMBEDDING_MODEL} with ONNX backend (int8={ONNX_QUANTIZE_INT8}) on cpu...")
+            model = OnnxEmbeddingBackend(EMBEDDING_MODEL, onnx_model_dir(), quantize=ONNX_QUANTIZE_INT8, num_threads=num_threads)
+        else:
+            from sentence_transformers import SentenceTransformer
+            if num_threads > 0:
+                import torch
+                torch.set_num_threads(num_threads)
+            device = device or _detect_device()
+            print(f"Loading {EMBEDDING_MODEL} on {device}...")
+            model = SentenceTransformer(EMBEDDING_MODEL, device=device)
         print("Model loaded.")
     except Exception as e:
-        print(f"Error loading SentenceTransformer model '{EMBEDDING_MODEL}': {e}")
+        print(f"Error loading embedding model '{EMBEDDING_MODEL}' ({EMBEDDING_BACKEND} backend): {e}")
         print("Clustering functionality will not work. Please check your internet connection and model name.")
         model = None
 
-# Tự động load khi import module
-load_model()
+def get_model():
+    """
+    Trả về embedding model, load lần đầu khi cần (lazy, thread-safe).
+    Trả về None nếu không load được.
+    """
+    if model is None:
+        with _model_lock:
+            if model is None:
+                load_model()
+    return model
+
+
+def is_model_loaded() -> bool:
+    return model is not None
+
+
+def warm_up() -> bool:
+    """
+    Load model, mở embedding store và chạy một lần encode nhỏ để khởi tạo
+    threads/graph trước request đầu tiên. Dùng cho API startup và arq on_startup.
+    """
+    current = get_model()
+    if current is None:
+        return False
+    get_embedding_store()
+    current.encode(["khởi động"], batch_size=1, normalize_embeddings=True)
+    return True
 
 def get_embeddings(
     keywords: List[str],
     batch_size: int = 512,
     show_progress_bar: bool = False,
     normalize_embeddings: bool = True,
-    convert_to_numpy: bool = True
+    convert_to_numpy: bool = True,
+    stats: Optional[Dict[str, Any]] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
 ) -> Optional[np.ndarray]:
     """
-    Generates embeddings for a list of keywords using the pre-loaded model,
-    utilizing an in-memory cache to speed up processing.
+    Generates embeddings for a list of keywords using the pre-loaded model.
+    Lookups go through the in-memory cache first, then the persistent
+    embedding store; only the remaining texts are sent to the encoder.
+
+    If `stats` is given, it is filled with memory_hits / store_hits / misses
+    and the encoder batching counters (batches, padding_ratio, ...).
+    `progress_callback(done, total)` follows the encoder over the texts that
+    were not cached.
     """
+    model = get_model()
     if model is None:
         return None
-    
-    prefixed_keywords_map = {}
-    for kw in keywords:
-        # Prefix cho instruct models (e5-instruct cần "query: ")
-        prefixed_keywords_map[kw] = f"query: {kw}" if "instruct" in EMBEDDING_MODEL else kw
-
-    # Separate keywords into those in cache and those needing encoding
-    cached_embeddings = []
-    to_encode_texts = []
-    original_order_map = {} # To reconstruct the original order
-
-    for i, kw in enumerate(keywords):
-        prefixed_kw = prefixed_keywords_map[kw]
-        if prefixed_kw in _embedding_cache:
-            cached_embeddings.append((i, _embedding_cache[prefixed_kw]))
+
+    # Prefix cho instruct models (e5-instruct cần "query: ")
+    prefixed_keywords = [f"query: {kw}" if "instruct" in EMBEDDING_MODEL else kw for kw in keywords]
+
+    # Cached vectors are always L2-normalized, so only use caches for that mode
+    use_cache = normalize_embeddings
+    store = get_embedding_store() if use_cache else None
+
+    final_embeddings: List[Optional[np.ndarray]] = [None] * len(keywords)
+    missing: Dict[str, List[int]] = {} # prefixed text -> positions in input
+    memory_hits = 0
+
+    for i, prefixed_kw in enumerate(prefixed_keywords):
+        cached = _embedding_cache.get(prefixed_kw) if use_cache else None
+        if cached is not None:
+            final_embeddings[i] = cached
+            memory_hits += 1
+        else:
+            missing.setdefault(prefixed_kw, []).append(i)
+
+    store_hits = 0
+    if store is not None and missing:
+        try:
+            stored = store.get_many(list(missing.keys()))
+        except Exception as e:
+            logger.warning(f"Embedding store lookup failed: {e}")
+            stored = {}
+        for prefixed_kw, embedding in stored.items():
+            _embedding_cache.put(prefixed_kw, embedding)
+            for i in missing.pop(prefixed_kw):
+                final_embeddings[i] = embedding
+                store_hits += 1
+
+    misses = sum(len(positions) for positions in missing.values())
+    if missing:
+        texts_to_encode_only = list(missing.keys())
+        pool = get_embedding_pool(len(texts_to_encode_only)) if convert_to_numpy else None
+        if pool is not None:
+            # Large job: shard across the worker process pool
+            new_embeddings = pool.encode(texts_to_encode_only, normalize_embeddings=normalize_embeddings, progress_callback=progress_callback)
+            if stats is not None:
+                stats["pool_workers"] = pool.num_workers
+        elif convert_to_numpy:
+            # Length-bucketed batches under a token budget, original order restored
+            new_embeddings = encode_bucketed(
+                model,
+                texts_to_encode_only,
+                normalize_embeddings=normalize_embeddings,
+                max_batch_size=batch_size,
+                progress_callback=progress_callback,
+                stats=stats,
+            )
         else:
-            to_encode_texts.append((i, prefixed_kw))
-        original_order_map[i] = None # Placeholder for final embeddings
-
-    if to_encode_texts:
-        # Extract only the texts to encode, preserving their original index
-        texts_to_encode_only = [item[1] for item in to_encode_texts]
-        new_embeddings = model.encode(
-            texts_to_encode_only,
-            batch_size=batch_size,
-            show_progress_bar=show_progress_bar,
-            normalize_embeddings=normalize_embeddings,
-            convert_to_tensor=not convert_to_numpy,
-        )
-        if not convert_to_numpy:
-            new_embeddings = new_embeddings.cpu().numpy()
-        
-        # Store new embeddings in cache and map to original order
-        for i, (original_idx, prefixed_kw) in enumerate(to_encode_texts):
-            _embedding_cache[prefixed_kw] = new_embeddings[i]
-            original_order_map[original_idx] = new_embeddings[i]
-
-    # Add cached embeddings to the original order map
-    for original_idx, embedding in cached_embeddings:
-        original_order_map[original_idx] = embedding
-    
-    # Reconstruct embeddings in the original order
-    final_embeddings = [original_order_map[i] for i in range(len(keywords))]
-
-    return np.array(final_embeddings)
\ No newline at end of file
+            new_embeddings = model.encode(
+                texts_to_encode_only,
+                batch_size=batch_size,
+                show_progress_bar=show_progress_bar,
+                normalize_embeddings=normalize_embeddings,
+                convert_to_tensor=True,
+            )
+            if hasattr(new_embeddings, "cpu"):
+                new_embeddings = new_embeddings.cpu().numpy()
+
+        if store is not None:
+            # Round through float16 like stored vectors, so a first (uncached) run
+            # and later cached runs cluster identical inputs identically
+            new_embeddings = np.asarray(new_embeddings, dtype=np.float16).astype(np.float32)
+
+        for j, prefixed_kw in enumerate(texts_to_encode_only):
+            if use_cache:
+                _embedding_cache.put(prefixed_kw, new_embeddings[j])
+            for i in missing[prefixed_kw]:
+                final_embeddings[i] = new_embeddings[j]
+
+        if store is not None:
+            try:
+                store.put_many(texts_to_encode_only, new_embeddings)
+            except Exception as e:
+                logger.warning(f"Embedding store write failed: {e}")
+
+    if stats is not None:
+        stats["memory_hits"] = stats.get("memory_hits", 0) + memory_hits
+        stats["store_hits"] = stats.get("store_hits", 0) + store_hits
+        stats["misses"] = stats.get("misses", 0) + misses
+
+    return np.array(final_embeddings, dtype=np.float32)
+
+
+def get_cache_stats() -> Dict[str, object]:
+    """Hit-rate, size and eviction counters of the in-memory embedding cache."""
+    return _embedding_cache.stats()
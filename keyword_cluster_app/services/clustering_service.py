@@ -1,24 +1,100 @@
+import json
 import logging
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Any, Optional, Tuple
-from collections import defaultdict, Counter
-from sklearn.metrics.pairwise import cosine_similarity
-from umap import UMAP
-from hdbscan import HDBSCAN
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
 
 from keyword_cluster_app.config import (
     EMBEDDING_MODEL,
     ENABLE_HYBRID_EMBEDDINGS,
     get_level_config,
-    RETAIN_SMALL_CLUSTERS_AS_SINGLETONS
+    RETAIN_SMALL_CLUSTERS_AS_SINGLETONS,
+    CLUSTER_UNIQUE_KEYWORDS_ONLY,
+    DEFAULT_STAGES,
+    ENABLE_TASK_ARTIFACTS,
+    ENABLE_KNN_GRAPH,
+    KNN_GRAPH_NEIGHBORS,
+    MULTI_LEVEL_MAX_WORKERS,
+    OPTIONAL_STAGES,
+    OUT_OF_CORE_DIR,
+    PARTITIONED_CLUSTERING,
+    PARTITION_TARGET_SIZE,
+    REFINE_MODE,
+    REFINE_MIN_MATCHING_POINT,
+    REFINE_MIN_MARGIN,
+    REFINE_MAX_PAIRS,
+    REFINE_TIME_BUDGET_SECONDS,
 )
+from keyword_cluster_app.services.cross_encoder_refiner import get_refiner, select_uncertain
 from keyword_cluster_app.services.intent_service import IntentService
-from keyword_cluster_app.model import load_model, model as shared_model
-from keyword_cluster_app.utils.text_processing import clean_keyword
+from keyword_cluster_app.services.hybrid_representation import HybridRepresentation, build_hybrid_representation
+from keyword_cluster_app.services.knn_graph import KnnGraph, get_or_build_knn_graph, load_knn_graph
+from keyword_cluster_app.services.near_duplicates import near_duplicate_groups
+from keyword_cluster_app.services.noise_assignment import reassign_noise, segment_centroids, NOISE_CONFIDENCE_THRESHOLD
+from keyword_cluster_app.services.out_of_core import (
+    SUMMARY_FILE as OUT_OF_CORE_SUMMARY_FILE,
+    KeywordSpool,
+    assign_and_write,
+    choose_sample,
+    peak_rss_mb,
+    plan_memory,
+    spool_keywords,
+)
+from keyword_cluster_app.services.partitioned_clustering import cluster_partitioned
+from keyword_cluster_app.services.progress import ProgressCallback, ProgressReporter
+from keyword_cluster_app.services.project_store import (
+    append_delta,
+    drift_status,
+    load_project,
+    project_keywords,
+    read_meta,
+    save_project,
+    validate_project_id,
+)
+from keyword_cluster_app.services.task_artifacts import (
+    add_stage_artifacts,
+    load_keyword_stage,
+    load_reduced,
+    load_tree,
+    read_manifest,
+    save_task_artifacts,
+)
+from keyword_cluster_app.services.result_builder import (
+    add_cluster_intents,
+    add_keyword_intents,
+    add_singleton_clusters,
+    build_cluster_map,
+    top_clusters_volume_percent,
+)
+from keyword_cluster_app.model import get_embeddings, get_model, warm_up as warm_up_model
+from keyword_cluster_app.utils.text_processing import clean_keywords
 
 logger = logging.getLogger(__name__)
 
+
+def warm_up() -> bool:
+    """
+    Loads the embedding model and the cross-encoder, and imports the heavy
+    clustering libraries (umap/numba, hdbscan, sklearn) so the first request
+    does not pay for them.
+    Called from the API startup event and the arq worker on_startup hook.
+    """
+    if not warm_up_model():
+        return False
+    import umap  # noqa: F401
+    import hdbscan  # noqa: F401
+    from sklearn.feature_extraction.text import TfidfVectorizer  # noqa: F401
+    from sklearn.metrics.pairwise import cosine_similarity  # noqa: F401
+    get_refiner()
+    return True
+
+
 class ClusteringService:
     def __init__(self):
         self.model = self._get_model()
@@ -26,11 +102,9 @@ class ClusteringService:
         logger.info("ClusteringService initialized.")
 
     def _get_model(self):
+        shared_model = get_model()
         if shared_model is None:
-            logger.info(f"Model not loaded, loading {EMBEDDING_MODEL}...")
-            load_model()
-            if shared_model is None:
-                 raise RuntimeError("Failed to load shared model")
+            raise RuntimeError(f"Failed to load shared model {EMBEDDING_MODEL}")
         return shared_model
 
     def process_clustering(
@@ -39,36 +113,706 @@ class ClusteringService:
         level: str = "trung bình",
         min_cluster_size_override: int = None,
         clustering_method: str = "semantic",
+        cluster_unique_only: Optional[bool] = None,
+        refine_mode: Optional[str] = None,
+        refine_max_pairs: Optional[int] = None,
+        refine_time_budget: Optional[float] = None,
+        partitioned: Optional[bool] = None,
+        project_id: Optional[str] = None,
+        task_id: Optional[str] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        stages: Optional[Sequence[str]] = None,
     ) -> Dict[str, Any]:
-        
+        """
+        Clusters keywords at one level. With `project_id`, the fitted models are
+        persisted as a clustering project (replacing an existing one) so that
+        new keywords can later be added with `add_keywords_to_project`; project
+        runs are never partitioned. With `task_id`, the stage artifacts are kept
+        for `process_clustering_from_artifacts`. `progress_callback(event)`
+        receives stage progress events (see services/progress.py). `stages` is
+        the plan of optional stages to run (see OPTIONAL_STAGES), None = DEFAULT_STAGES.
+        """
         if not raw_keywords_with_volume:
             return {"clusters": {}, "unclustered": [], "summary": {}, "csv_data": ""}
+        if project_id is not None:
+            validate_project_id(project_id)
+            partitioned = False
+
+        plan = self._stage_plan(stages)
+        refine_options = self._refine_options(refine_mode, refine_max_pairs, refine_time_budget, plan)
+        progress = ProgressReporter(progress_callback, [level])
+        prepared = self._prepare_keywords(raw_keywords_with_volume, cluster_unique_only, progress, "intent" in plan, "collapse" in plan)
+        artifacts: Optional[Dict[str, Any]] = {} if project_id is not None or task_id is not None else None
+        level_labels, knn_graph, cluster_stats = self._cluster_levels(
+            prepared, [level], min_cluster_size_override, partitioned, artifacts, progress, "hybrid_lexical" in plan
+        )
+        results = self._finish_level(prepared, level_labels[level], knn_graph, cluster_stats, refine_options, artifacts, progress, level)
+        results["summary"]["stages"] = self._stage_summary(plan, progress)
+        if task_id is not None:
+            results["summary"]["artifacts"] = self._save_task_artifacts(
+                task_id, prepared, artifacts, knn_graph, {"level": level, "min_cluster_size_override": min_cluster_size_override, "stages": plan}
+            )
+        if project_id is not None:
+            settings = {
+                "min_cluster_size_override": min_cluster_size_override,
+                "cluster_unique_only": prepared["row_map"] is not None,
+                "refine_mode": refine_options["mode"],
+                "refine_max_pairs": refine_max_pairs,
+                "refine_time_budget": refine_time_budget,
+                "stages": plan,
+            }
+            results["summary"]["project"] = save_project(project_id, prepared, artifacts, level, results, settings)
+        return results
+
+    def add_keywords_to_project(self, project_id: str, raw_keywords_with_volume: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Adds keywords to a clustering project without re-clustering: only
+        keywords new to the project are embedded, then placed into the existing
+        clusters (HDBSCAN approximate_predict, centroid fallback for its noise).
+        Keywords that fit no cluster become singletons and count towards the
+        project's drift; `summary.drift.recluster_required` tells the caller
+        when a full re-cluster (`recluster_project`) is due.
+        """
+        project = load_project(project_id)
+        df = pd.DataFrame(raw_keywords_with_volume, columns=["text", "volume"])
+        df['text'] = df['text'].astype(str)
+        df['volume'] = pd.to_numeric(df['volume'], errors='coerce').fillna(0).astype(int)
+        df['cleaned'] = clean_keywords(df['text'])
+
+        known = df['cleaned'].isin(project.assignments.keys()).to_numpy()
+        new_df = df[~known]
+        codes, unique_texts = pd.factorize(new_df['cleaned'])
+        unique_texts = list(unique_texts)
+
+        cache_stats: Dict[str, Any] = {}
+        placement = None
+        if unique_texts:
+            embeddings = get_embeddings(unique_texts, batch_size=512, show_progress_bar=False, normalize_embeddings=True, stats=cache_stats)
+            if embeddings is None:
+                raise RuntimeError("Embedding model is not loaded")
+            placement = project.assign(embeddings, unique_texts)
+
+        keywords: List[Dict[str, Any]] = []
+        delta_rows: List[Dict[str, Any]] = []
+        noise_texts = set()
+        code_of_row = dict(zip(new_df.index.tolist(), codes.tolist()))
+        for i, (text, volume, cleaned) in enumerate(zip(df['text'].tolist(), df['volume'].tolist(), df['cleaned'].tolist())):
+            if known[i]:
+                keywords.append({"text": text, "volume": volume, "cluster_name": project.assignments[cleaned], "matching_point": None, "probability": None, "status": "known"})
+                continue
+            c = code_of_row[df.index[i]]
+            key = placement["cluster_keys"][c]
+            status = placement["status"][c]
+            if key is None:
+                key = text
+                noise_texts.add(cleaned)
+            keyword = {
+                "text": text,
+                "volume": volume,
+                "cluster_name": key,
+                "matching_point": float(placement["matching_point"][c]),
+                "probability": round(float(placement["probabilities"][c]), 4),
+                "status": status,
+            }
+            keywords.append(keyword)
+            delta_rows.append({"text": text, "volume": volume, "cluster_name": key, "status": status})
+
+        drift = append_delta(project_id, project.meta["version"], delta_rows, noise=sum(1 for r in delta_rows if r["status"] == "noise"))
+        statuses = [kw["status"] for kw in keywords]
+        summary = {
+            "project_id": project_id,
+            "keywords": len(keywords),
+            "known_keywords": statuses.count("known"),
+            "new_keywords": len(delta_rows),
+            "embedded_keywords": len(unique_texts),
+            "clustered": statuses.count("clustered"),
+            "reassigned": statuses.count("reassigned"),
+            "noise": statuses.count("noise"),
+            "embedding_cache": {
+                "hits": cache_stats.get("memory_hits", 0) + cache_stats.get("store_hits", 0),
+                "misses": cache_stats.get("misses", 0),
+            },
+            "drift": drift,
+        }
+        logger.info(f"Project '{project_id}': added {summary['new_keywords']} keywords ({summary['noise']} fit no cluster), drift {drift}.")
+        return {"keywords": keywords, "summary": summary}
+
+    def recluster_project(self, project_id: str, progress_callback: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """Full re-cluster of a project's keywords (including added ones) with its original settings."""
+        meta = read_meta(project_id)
+        settings = meta.get("settings", {})
+        return self.process_clustering(
+            project_keywords(project_id),
+            level=meta["level"],
+            min_cluster_size_override=settings.get("min_cluster_size_override"),
+            cluster_unique_only=settings.get("cluster_unique_only"),
+            refine_mode=settings.get("refine_mode"),
+            refine_max_pairs=settings.get("refine_max_pairs"),
+            refine_time_budget=settings.get("refine_time_budget"),
+            project_id=project_id,
+            progress_callback=progress_callback,
+            stages=settings.get("stages"),
+        )
+
+    @staticmethod
+    def project_info(project_id: str) -> Dict[str, Any]:
+        meta = read_meta(project_id)
+        return {**meta, "drift": drift_status(meta)}
+
+    def process_clustering_levels(
+        self,
+        raw_keywords_with_volume: List[Dict[str, Any]],
+        levels: List[str],
+        min_cluster_size_override: int = None,
+        clustering_method: str = "semantic",
+        cluster_unique_only: Optional[bool] = None,
+        refine_mode: Optional[str] = None,
+        refine_max_pairs: Optional[int] = None,
+        refine_time_budget: Optional[float] = None,
+        partitioned: Optional[bool] = None,
+        task_id: Optional[str] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        stages: Optional[Sequence[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Clusters the same keywords at several levels in one pass. Embeddings,
+        intents, TF-IDF and the kNN graph are computed once; levels with
+        different UMAP settings are reduced concurrently, and levels sharing a
+        UMAP embedding and min_samples share one HDBSCAN hierarchy.
+        Returns {"levels": {level: result}} with one regular result block per level.
+        With `task_id`, the stage artifacts are kept for `process_clustering_from_artifacts`.
+        `progress_callback(event)` receives stage progress events (see services/progress.py).
+        `stages` is the plan of optional stages to run, as in `process_clustering`.
+        """
+        levels = list(dict.fromkeys(levels))
+        if not raw_keywords_with_volume or not levels:
+            return {"levels": {lvl: {"clusters": {}, "unclustered": [], "summary": {}, "csv_data": ""} for lvl in levels}}
+
+        plan = self._stage_plan(stages)
+        refine_options = self._refine_options(refine_mode, refine_max_pairs, refine_time_budget, plan)
+        progress = ProgressReporter(progress_callback, levels)
+        prepared = self._prepare_keywords(raw_keywords_with_volume, cluster_unique_only, progress, "intent" in plan, "collapse" in plan)
+        artifacts: Optional[Dict[str, Any]] = {} if task_id is not None else None
+        level_labels, knn_graph, cluster_stats = self._cluster_levels(
+            prepared, levels, min_cluster_size_override, partitioned, artifacts, progress, "hybrid_lexical" in plan
+        )
+        results = {
+            "levels": {
+                lvl: self._finish_level(prepared, level_labels[lvl], knn_graph, cluster_stats, refine_options, progress=progress, level=lvl)
+                for lvl in levels
+            }
+        }
+        stage_summary = self._stage_summary(plan, progress)
+        for result in results["levels"].values():
+            result["summary"]["stages"] = stage_summary
+        if task_id is not None:
+            saved = self._save_task_artifacts(
+                task_id, prepared, artifacts, knn_graph, {"levels": levels, "min_cluster_size_override": min_cluster_size_override, "stages": plan}
+            )
+            for result in results["levels"].values():
+                result["summary"]["artifacts"] = saved
+        return results
+
+    def process_clustering_from_artifacts(
+        self,
+        artifacts_dir: str,
+        level: str = "trung bình",
+        levels: Optional[List[str]] = None,
+        min_cluster_size_override: int = None,
+        refine_mode: Optional[str] = None,
+        refine_max_pairs: Optional[int] = None,
+        refine_time_budget: Optional[float] = None,
+        from_stage: str = "auto",
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        Re-runs a finished task with new parameters from its stage artifacts.
+        Embeddings and intents are always reused. Per level, "auto" starts from
+        the latest reusable stage: cluster selection on a stored HDBSCAN tree,
+        HDBSCAN on stored UMAP coordinates, or UMAP on the stored embeddings.
+        "cluster" stops before UMAP (an error if it has no stored coordinates),
+        "reduce" always re-runs UMAP. New coordinates and trees are added to the
+        artifacts. Returns a single result, or {"levels": ...} when `levels` is given.
+        `progress_callback(event)` receives stage progress events; the re-used
+        stages are reported as done. The task's stage plan is kept.
+        """
+        if from_stage not in ("auto", "cluster", "reduce"):
+            raise ValueError(f"Unknown from_stage '{from_stage}', expected 'auto', 'cluster' or 'reduce'")
+        start = time.perf_counter()
+        manifest = read_manifest(artifacts_dir)
+        stage = load_keyword_stage(artifacts_dir)
+        plan = self._stage_plan(manifest["settings"].get("stages"))
+        prepared = self._assemble_prepared(
+            stage["original_texts"], stage["volumes"], stage["codes"],
+            stage["unique_embeddings"], stage["unique_intents"], manifest["cluster_unique_only"], {},
+            collapse="collapse" in plan,
+        )
+        if prepared["intents"] is None:
+            plan = [s for s in plan if s != "intent"]
+        refine_options = self._refine_options(refine_mode, refine_max_pairs, refine_time_budget, plan)
+        run_levels = list(dict.fromkeys(levels)) if levels else [level]
+        progress = ProgressReporter(progress_callback, run_levels)
+        progress.finish("intent")
+        if prepared["near_duplicates"] is not None:
+            progress.add_seconds("collapse", prepared["near_duplicates"]["seconds"])
+        level_specs = self._level_specs(run_levels, min_cluster_size_override)
+        n_rows = len(prepared["cluster_embeddings"])
+
+        level_labels: Dict[str, np.ndarray] = {}
+        stages: Dict[str, str] = {}
+        to_reduce: Dict[str, Tuple[Dict[str, Any], int]] = {}
+        for lvl, (level_config, min_cluster_size) in level_specs.items():
+            umap_params = self._umap_params(level_config, n_rows)
+            key = (umap_params['n_neighbors'], umap_params['n_components'])
+            reduced = load_reduced(artifacts_dir, manifest, key) if from_stage != "reduce" else None
+            if reduced is None:
+                if from_stage == "cluster":
+                    raise ValueError(f"No stored UMAP coordinates for level '{lvl}' (n_neighbors={key[0]}, n_components={key[1]})")
+                to_reduce[lvl] = level_specs[lvl]
+                continue
+            tree = load_tree(artifacts_dir, manifest, key, level_config.get("min_samples", 2))
+            if tree is not None:
+                level_labels[lvl] = self._select_clusters(reduced, tree, level_config, min_cluster_size)
+                stages[lvl] = "cluster_selection"
+            else:
+                new_artifacts: Dict[str, Any] = {}
+                level_labels.update(self._hdbscan_levels(reduced, {lvl: level_specs[lvl]}, new_artifacts.setdefault("clusterers", {})))
+                add_stage_artifacts(artifacts_dir, {}, self._trees_of({lvl: key}, {lvl: level_config.get("min_samples", 2)}, new_artifacts["clusterers"]))
+                stages[lvl] = "hdbscan"
+
+        knn_stats: Dict[str, Any] = {}
+        if to_reduce:
+            reduce_artifacts: Dict[str, Any] = {}
+            reduced_labels, knn_graph = self._reduce_and_cluster_levels(
+                prepared["cluster_embeddings"], prepared["lexical_texts"], to_reduce, knn_stats, reduce_artifacts, progress,
+                "hybrid_lexical" in plan,
+            )
+            level_labels.update(reduced_labels)
+            stages.update({lvl: "umap" for lvl in to_reduce})
+            self._store_stages(artifacts_dir, reduce_artifacts, knn_graph)
+        else:
+            fingerprint = manifest.get("knn_fingerprint")
+            knn_graph = load_knn_graph(fingerprint) if fingerprint else None
+            if knn_graph is not None:
+                knn_stats = {"fingerprint": fingerprint, "cached": True, "n_neighbors": knn_graph.n_neighbors}
+        cluster_stats = {"knn_graph": knn_stats} if knn_stats else {}
+        progress.finish("hdbscan")
+
+        seconds = round(time.perf_counter() - start, 3)
+        results = {}
+        for lvl in run_levels:
+            results[lvl] = self._finish_level(prepared, level_labels[lvl], knn_graph, cluster_stats, refine_options, progress=progress, level=lvl)
+        stage_summary = self._stage_summary(plan, progress)
+        for lvl in run_levels:
+            results[lvl]["summary"]["stages"] = stage_summary
+            results[lvl]["summary"]["rerun"] = {
+                "source_task_id": manifest["task_id"],
+                "from_stage": stages[lvl],
+                "clustering_seconds": seconds,
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+        logger.info(f"Re-ran task {manifest['task_id']} from artifacts: {stages} in {time.perf_counter() - start:.2f}s.")
+        return {"levels": results} if levels else results[level]
+
+    def process_clustering_out_of_core(
+        self,
+        input_path: str,
+        output_dir: str,
+        level: str = "trung bình",
+        min_cluster_size_override: int = None,
+        memory_budget_mb: Optional[int] = None,
+        sample_size: Optional[int] = None,
+        chunk_rows: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Clusters a keyword file of any size within a memory budget: the file is
+        streamed into an on-disk spool, UMAP/HDBSCAN run on a random sample, and
+        every keyword is assigned to the nearest sample cluster in a streaming
+        pass. Results go to `output_dir` (keywords.csv, clusters.json,
+        summary.json); the summary is also returned. Cross-encoder refinement
+        is not applied in this mode.
+        """
+        plan = plan_memory(memory_budget_mb, sample_size, chunk_rows)
+        logger.info(f"Out-of-core clustering of {input_path}: {plan}")
+        start = time.perf_counter()
+        os.makedirs(OUT_OF_CORE_DIR, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix="job_", dir=OUT_OF_CORE_DIR)
+        try:
+            # 1. Stream: clean -> embed -> intents -> spool (memory-mapped later)
+            cache_stats: Dict[str, Any] = {}
+            spool = spool_keywords(input_path, KeywordSpool(work_dir), plan["chunk_rows"], self.intent_service, self.model, stats=cache_stats)
+
+            # 2. Cluster a random sample with the regular in-memory pipeline
+            sample_rows = choose_sample(spool.n, plan["sample_size"])
+            sample_embeddings = np.asarray(spool.embeddings()[sample_rows])
+            sample_labels = np.full(len(sample_rows), -1, dtype=np.int64)
+            cluster_stats: Dict[str, Any] = {}
+            if len(sample_rows):
+                prepared = {"cluster_embeddings": sample_embeddings, "lexical_texts": clean_keywords(spool.read_texts(sample_rows))}
+                level_labels, knn_graph, cluster_stats = self._cluster_levels(prepared, [level], min_cluster_size_override)
+                neighbor_labels = knn_graph.neighbor_labels(level_labels[level]) if knn_graph is not None else None
+                sample_labels = reassign_noise(
+                    sample_embeddings, level_labels[level], threshold=NOISE_CONFIDENCE_THRESHOLD, neighbor_labels=neighbor_labels
+                )["labels"]
+                del prepared, knn_graph, neighbor_labels
+            cluster_ids, centroids = segment_centroids(sample_embeddings, sample_labels)
+            del sample_embeddings
+
+            # 3. Assign every keyword to the nearest sample cluster and stream results to disk
+            summary = assign_and_write(spool, sample_rows, sample_labels, cluster_ids, centroids, output_dir, plan["chunk_rows"])
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        summary["embedding_cache"] = {
+            "hits": cache_stats.get("memory_hits", 0) + cache_stats.get("store_hits", 0),
+            "misses": cache_stats.get("misses", 0),
+            "memory_hits": cache_stats.get("memory_hits", 0),
+            "store_hits": cache_stats.get("store_hits", 0),
+        }
+        for name, block in cluster_stats.items():
+            summary[name] = dict(block)
+        summary["out_of_core"] = {
+            **plan,
+            "sampled_keywords": len(sample_rows),
+            "sample_clusters": len(cluster_ids),
+            "seconds": round(time.perf_counter() - start, 3),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        with open(os.path.join(output_dir, OUT_OF_CORE_SUMMARY_FILE), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        logger.info(f"Out-of-core clustering done: {summary['out_of_core']}")
+        return summary
+
+    @staticmethod
+    def _stage_plan(stages: Optional[Sequence[str]]) -> List[str]:
+        """Validated plan of optional stages (None = DEFAULT_STAGES), in OPTIONAL_STAGES order."""
+        requested = [s.strip().lower() for s in (DEFAULT_STAGES if stages is None else stages)]
+        unknown = sorted(set(requested) - set(OPTIONAL_STAGES))
+        if unknown:
+            raise ValueError(f"Unknown stages {unknown}, expected any of {list(OPTIONAL_STAGES)}")
+        return [s for s in OPTIONAL_STAGES if s in requested]
+
+    @staticmethod
+    def _stage_summary(plan: List[str], progress: ProgressReporter) -> Dict[str, Any]:
+        """Summary block: the plan, the stages that ran and their seconds ("hybrid_lexical" is part of "umap")."""
+        return {
+            "plan": plan,
+            "ran": list(progress.seconds),
+            "seconds": {stage: round(seconds, 3) for stage, seconds in progress.seconds.items()},
+        }
+
+    @staticmethod
+    def _refine_options(
+        refine_mode: Optional[str],
+        refine_max_pairs: Optional[int],
+        refine_time_budget: Optional[float],
+        plan: Optional[Sequence[str]] = None,
+    ) -> Dict[str, Any]:
+        refine_options = {
+            "mode": (refine_mode or REFINE_MODE).strip().lower(),
+            "max_pairs": REFINE_MAX_PAIRS if refine_max_pairs is None else refine_max_pairs,
+            "time_budget": REFINE_TIME_BUDGET_SECONDS if refine_time_budget is None else refine_time_budget,
+        }
+        if refine_options["mode"] not in ("gated", "strict", "off"):
+            raise ValueError(f"Unknown refine_mode '{refine_options['mode']}', expected 'gated', 'strict' or 'off'")
+        if plan is not None and "refine" not in plan:
+            refine_options["mode"] = "off"
+        return refine_options
+
+    def _prepare_keywords(
+        self,
+        raw_keywords_with_volume: List[Dict[str, Any]],
+        cluster_unique_only: Optional[bool],
+        progress: Optional[ProgressReporter] = None,
+        classify_intents: bool = True,
+        collapse: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Level-independent part of the pipeline: cleaning, embeddings and intents
+        (None when `classify_intents` is off). Also picks the rows UMAP/HDBSCAN
+        run on (all rows, one per unique keyword, or one per near-duplicate group
+        with `collapse`).
+        """
+        if cluster_unique_only is None:
+            cluster_unique_only = CLUSTER_UNIQUE_KEYWORDS_ONLY
+        progress = progress or ProgressReporter()
+        progress.start("cleaning")
 
         # 1. Prepare Data
         df = pd.DataFrame(raw_keywords_with_volume)
         df['text'] = df['text'].astype(str)
         df['volume'] = pd.to_numeric(df['volume'], errors='coerce').fillna(0).astype(int)
-        df['cleaned'] = df['text'].apply(clean_keyword)
+        df['cleaned'] = clean_keywords(df['text'])
 
         texts = df['cleaned'].tolist()
         original_texts = df['text'].tolist()
         volumes = df['volume'].tolist()
-        total_raw_volume = sum(volumes)
 
-        # 2. Embeddings
-        embeddings = self.model.encode(texts, batch_size=512, show_progress_bar=False, normalize_embeddings=True)
+        # Many raw variants map to the same cleaned string: work on unique strings
+        # and scatter back to rows with `codes` (row -> unique index)
+        codes, unique_texts = pd.factorize(df['cleaned'])
+        unique_texts = list(unique_texts)
+        n_unique = len(unique_texts)
+        logger.info(f"{len(texts)} keywords -> {n_unique} unique cleaned keywords.")
+
+        # 2. Embeddings (memory cache -> persistent store -> encoder)
+        progress.start("encoding")
+        cache_stats: Dict[str, Any] = {}
+        unique_embeddings = get_embeddings(
+            unique_texts, batch_size=512, show_progress_bar=False, normalize_embeddings=True,
+            stats=cache_stats, progress_callback=progress.counter("encoding"),
+        )
+        if unique_embeddings is None:
+            raise RuntimeError("Embedding model is not loaded")
+        logger.info(f"Embeddings: {cache_stats.get('memory_hits', 0) + cache_stats.get('store_hits', 0)} cached, {cache_stats.get('misses', 0)} encoded.")
 
         # 3. Intent Classification (Hybrid)
         # Pass embeddings and model to intent service for semantic fallback
-        intent_results = self.intent_service.classify_batch(texts, embeddings, self.model)
-        df['intent'] = intent_results
-        
-        intents = df['intent'].tolist()
+        unique_intents = None
+        if classify_intents:
+            progress.start("intent")
+            unique_intents = self.intent_service.classify_batch(unique_texts, unique_embeddings, self.model, progress.counter("intent"))
+        progress.finish("intent")
+        prepared = self._assemble_prepared(
+            original_texts, volumes, codes, unique_embeddings, unique_intents, cluster_unique_only, cache_stats, unique_texts, collapse
+        )
+        if prepared["near_duplicates"] is not None:
+            progress.add_seconds("collapse", prepared["near_duplicates"]["seconds"])
+        return prepared
+
+    @staticmethod
+    def _assemble_prepared(
+        original_texts: List[str],
+        volumes: List[int],
+        codes: np.ndarray,
+        unique_embeddings: np.ndarray,
+        unique_intents: Optional[List[Dict[str, Any]]],
+        cluster_unique_only: bool,
+        cache_stats: Dict[str, Any],
+        unique_texts: Optional[List[str]] = None,
+        collapse: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Scatters unique-keyword embeddings and intents (if classified) back to rows and picks the clustered rows.
+        TF-IDF runs on the cleaned `unique_texts` (re-cleaned from the first row of each code when not given),
+        the same canonical text as the embedding cache keys and intents. With `collapse`, near-duplicate
+        unique keywords (see services/near_duplicates.py) are clustered as one row, their highest-volume variant.
+        """
+        n_unique = len(unique_embeddings)
+        if unique_texts is None:
+            first_rows = np.unique(codes, return_index=True)[1]
+            unique_texts = clean_keywords([original_texts[i] for i in first_rows.tolist()])
+        embeddings = unique_embeddings[codes]
+        intents = [unique_intents[c] for c in codes] if unique_intents is not None else None
+
+        near_duplicates: Optional[Dict[str, Any]] = None
+        if collapse:
+            # One row per near-duplicate group, represented by its highest-volume keyword
+            # (first on ties); every keyword row gets the group's label back through row_map
+            near_duplicates = {}
+            groups = near_duplicate_groups(unique_texts, stats=near_duplicates)
+            unique_volumes = np.bincount(codes, weights=np.asarray(volumes, dtype=np.int64), minlength=n_unique)
+            order = np.lexsort((np.arange(n_unique), -unique_volumes, groups))
+            representatives = order[np.unique(groups[order], return_index=True)[1]]
+            cluster_embeddings = unique_embeddings[representatives]
+            lexical_texts = [unique_texts[i] for i in representatives.tolist()]
+            cluster_intents = [unique_intents[i]["intent"] for i in representatives.tolist()] if unique_intents is not None else None
+            row_map = groups[codes]
+            logger.info(
+                f"Clustering on {near_duplicates['groups']} near-duplicate groups of {n_unique} unique keywords "
+                f"({near_duplicates['seconds']:.2f}s)."
+            )
+        elif cluster_unique_only:
+            # One row per unique cleaned keyword, carrying the merged volume of all its duplicates
+            unique_volumes = np.bincount(codes, weights=np.asarray(volumes, dtype=np.int64), minlength=n_unique)
+            cluster_embeddings = unique_embeddings
+            lexical_texts = list(unique_texts)
+            cluster_intents = [intent["intent"] for intent in unique_intents] if unique_intents is not None else None
+            row_map = codes
+            logger.info(f"Clustering on {n_unique} unique keywords (merged volume {int(unique_volumes.sum())}).")
+        else:
+            cluster_embeddings = embeddings
+            lexical_texts = [unique_texts[c] for c in codes.tolist()]
+            cluster_intents = [intent["intent"] for intent in intents] if intents is not None else None
+            row_map = None
+
+        return {
+            "original_texts": original_texts,
+            "volumes": volumes,
+            "total_raw_volume": sum(volumes),
+            "n_unique": n_unique,
+            "embeddings": embeddings,
+            "intents": intents,
+            "cache_stats": cache_stats,
+            # Unique-keyword results, kept for task artifacts
+            "unique_embeddings": unique_embeddings,
+            "unique_intents": unique_intents,
+            "codes": codes,
+            # Rows UMAP/HDBSCAN run on; row_map scatters their labels back to keyword rows
+            "cluster_embeddings": cluster_embeddings,
+            "lexical_texts": lexical_texts,
+            "cluster_intents": cluster_intents,
+            "row_map": row_map,
+            "near_duplicates": near_duplicates,
+        }
+
+    def _cluster_levels(
+        self,
+        prepared: Dict[str, Any],
+        levels: List[str],
+        min_cluster_size_override: Optional[int],
+        partitioned: Optional[bool] = None,
+        artifacts: Optional[Dict[str, Any]] = None,
+        progress: Optional[ProgressReporter] = None,
+        hybrid_lexical: bool = True,
+    ) -> Tuple[Dict[str, np.ndarray], Optional[KnnGraph], Dict[str, Any]]:
+        """
+        Runs reduction and clustering for every level on shared intermediates.
+        Returns per-level labels of the clustered rows, the kNN graph and the
+        summary blocks describing the run ("knn_graph", "partitioning").
+        Partitioned mode applies when enabled and the rows exceed one partition;
+        it has no job-wide kNN graph. `artifacts`, if given, collects the fitted
+        intermediates (see `_reduce_and_cluster_levels`). Without `hybrid_lexical`
+        the representation is the dense embeddings only.
+        """
+        level_specs = self._level_specs(levels, min_cluster_size_override)
+        progress = progress or ProgressReporter()
+
+        if partitioned is None:
+            partitioned = PARTITIONED_CLUSTERING
+        if partitioned and len(prepared["cluster_embeddings"]) > PARTITION_TARGET_SIZE:
+            # Each partition runs UMAP and HDBSCAN: partitions are reported as UMAP progress
+            partition_stats: Dict[str, Any] = {}
+            level_labels = cluster_partitioned(
+                prepared["cluster_embeddings"], prepared["lexical_texts"], level_specs,
+                intents=prepared.get("cluster_intents"), stats=partition_stats,
+                progress_callback=progress.counter("umap"), hybrid_lexical=hybrid_lexical,
+            )
+            progress.finish("hdbscan")
+            return level_labels, None, {"partitioning": partition_stats}
 
-        # 3. Dimensionality Reduction (UMAP)
-        level_config = get_level_config(level)
+        knn_stats: Dict[str, Any] = {}
+        level_labels, knn_graph = self._reduce_and_cluster_levels(
+            prepared["cluster_embeddings"], prepared["lexical_texts"], level_specs, knn_stats, artifacts, progress, hybrid_lexical
+        )
+        return level_labels, knn_graph, {"knn_graph": knn_stats} if knn_stats else {}
+
+    @staticmethod
+    def _level_specs(levels: List[str], min_cluster_size_override: Optional[int]) -> Dict[str, Tuple[Dict[str, Any], int]]:
+        level_specs = {}
+        for lvl in levels:
+            level_config = get_level_config(lvl)
+            min_cluster_size = min_cluster_size_override if min_cluster_size_override is not None else level_config["min_cluster_size"]
+            level_specs[lvl] = (level_config, min_cluster_size)
+        return level_specs
+
+    def _save_task_artifacts(
+        self,
+        task_id: str,
+        prepared: Dict[str, Any],
+        artifacts: Dict[str, Any],
+        knn_graph: Optional[KnnGraph],
+        settings: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        """Persists a task's stage artifacts; failures only cost the re-run shortcut."""
+        if not ENABLE_TASK_ARTIFACTS:
+            return None
+        try:
+            directory = save_task_artifacts(task_id, prepared, settings)
+            stages = self._store_stages(directory, artifacts, knn_graph)
+        except Exception as e:
+            logger.warning(f"Could not save stage artifacts of task {task_id}: {e}")
+            return None
+        return {"task_id": task_id, "stages": stages}
+
+    def _store_stages(self, directory: str, artifacts: Dict[str, Any], knn_graph: Optional[KnnGraph]) -> List[str]:
+        """Adds the UMAP coordinates and HDBSCAN trees collected in `artifacts` to a task's artifacts."""
+        reduced, trees = {}, {}
+        if artifacts.get("reduced_space") == "umap":
+            umap_keys = artifacts["umap_keys"]
+            reduced = {umap_keys[lvl]: coords for lvl, coords in artifacts["reduced"].items()}
+            trees = self._trees_of(umap_keys, artifacts["min_samples"], artifacts["clusterers"])
+        return add_stage_artifacts(directory, reduced, trees, knn_graph.fingerprint if knn_graph is not None else None)
+
+    @staticmethod
+    def _trees_of(umap_keys: Dict[str, Tuple[int, int]], min_samples: Dict[str, int], clusterers: Dict[str, Any]) -> Dict[Tuple[Tuple[int, int], int], np.ndarray]:
+        return {
+            (umap_keys[lvl], min_samples[lvl]): clusterer.single_linkage_tree_.to_numpy()
+            for lvl, clusterer in clusterers.items()
+        }
+
+    def _finish_level(
+        self,
+        prepared: Dict[str, Any],
+        cluster_labels: np.ndarray,
+        knn_graph: Optional[KnnGraph],
+        cluster_stats: Dict[str, Any],
+        refine_options: Dict[str, Any],
+        artifacts: Optional[Dict[str, Any]] = None,
+        progress: Optional[ProgressReporter] = None,
+        level: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Noise reassignment, result building and summary for one level's labels.
+        `artifacts`, if given, receives the final keyword labels ("labels") and
+        the keyword rows per cluster key before refinement ("cluster_rows").
+        """
+        progress = progress or ProgressReporter()
+        progress.start("noise_assignment", level)
+        embeddings = prepared["embeddings"]
+        cache_stats = prepared["cache_stats"]
+        row_map = prepared["row_map"]
+        labels = cluster_labels if row_map is None else cluster_labels[row_map]
+
+        # 5. Force-assign noise to nearest cluster (with confidence threshold)
+        # Batched: segment-mean centroids + chunked matrix product, bounded memory.
+        # Also yields runner-up cluster and margin per keyword.
+        # With the kNN graph, noise may only join a cluster one of its neighbours is in.
+        num_noise = int(np.sum(labels == -1))
+        neighbor_labels = None
+        if knn_graph is not None:
+            neighbor_labels = knn_graph.neighbor_labels(cluster_labels)
+            if row_map is not None:
+                neighbor_labels = neighbor_labels[row_map]
+        assignment = reassign_noise(embeddings, labels, threshold=NOISE_CONFIDENCE_THRESHOLD, neighbor_labels=neighbor_labels)
+        labels = assignment["labels"]
+        if artifacts is not None:
+            artifacts["labels"] = labels
+            artifacts["cluster_rows"] = {}
+
+        if num_noise > 0:
+            num_assigned = int(assignment["reassigned"].sum())
+            logger.info(f"Found {num_noise} noise keywords. Assigned {num_assigned} to clusters (threshold {NOISE_CONFIDENCE_THRESHOLD}). {num_noise - num_assigned} keywords remain as low-confidence.")
+
+        # 6. Post-processing & Naming
+        results = self._build_results(
+            prepared["original_texts"], prepared["volumes"], labels, embeddings,
+            prepared["total_raw_volume"], prepared["intents"], assignment, refine_options,
+            cluster_rows=artifacts["cluster_rows"] if artifacts is not None else None,
+            progress=progress, level=level,
+        )
+        results["summary"]["unique_keywords"] = prepared["n_unique"]
+        if prepared.get("near_duplicates") is not None:
+            results["summary"]["near_duplicates"] = dict(prepared["near_duplicates"])
+        results["summary"]["embedding_cache"] = {
+            "hits": cache_stats.get("memory_hits", 0) + cache_stats.get("store_hits", 0),
+            "misses": cache_stats.get("misses", 0),
+            "memory_hits": cache_stats.get("memory_hits", 0),
+            "store_hits": cache_stats.get("store_hits", 0),
+        }
+        for name, block in cluster_stats.items():
+            results["summary"][name] = dict(block)
+        results["summary"]["encoding"] = {
+            "batches": cache_stats.get("batches", 0),
+            "token_budget": cache_stats.get("token_budget"),
+            "padding_ratio": cache_stats.get("padding_ratio", 0.0),
+        }
+        progress.finish("results", level)
+        return results
+
+    @staticmethod
+    def _umap_params(level_config: Dict[str, Any], n_keywords: int) -> Dict[str, int]:
         # Dynamic parameter adjustment for small datasets to prevent UMAP errors
-        n_keywords = len(embeddings)
         umap_params = {
             'n_neighbors': level_config["n_neighbors"],
             'n_components': level_config["n_components"]
@@ -87,286 +831,265 @@ class ClusteringService:
         if umap_params['n_neighbors'] >= n_keywords:
             umap_params['n_neighbors'] = max(2, n_keywords - 1)
             logger.info(f"Adjusted n_neighbors to {umap_params['n_neighbors']} (n_keywords={n_keywords})")
+        return umap_params
 
+    @classmethod
+    def _reduce_and_cluster_levels(
+        cls,
+        embeddings: np.ndarray,
+        lexical_texts: List[str],
+        level_specs: Dict[str, Tuple[Dict[str, Any], int]],
+        knn_stats: Optional[Dict[str, Any]] = None,
+        artifacts: Optional[Dict[str, Any]] = None,
+        progress: Optional[ProgressReporter] = None,
+        hybrid_lexical: bool = True,
+    ) -> Tuple[Dict[str, np.ndarray], Optional[KnnGraph]]:
+        """
+        Runs hybrid UMAP reduction and HDBSCAN on the given rows for each level
+        in `level_specs` (level -> (level_config, min_cluster_size)).
+        The hybrid representation and kNN graph are built once; levels with the same
+        UMAP settings share one reduction. Returns one label per row (-1 = noise)
+        for each level, and the shared kNN graph of the hybrid representation (None when
+        UMAP is skipped or the graph is disabled).
+        If `artifacts` is given, it receives the fitted intermediates needed to
+        place new rows later: "representation", "reduced_space" ("umap" or
+        "embeddings"), and per level "reduced", "n_neighbors", "umap_keys",
+        "min_samples" and "clusterers". Without `hybrid_lexical` (or with
+        ENABLE_HYBRID_EMBEDDINGS off) the TF-IDF block is not built.
+        """
+        n_keywords = len(embeddings)
+        progress = progress or ProgressReporter()
+        progress.start("umap")
+        umap_groups: Dict[Tuple[int, int], List[str]] = {}
+        for lvl, (level_config, min_cluster_size) in level_specs.items():
+            umap_params = cls._umap_params(level_config, n_keywords)
+            logger.info(f"Clustering with level '{lvl}': UMAP(n_neighbors={umap_params['n_neighbors']}, n_components={umap_params['n_components']}), HDBSCAN(min_cluster_size={min_cluster_size})")
+            umap_groups.setdefault((umap_params['n_neighbors'], umap_params['n_components']), []).append(lvl)
 
-        logger.info(f"Clustering with level '{level}': UMAP(n_neighbors={umap_params['n_neighbors']}, n_components={umap_params['n_components']}), HDBSCAN(min_cluster_size={level_config['min_cluster_size']})")
-
+        knn_graph = None
+        representation = None
         # For very small datasets, skip UMAP to avoid errors
         if n_keywords < 10:
             logger.warning(f"Very small dataset ({n_keywords} keywords). Skipping UMAP, clustering directly on embeddings.")
-            reduced_embeddings = embeddings  # Use original embeddings
-        else:
+            reduced = {key: embeddings for key in umap_groups}  # Use original embeddings
+        if n_keywords >= 10 or artifacts is not None:
             # --- HYBRID CLUSTERING (Semantic + Lexical) ---
-            # Combine Dense Embeddings (AI) with Sparse Matrix (TF-IDF)
-            # This improves accuracy by distinguishing similar topics with different specific keywords (e.g., iPhone 14 vs 15)
-            
-            from sklearn.feature_extraction.text import TfidfVectorizer
-            from scipy.sparse import hstack
-            
-            # 1. Create Lexical Vectors (TF-IDF)
-            vectorizer = TfidfVectorizer(min_df=1, analyzer='word', ngram_range=(1, 2))
-            tfidf_matrix = vectorizer.fit_transform(original_texts)
-            
-            # 2. Combine with Semantic Embeddings
-            # We weight semantic embeddings higher (e.g., 0.7) but give lexical some weight (0.3)
-            # Note: UMAP can handle sparse inputs directly or we can concatenate
-            
-            # Simple concatenation strategy (proven effective for short text)
-            # Normalize embeddings first to ensure fair contribution
-            from sklearn.preprocessing import normalize
-            normalized_embeddings = normalize(embeddings)
-            
-            # Convert dense embeddings to sparse format for efficient stacking
-            from scipy.sparse import csr_matrix
-            sparse_embeddings = csr_matrix(normalized_embeddings)
-            
-            # Stack them: [Semantic Vectors | Lexical Vectors]
-            hybrid_matrix = hstack([sparse_embeddings, tfidf_matrix])
-            
-            # 3. UMAP Reduction on Hybrid Data
+            # Dense embeddings (AI) and TF-IDF stay separate matrices, weighted
+            # HYBRID_SEMANTIC_WEIGHT / 1 - HYBRID_SEMANTIC_WEIGHT at similarity time.
+            # Lexical features distinguish similar topics with different specific
+            # keywords (e.g., iPhone 14 vs 15).
+            if ENABLE_HYBRID_EMBEDDINGS and hybrid_lexical:
+                lexical_start = time.perf_counter()
+                representation = build_hybrid_representation(embeddings, lexical_texts)
+                progress.add_seconds("hybrid_lexical", time.perf_counter() - lexical_start)
+            else:
+                representation = HybridRepresentation(embeddings)
+        if n_keywords >= 10:
+            # 3. Shared kNN graph: built once (all cores), cached across levels,
+            # handed to UMAP so it skips its own neighbour search
+            if ENABLE_KNN_GRAPH and any(n_neighbors <= KNN_GRAPH_NEIGHBORS for n_neighbors, _ in umap_groups):
+                knn_graph = get_or_build_knn_graph(
+                    representation, lexical_texts, KNN_GRAPH_NEIGHBORS, stats=knn_stats
+                )
+
+            # 4. UMAP Reduction on Hybrid Data (one per distinct setting, concurrently)
+            reduced = cls._reduce_umap_groups(representation, knn_graph, list(umap_groups), progress.counter("umap"))
+
+        # 5. Clustering (HDBSCAN)
+        progress.start("hdbscan")
+        level_labels: Dict[str, np.ndarray] = {}
+        clusterers: Optional[Dict[str, Any]] = {} if artifacts is not None else None
+        for i, (key, group_levels) in enumerate(umap_groups.items()):
+            level_labels.update(cls._hdbscan_levels(reduced[key], {lvl: level_specs[lvl] for lvl in group_levels}, clusterers))
+            progress.update("hdbscan", i + 1, len(umap_groups))
+
+        if artifacts is not None:
+            artifacts.update({
+                "representation": representation,
+                "reduced_space": "umap" if n_keywords >= 10 else "embeddings",
+                "reduced": {lvl: reduced[key] for key, group_levels in umap_groups.items() for lvl in group_levels},
+                "n_neighbors": {lvl: key[0] for key, group_levels in umap_groups.items() for lvl in group_levels},
+                "umap_keys": {lvl: key for key, group_levels in umap_groups.items() for lvl in group_levels},
+                "min_samples": {lvl: level_config.get("min_samples", 2) for lvl, (level_config, _) in level_specs.items()},
+                "clusterers": clusterers,
+            })
+        return level_labels, knn_graph
+
+    @staticmethod
+    def _reduce_umap_groups(
+        representation: HybridRepresentation,
+        knn_graph: Optional[KnnGraph],
+        umap_keys: List[Tuple[int, int]],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict[Tuple[int, int], np.ndarray]:
+        """UMAP coordinates per (n_neighbors, n_components); `progress_callback(done, total)` as reductions finish."""
+        from umap import UMAP
+
+        done = []
+
+        def _reduce(key: Tuple[int, int]) -> np.ndarray:
+            n_neighbors, n_components = key
+            precomputed_knn = (None, None, None)
+            if knn_graph is not None and n_neighbors <= knn_graph.n_neighbors:
+                precomputed_knn = knn_graph.for_umap(n_neighbors)
             umap_model = UMAP(
-                n_neighbors=umap_params["n_neighbors"],
-                n_components=umap_params["n_components"],
+                n_neighbors=n_neighbors,
+                n_components=n_components,
                 min_dist=0.0,
                 metric='cosine', # Cosine works well for high-dim sparse data
                 random_state=42,
-                n_jobs=1
+                n_jobs=1,
+                precomputed_knn=precomputed_knn,
             )
-            reduced_embeddings = umap_model.fit_transform(hybrid_matrix)
+            coords = umap_model.fit_transform(representation.umap_input(precomputed_knn[0] is not None))
+            done.append(key)
+            if progress_callback is not None:
+                progress_callback(len(done), len(umap_keys))
+            return coords
 
-        # 4. Clustering (HDBSCAN)
-        # Use level_config for HDBSCAN parameters, but allow override
-        min_cluster_size = min_cluster_size_override if min_cluster_size_override is not None else level_config["min_cluster_size"]
-        min_samples = level_config.get("min_samples", 2)
-        cluster_selection_epsilon = level_config.get("cluster_selection_epsilon", 0.0)
-        
-        clusterer = HDBSCAN(
-            min_cluster_size=min_cluster_size,
-            min_samples=min_samples,
-            cluster_selection_epsilon=cluster_selection_epsilon,
-            metric='euclidean',
-            cluster_selection_method='eom',
-            prediction_data=True
-        )
-        labels = clusterer.fit_predict(reduced_embeddings)
+        # Filters are process-global, so set them here rather than in the threads.
+        # No NNDescent search index is kept: only transform() would need it.
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message=".*knn_search_index.*")
+            max_workers = min(len(umap_keys), MULTI_LEVEL_MAX_WORKERS)
+            if max_workers <= 1:
+                return {key: _reduce(key) for key in umap_keys}
+            # Each UMAP is seeded (random_state=42), so results do not depend on scheduling
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return dict(zip(umap_keys, executor.map(_reduce, umap_keys)))
 
-        # 5. Force-assign noise to nearest cluster (with confidence threshold)
-        noise_mask = labels == -1
-        num_noise = np.sum(noise_mask)
-        
-        # Confidence threshold: Only assign if similarity >= this value
-        CONFIDENCE_THRESHOLD = 0.65
-        
-        if num_noise > 0:
-            logger.info(f"Found {num_noise} noise keywords. Force-assigning with confidence threshold {CONFIDENCE_THRESHOLD}...")
-            
-            # Calculate cluster centroids
-            unique_labels = set(labels) - {-1}
-            centroids = {}
-            for label in unique_labels:
-                cluster_mask = labels == label
-                cluster_embeddings = embeddings[cluster_mask]
-                centroids[label] = np.mean(cluster_embeddings, axis=0, keepdims=True)
-            
-            # Assign each noise point to nearest cluster (if confident enough)
-            noise_indices = np.where(noise_mask)[0]
-            low_confidence_count = 0
-            
-            for idx in noise_indices:
-                noise_embedding = embeddings[idx:idx+1]  # Keep 2D shape
-                
-                # Calculate similarity to all centroids
-                best_label = None
-                best_similarity = -1
-                
-                for label, centroid in centroids.items():
-                    similarity = cosine_similarity(noise_embedding, centroid)[0, 0]
-                    if similarity > best_similarity:
-                        best_similarity = similarity
-                        best_label = label
-                
-                # Only assign if confidence is high enough
-                if best_label is not None and best_similarity >= CONFIDENCE_THRESHOLD:
-                    labels[idx] = best_label
-                else:
-                    # Keep as noise but will be grouped into "Low Confidence" cluster later
-                    low_confidence_count += 1
-            
-            logger.info(f"Assigned {num_noise - low_confidence_count} noise keywords to clusters. {low_confidence_count} keywords remain as low-confidence.")
+    @staticmethod
+    def _hdbscan_levels(
+        reduced_embeddings: np.ndarray,
+        level_specs: Dict[str, Tuple[Dict[str, Any], int]],
+        clusterers: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        HDBSCAN labels for levels sharing one reduced embedding. The single
+        linkage tree only depends on min_samples, so levels with the same
+        min_samples reuse one fitted hierarchy and only redo cluster selection
+        for their own min_cluster_size / cluster_selection_epsilon.
+        `clusterers`, if given, receives the fitted HDBSCAN model of each level
+        that was fitted directly (not of levels reusing another level's tree).
+        """
+        from hdbscan import HDBSCAN
 
-        # 6. Post-processing & Naming
-        return self._build_results(original_texts, volumes, labels, embeddings, total_raw_volume, intents)
-
-    def _build_results(self, original_texts, volumes, labels, embeddings, total_raw_volume, intents):
-        # Group by label
-        cluster_texts = defaultdict(list)
-        cluster_volumes = defaultdict(list)
-        unclustered_raw = []
-        for text, vol, label, intent in zip(original_texts, volumes, labels, intents):
-            if label == -1:
-                unclustered_raw.append({"text": text, "volume": vol, "intent": intent})
-            else:
-                cluster_texts[label].append(text)
-                cluster_volumes[label].append(vol)
-        
-        # Generate Names based on highest volume keyword
-        cluster_names = {}
-        for label, docs in cluster_texts.items():
-            vols = cluster_volumes[label]
-            if not docs:
-                cluster_names[label] = "Unknown Topic"
-                continue
-            # Find index of max volume
-            max_idx = max(range(len(vols)), key=lambda i: vols[i])
-            cluster_names[label] = docs[max_idx]
-        
-        # Build Output Structure
-        clusters = {}
-        csv_rows = ["Topic,Keyword,Volume,Total Volume Topic,Similarity,Cluster Type,Intent,Sub-Intent"]
-        total_processed_keywords = len(original_texts)
-        
-        # Sort clusters by volume
-        cluster_info = []
-        for label in set(labels):
-            if label == -1: continue
-            indices = [i for i, l in enumerate(labels) if l == label]
-            total_vol = sum(volumes[i] for i in indices)
-            cluster_info.append((label, total_vol, indices))
-        
-        cluster_info.sort(key=lambda x: x[1], reverse=True)
+        by_min_samples: Dict[int, List[str]] = {}
+        for lvl, (level_config, _) in level_specs.items():
+            # Use level_config for HDBSCAN parameters, but allow override
+            by_min_samples.setdefault(level_config.get("min_samples", 2), []).append(lvl)
 
-        for rank, (label, total_vol, indices) in enumerate(cluster_info, 1):
-            name = cluster_names.get(label, f"Cụm {rank}")
-            
-            # Calculate similarity with cluster name (highest volume keyword)
-            # Find the index of the keyword that IS the cluster name
-            max_vol_in_cluster = max(volumes[i] for i in indices)
-            name_keyword_idx = None
-            for i in indices:
-                if volumes[i] == max_vol_in_cluster and original_texts[i] == name:
-                    name_keyword_idx = i
-                    break
-            
-            # If we found the name keyword, calculate similarity against it
-            if name_keyword_idx is not None:
-                name_embedding = embeddings[name_keyword_idx:name_keyword_idx+1]  # Keep 2D
-                cluster_embeddings = embeddings[indices]
-                sims = cosine_similarity(cluster_embeddings, name_embedding).flatten()
-            else:
-                # Fallback: if we can't find the exact name keyword, use centroid
-                if len(indices) > 1:
-                    cluster_embeddings = embeddings[indices]
-                    centroid = np.mean(cluster_embeddings, axis=0, keepdims=True)
-                    sims = cosine_similarity(cluster_embeddings, centroid).flatten()
+        labels: Dict[str, np.ndarray] = {}
+        for min_samples, group_levels in by_min_samples.items():
+            clusterer = None
+            for lvl in group_levels:
+                level_config, min_cluster_size = level_specs[lvl]
+                cluster_selection_epsilon = level_config.get("cluster_selection_epsilon", 0.0)
+                if clusterer is None:
+                    clusterer = HDBSCAN(
+                        min_cluster_size=min_cluster_size,
+                        min_samples=min_samples,
+                        cluster_selection_epsilon=cluster_selection_epsilon,
+                        metric='euclidean',
+                        cluster_selection_method='eom',
+                        prediction_data=True
+                    )
+                    labels[lvl] = clusterer.fit_predict(reduced_embeddings)
+                    if clusterers is not None:
+                        clusterers[lvl] = clusterer
                 else:
-                    sims = [1.0]
-
-            # Calculate dominant intent (based on Main Intent)
-            cluster_intents_list = [intents[i]['intent'] for i in indices]
-            dominant_intent = Counter(cluster_intents_list).most_common(1)[0][0] if cluster_intents_list else "UNCATEGORIZED"
-
-            kw_list = []
-            for i, sim in zip(indices, sims):
-                intent_data = intents[i]
-                kw_data = {
-                    "text": original_texts[i],
-                    "volume": volumes[i],
-                    "matching_point": round(float(sim) * 100, 1)  # Convert to 0-100 scale
-                }
-                kw_list.append(kw_data)
-            # --- CORE CLUSTERING DATA ONLY ---
-            # No advanced SEO analysis to maximize speed
-            
-            clusters[name] = {
-                "cluster_name": name,
-                "keywords": kw_list,
-                "total_volume_topic": total_vol
-                # "cluster_intent": dominant_intent, # Removed
-                # "content_format": content_format, # Removed
-                # "parent_topic": None,
-                # "related_keywords": related_kws, # Removed
-                # "avg_commercial_score": avg_commercial # Removed
-            }
+                    labels[lvl] = ClusteringService._select_clusters(
+                        reduced_embeddings, clusterer.single_linkage_tree_.to_numpy(), level_config, min_cluster_size
+                    )
+        return labels
 
-        # --- 4. Handle Unclustered Keywords (Noise) ---
-        unclustered = []
-        total_noise_volume = 0
-        total_noise_keywords = 0
+    @staticmethod
+    def _select_clusters(reduced_embeddings: np.ndarray, single_linkage_tree: np.ndarray, level_config: Dict[str, Any], min_cluster_size: int) -> np.ndarray:
+        """HDBSCAN cluster selection on an already built single linkage tree."""
+        from hdbscan.hdbscan_ import _tree_to_labels
 
-        if -1 in labels:
-            noise_indices = [i for i, label in enumerate(labels) if label == -1]
-            total_noise_keywords = len(noise_indices)
-            
-            for i in noise_indices:
-                keyword_text = original_texts[i]
-                vol = volumes[i]
-                total_noise_volume += vol
-                
-                # Create a singleton cluster for noise if configured
-                # Or just add to unclustered list
-                # For consistency with "clean" output, we might want to group them or list them
-                
-                # Current logic: Treat as singleton clusters (Topic = Keyword)
-                # This ensures EVERY keyword appears in the Excel/JSON list
-                
-                cluster_name = keyword_text
-                kw_data = {
-                    "text": keyword_text,
-                    "volume": vol,
-                    "matching_point": 100.0 # Self-match
-                }
-                
-                clusters[cluster_name] = {
-                    "cluster_name": cluster_name,
-                    "keywords": [kw_data],
-                    "total_volume_topic": vol
-                }
+        return _tree_to_labels(
+            reduced_embeddings,
+            single_linkage_tree,
+            min_cluster_size=min_cluster_size,
+            cluster_selection_method='eom',
+            cluster_selection_epsilon=level_config.get("cluster_selection_epsilon", 0.0),
+        )[0]
+
+    def _build_results(self, original_texts, volumes, labels, embeddings, total_raw_volume, intents, assignment=None, refine_options=None, cluster_rows=None, progress=None, level=None):
+        refine_options = refine_options or {"mode": "strict", "max_pairs": 0, "time_budget": 0.0}
+        progress = progress or ProgressReporter()
 
+        # Columnar grouping: one argsort over labels, vectorized volume/name/similarity
+        if cluster_rows is None:
+            cluster_rows = {}
+        clusters, total_noise_keywords, total_noise_volume, used_names = build_cluster_map(
+            original_texts, volumes, labels, embeddings, cluster_rows=cluster_rows
+        )
+        unclustered = []
+        if intents is not None:
+            add_keyword_intents(clusters, cluster_rows, intents)
 
         # --- 5. Refine Clusters with Cross-Encoder (The "Accuracy Booster") ---
-        # This step verifies each keyword against the cluster center using a Cross-Encoder model.
+        # This step verifies keywords against the cluster name using a Cross-Encoder model.
         # Cross-Encoders are much more accurate than Bi-Encoders (Vectors) for pair comparison.
-        
-        logger.info("Refining clusters with Cross-Encoder for maximum accuracy...")
-        clusters, refined_unclustered = self._refine_clusters_with_cross_encoder(clusters)
-        
-        # Add refined unclustered keywords back to the main unclustered list
-        # Note: In current logic, we might want to treat them as singletons or noise.
-        # Let's add them to noise processing logic if needed, or just return as unclustered.
-        
-        # For now, let's create singleton clusters for these rejected keywords to ensure coverage
-        for kw_text in refined_unclustered:
-             # Find original volume
-             try:
-                 idx = original_texts.index(kw_text)
-                 vol = volumes[idx]
-             except ValueError:
-                 vol = 0 # Should not happen
-                 
-             cluster_name = kw_text
-             kw_data = {
-                 "text": kw_text,
-                 "volume": vol,
-                 "matching_point": 100.0
-             }
-             clusters[cluster_name] = {
-                 "cluster_name": cluster_name,
-                 "keywords": [kw_data],
-                 "total_volume_topic": vol
-             }
-             total_noise_keywords += 1
-             total_noise_volume += vol
+        # Gated mode only checks the uncertain band: low matching_point, small margin
+        # to the runner-up cluster, nearest centroid in another cluster, or reassigned noise.
+        refine_stats: Dict[str, Any] = {}
+        refine_seconds = 0.0
+        refined_unclustered: List[Dict[str, Any]] = []
+        if refine_options["mode"] != "off":
+            candidates = None
+            if refine_options["mode"] == "gated" and assignment is not None:
+                flagged_rows = (
+                    assignment["reassigned"]
+                    | (assignment["margin"] < REFINE_MIN_MARGIN)
+                    | (assignment["best_label"] != labels)
+                )
+                candidates = select_uncertain(clusters, cluster_rows, flagged_rows, REFINE_MIN_MATCHING_POINT)
+
+            logger.info(f"Refining clusters with Cross-Encoder ({refine_options['mode']} mode)...")
+            progress.start("refinement", level)
+            refine_start = time.perf_counter()
+            clusters, refined_unclustered = self._refine_clusters_with_cross_encoder(
+                clusters,
+                stats=refine_stats,
+                candidates=candidates,
+                max_pairs=refine_options["max_pairs"],
+                time_budget=refine_options["time_budget"],
+                progress_callback=progress.counter("refinement", level),
+            )
+            refine_seconds = time.perf_counter() - refine_start
+            logger.info(
+                f"Cross-Encoder refinement: {refine_stats.get('checked_pairs', 0)} pairs checked "
+                f"({refine_stats.get('cached_pairs', 0)} cached), {refine_stats.get('skipped_pairs', 0)} skipped, {refine_seconds:.2f}s."
+            )
+
+        # Rejected keywords become singleton clusters to ensure coverage
+        # (they carry their own volume, no lookup needed)
+        progress.start("results", level)
+        total_noise_volume += add_singleton_clusters(clusters, refined_unclustered, used_names)
+        total_noise_keywords += len(refined_unclustered)
+        if intents is not None:
+            add_cluster_intents(clusters)
 
         # Summary update
-        top10_vol = sum(c['total_volume_topic'] for c in sorted(clusters.values(), key=lambda x: x['total_volume_topic'], reverse=True)[:10])
-        top10_percent = round(top10_vol / total_raw_volume * 100, 1) if total_raw_volume > 0 else 0
-        
         summary = {
             "total_keywords_processed": len(original_texts),
             "total_clusters_found": len(clusters),
-            "top10_cluster_volume_percent": top10_percent,
+            "top10_cluster_volume_percent": top_clusters_volume_percent(clusters, total_raw_volume),
             "noise_keywords_found": total_noise_keywords,
-            "noise_volume": total_noise_volume
+            "noise_volume": total_noise_volume,
+            "refinement": {
+                "mode": refine_options["mode"],
+                "seconds": round(refine_seconds, 3),
+                "pairs": refine_stats.get("pairs", 0),
+                "scored_pairs": refine_stats.get("scored_pairs", 0),
+                "cached_pairs": refine_stats.get("cached_pairs", 0),
+                "skipped_pairs": refine_stats.get("skipped_pairs", 0),
+                "budget_exhausted": refine_stats.get("budget_exhausted", False),
+                "rejected": refine_stats.get("rejected", 0),
+            },
         }
 
         return {
@@ -375,82 +1098,27 @@ class ClusteringService:
             "summary": summary
         }
 
-    def _refine_clusters_with_cross_encoder(self, clusters: Dict[str, Any], threshold: float = 0.4) -> Tuple[Dict[str, Any], List[str]]:
+    def _refine_clusters_with_cross_encoder(
+        self,
+        clusters: Dict[str, Any],
+        stats: Optional[Dict[str, Any]] = None,
+        candidates: Optional[Dict[str, List[int]]] = None,
+        max_pairs: int = 0,
+        time_budget: float = 0.0,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
         """
         Uses a Cross-Encoder to verify if keywords truly belong to their assigned cluster.
-        Returns refined clusters and a list of rejected keywords.
+        Only `candidates` are checked when given (gated mode), otherwise every keyword.
+        Returns refined clusters and the rejected keyword dicts.
         """
-        from sentence_transformers import CrossEncoder
-        import torch
-        
-        # Load model (lazy loading to save memory if not used often)
-        # Using a lightweight but effective model
-        model_name = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        
-        try:
-            model = CrossEncoder(model_name, device=device)
-        except Exception as e:
-            logger.error(f"Failed to load Cross-Encoder: {e}. Skipping refinement.")
+        refiner = get_refiner()
+        if refiner is None:
             return clusters, []
-
-        rejected_keywords = []
-        refined_clusters = {}
-
-        for name, data in clusters.items():
-            keywords = data['keywords']
-            if not keywords:
-                continue
-                
-            # Prepare pairs: (Cluster Name, Keyword Text)
-            # Cluster Name acts as the "Anchor" or "Query"
-            pairs = [[name, kw['text']] for kw in keywords]
-            
-            # Predict similarity scores
-            scores = model.predict(pairs)
-            
-            valid_keywords = []
-            
-            for i, score in enumerate(scores):
-                # Sigmoid conversion if model outputs logits (ms-marco models usually output logits)
-                # But CrossEncoder.predict usually returns raw scores. 
-                # For ms-marco-MiniLM-L-6-v2, scores are not bounded 0-1.
-                # We need to normalize or use a relative threshold.
-                # Actually, for this specific model, higher is better. 
-                # A safe heuristic threshold for relevance is often around 0 or -2 depending on the model.
-                # Let's use a safer approach: If it's the cluster name itself, keep it.
-                
-                kw = keywords[i]
-                
-                # Always keep the cluster name keyword itself
-                if kw['text'] == name:
-                    valid_keywords.append(kw)
-                    continue
-                
-                # For MS MARCO models, scores can range from -10 to 10.
-                # A score > 0 usually indicates relevance.
-                # Let's be slightly lenient to avoid over-filtering.
-                if score > -2.0: 
-                    # Update matching point with the high-quality Cross-Encoder score
-                    # Normalize score roughly to 0-100 for display
-                    # Map -2 to 10 (low), 10 to 100 (high)
-                    normalized_score = max(10, min(100, (score + 4) * 10))
-                    kw['matching_point'] = round(normalized_score, 1)
-                    valid_keywords.append(kw)
-                else:
-                    rejected_keywords.append(kw['text'])
-            
-            if valid_keywords:
-                data['keywords'] = valid_keywords
-                # Recalculate volume
-                data['total_volume_topic'] = sum(k['volume'] for k in valid_keywords)
-                refined_clusters[name] = data
-            else:
-                # If all keywords rejected (rare, but possible if cluster name was bad), 
-                # the cluster name itself should have been kept.
-                pass
-
-        return refined_clusters, rejected_keywords
+        return refiner.refine(
+            clusters, stats=stats, candidates=candidates, max_pairs=max_pairs,
+            time_budget=time_budget, progress_callback=progress_callback,
+        )
 
     def _analyze_micro_intent(self, text: str) -> str:
         """Analyze specific user intent based on keyword patterns."""
@@ -0,0 +1,283 @@
+"""
+Cross-encoder refinement of cluster membership.
+
+The cross-encoder is loaded once per process (`get_refiner`) and reused by
+every clustering call. The (cluster name, keyword) pairs to check are scored
+in one length-sorted batched predict, and scores are split back per cluster.
+Scores of pairs seen before come from an LRU cache.
+
+In "gated" mode only uncertain keywords are checked (see `select_uncertain`),
+within an optional pair/time budget; "strict" mode checks every pair.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from keyword_cluster_app.config import (
+    CROSS_ENCODER_MODEL,
+    CROSS_ENCODER_BATCH_SIZE,
+    CROSS_ENCODER_SCORE_CACHE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+# For MS MARCO models, scores range roughly from -10 to 10 and > 0 usually
+# indicates relevance. Keywords scoring at or below this are rejected.
+MIN_RELEVANCE_SCORE = -2.0
+
+Pair = Tuple[str, str]
+
+
+class PairScoreCache:
+    """LRU cache mapping (cluster name, keyword) -> cross-encoder score."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(0, int(max_entries))
+        self._scores: "OrderedDict[Pair, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pair: Pair) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(pair)
+            if score is None:
+                self.misses += 1
+                return None
+            self._scores.move_to_end(pair)
+            self.hits += 1
+            return score
+
+    def put_many(self, pairs: Sequence[Pair], scores: Sequence[float]) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            for pair, score in zip(pairs, scores):
+                self._scores[pair] = float(score)
+                self._scores.move_to_end(pair)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scores.clear()
+
+
+class CrossEncoderRefiner:
+    """
+    Long-lived cross-encoder scorer. `model` is anything with a
+    sentence-transformers style `predict(pairs, batch_size=...)`.
+    """
+
+    def __init__(self, model: Any, batch_size: int = CROSS_ENCODER_BATCH_SIZE, cache_size: int = CROSS_ENCODER_SCORE_CACHE_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+        self.cache = PairScoreCache(cache_size)
+        self._predict_lock = threading.Lock()
+
+    def score_pairs(self, pairs: Sequence[Pair], stats: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """
+        Scores pairs in input order. Cached pairs are not re-scored; the
+        remaining unique pairs are sorted by length and sent to the model in a
+        single predict call, so each batch holds pairs of similar length.
+        """
+        scores = np.empty(len(pairs), dtype=np.float32)
+        missing: Dict[Pair, List[int]] = {}
+        for i, pair in enumerate(pairs):
+            cached = self.cache.get(pair)
+            if cached is None:
+                missing.setdefault(pair, []).append(i)
+            else:
+                scores[i] = cached
+
+        if missing:
+            to_score = sorted(missing, key=lambda p: len(p[0]) + len(p[1]))
+            with self._predict_lock:
+                predicted = self.model.predict(
+                    [list(p) for p in to_score],
+                    batch_size=self.batch_size,
+                    show_progress_bar=False,
+                )
+            predicted = np.asarray(predicted, dtype=np.float32).reshape(-1)
+            for pair, score in zip(to_score, predicted):
+                scores[missing[pair]] = score
+            self.cache.put_many(to_score, predicted)
+
+        if stats is not None:
+            stats["pairs"] = stats.get("pairs", 0) + len(pairs)
+            stats["scored_pairs"] = stats.get("scored_pairs", 0) + len(missing)
+            stats["cached_pairs"] = stats.get("cached_pairs", 0) + len(pairs) - sum(len(v) for v in missing.values())
+        return scores
+
+    def refine(
+        self,
+        clusters: Dict[str, Dict[str, Any]],
+        min_score: float = MIN_RELEVANCE_SCORE,
+        stats: Optional[Dict[str, Any]] = None,
+        candidates: Optional[Dict[str, Sequence[int]]] = None,
+        max_pairs: int = 0,
+        time_budget: float = 0.0,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Verifies keywords against their cluster name. Kept keywords get the
+        cross-encoder score (mapped to 10-100) as matching_point; rejected
+        keyword dicts are returned separately. The cluster name keyword itself
+        is always kept and never scored.
+
+        With `candidates` (cluster key -> keyword positions) only those keywords
+        are checked, lowest matching_point first, up to `max_pairs` pairs and
+        `time_budget` seconds (0 = unlimited). Unchecked keywords are kept as
+        they are. Without `candidates` every pair is checked (strict mode).
+        `progress_callback(done, total)` is called as pairs are scored.
+        """
+        eligible = 0
+        pairs: List[Pair] = []
+        owners: List[Tuple[str, int]] = []
+        priorities: List[float] = []
+        for key, data in clusters.items():
+            name = data.get("cluster_name", key)
+            keywords = data["keywords"]
+            eligible += sum(1 for kw in keywords if kw["text"] != name)
+            positions = range(len(keywords)) if candidates is None else candidates.get(key, ())
+            for j in positions:
+                kw = keywords[j]
+                if kw["text"] != name:
+                    pairs.append((name, kw["text"]))
+                    owners.append((key, j))
+                    priorities.append(kw.get("matching_point", 0.0))
+
+        if candidates is not None:
+            order = sorted(range(len(pairs)), key=priorities.__getitem__)
+            if max_pairs > 0:
+                order = order[:max_pairs]
+            pairs = [pairs[i] for i in order]
+            owners = [owners[i] for i in order]
+
+        scores = self._score_within_budget(pairs, time_budget if candidates is not None else 0.0, stats, progress_callback)
+        pair_scores: Dict[str, Dict[int, float]] = {}
+        for (key, j), score in zip(owners, scores):
+            pair_scores.setdefault(key, {})[j] = score
+
+        rejected_keywords: List[Dict[str, Any]] = []
+        refined_clusters: Dict[str, Dict[str, Any]] = {}
+        for key, data in clusters.items():
+            keywords = data["keywords"]
+            if not keywords:
+                continue
+            cluster_scores = pair_scores.get(key, {})
+            valid_keywords = []
+            for j, kw in enumerate(keywords):
+                score = cluster_scores.get(j)
+                if score is None:
+                    valid_keywords.append(kw)
+                elif score > min_score:
+                    # Normalize roughly to 10-100 for display
+                    kw["matching_point"] = round(max(10.0, min(100.0, (score + 4) * 10)), 1)
+                    valid_keywords.append(kw)
+                else:
+                    rejected_keywords.append(kw)
+
+            if valid_keywords:
+                data["keywords"] = valid_keywords
+                data["total_volume_topic"] = sum(k["volume"] for k in valid_keywords)
+                refined_clusters[key] = data
+
+        if stats is not None:
+            stats["mode"] = "strict" if candidates is None else "gated"
+            stats["eligible_pairs"] = stats.get("eligible_pairs", 0) + eligible
+            stats["checked_pairs"] = stats.get("checked_pairs", 0) + len(scores)
+            stats["skipped_pairs"] = stats.get("skipped_pairs", 0) + eligible - len(scores)
+            stats["rejected"] = stats.get("rejected", 0) + len(rejected_keywords)
+        return refined_clusters, rejected_keywords
+
+    def _score_within_budget(
+        self,
+        pairs: List[Pair],
+        time_budget: float,
+        stats: Optional[Dict[str, Any]],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ) -> List[float]:
+        """
+        Scores pairs in order. With a time budget, pairs are scored in rounds
+        and scoring stops once the budget is spent; the result then covers only
+        a prefix of `pairs`. With a progress callback, pairs are scored in
+        rounds too, so progress can be reported between them.
+        """
+        if not pairs:
+            return []
+        if time_budget <= 0 and progress_callback is None:
+            return self.score_pairs(pairs, stats=stats).tolist()
+
+        deadline = time.perf_counter() + time_budget if time_budget > 0 else None
+        round_size = max(1, self.batch_size * 4)
+        scores: List[float] = []
+        for start in range(0, len(pairs), round_size):
+            if deadline is not None and time.perf_counter() >= deadline:
+                if stats is not None:
+                    stats["budget_exhausted"] = True
+                break
+            scores.extend(self.score_pairs(pairs[start:start + round_size], stats=stats).tolist())
+            if progress_callback is not None:
+                progress_callback(len(scores), len(pairs))
+        return scores
+
+
+def select_uncertain(
+    clusters: Dict[str, Dict[str, Any]],
+    cluster_rows: Dict[str, List[int]],
+    flagged_rows: np.ndarray,
+    min_matching_point: float,
+) -> Dict[str, List[int]]:
+    """
+    Keyword positions per cluster key that need a cross-encoder check: bi-encoder
+    matching_point below `min_matching_point`, or a row flagged upstream
+    (small margin to the runner-up cluster, reassigned noise).
+    """
+    candidates: Dict[str, List[int]] = {}
+    for key, data in clusters.items():
+        rows = cluster_rows.get(key)
+        if rows is None:
+            continue
+        positions = [
+            j for j, (kw, row) in enumerate(zip(data["keywords"], rows))
+            if kw["matching_point"] < min_matching_point or flagged_rows[row]
+        ]
+        if positions:
+            candidates[key] = positions
+    return candidates
+
+
+_refiner: Optional[CrossEncoderRefiner] = None
+_refiner_failed = False
+_refiner_lock = threading.Lock()
+
+
+def get_refiner() -> Optional[CrossEncoderRefiner]:
+    """
+    Returns the process-wide refiner, loading the cross-encoder on first use.
+    Returns None if the model cannot be loaded (the failure is not retried on
+    every request).
+    """
+    global _refiner, _refiner_failed
+    if _refiner is None and not _refiner_failed:
+        with _refiner_lock:
+            if _refiner is None and not _refiner_failed:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    from keyword_cluster_app.model import _detect_device
+
+                    device = _detect_device()
+                    logger.info(f"Loading Cross-Encoder {CROSS_ENCODER_MODEL} on {device}...")
+                    _refiner = CrossEncoderRefiner(CrossEncoder(CROSS_ENCODER_MODEL, device=device))
+                except Exception as e:
+                    logger.error(f"Failed to load Cross-Encoder: {e}. Refinement will be skipped.")
+                    _refiner_failed = True
+    return _refiner
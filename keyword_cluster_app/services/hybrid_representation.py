@@ -0,0 +1,278 @@
+"""
+Hybrid semantic + lexical representation for clustering.
+
+The dense (normalized embeddings) and lexical (TF-IDF) parts are kept as two
+separate matrices instead of stacking the dense block into a CSR matrix. The
+hybrid similarity of two keywords is
+
+    w * dot(dense_i, dense_j) + (1 - w) * dot(lexical_i, lexical_j)
+
+with w = HYBRID_SEMANTIC_WEIGHT, i.e. the cosine of [sqrt(w)*dense | sqrt(1-w)*lexical].
+Neighbour search computes it chunk by chunk as a dense matrix product plus a
+sparse one. The lexical block is the word 1-2-gram TF-IDF by default; "hashed"
+and "svd" modes give it a fixed width regardless of corpus vocabulary.
+"""
+import logging
+from typing import Any, Optional, Tuple, Union
+
+import numpy as np
+
+from keyword_cluster_app.config import (
+    HYBRID_SEMANTIC_WEIGHT,
+    HYBRID_LEXICAL_MODE,
+    HYBRID_HASH_FEATURES,
+    HYBRID_SVD_COMPONENTS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one (rows x n) similarity block
+_MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def _normalize_rows(matrix: Any) -> Any:
+    from sklearn.preprocessing import normalize
+    return normalize(matrix, copy=True)
+
+
+class HybridRepresentation:
+    """
+    Dense block (n, d) and optional lexical block (n, m), both row-normalized,
+    combined with `semantic_weight` at similarity time. The lexical block may
+    be a CSR matrix or a dense array.
+    """
+
+    def __init__(self, dense: np.ndarray, lexical: Any = None, semantic_weight: float = HYBRID_SEMANTIC_WEIGHT, lexical_encoder: Any = None):
+        self.lexical_encoder = lexical_encoder
+        self.dense = np.ascontiguousarray(_normalize_rows(np.asarray(dense, dtype=np.float32)), dtype=np.float32)
+        self.semantic_weight = 1.0 if lexical is None else float(semantic_weight)
+        self.lexical = None
+        if lexical is not None:
+            from scipy.sparse import issparse
+
+            lexical = _normalize_rows(lexical)
+            self.lexical = lexical.tocsr().astype(np.float32) if issparse(lexical) else np.ascontiguousarray(lexical, dtype=np.float32)
+
+    @property
+    def n_rows(self) -> int:
+        return self.dense.shape[0]
+
+    @property
+    def lexical_is_sparse(self) -> bool:
+        from scipy.sparse import issparse
+        return self.lexical is not None and issparse(self.lexical)
+
+    def config_key(self) -> str:
+        """Describes the weighting and lexical block (for artifact fingerprints)."""
+        if self.lexical is None:
+            return "dense"
+        kind = "sparse" if self.lexical_is_sparse else "dense"
+        return f"w={self.semantic_weight:.4f}|lexical={kind}:{self.lexical.shape[1]}"
+
+    def similarity(self, rows: slice) -> np.ndarray:
+        """Hybrid similarity of rows[start:stop] with every row, shape (rows, n)."""
+        w = self.semantic_weight
+        sims = self.dense[rows] @ self.dense.T
+        if self.lexical is None:
+            return sims
+        sims *= w
+        if self.lexical_is_sparse:
+            lexical = (self.lexical[rows] @ self.lexical.T).tocoo()
+            sims[lexical.row, lexical.col] += (1.0 - w) * lexical.data
+        else:
+            sims += (1.0 - w) * (self.lexical[rows] @ self.lexical.T)
+        return sims
+
+    def pair_similarity(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Hybrid similarity of each (rows[i], cols[i]) pair."""
+        sims = np.einsum("ij,ij->i", self.dense[rows], self.dense[cols])
+        if self.lexical is None:
+            return sims
+        if self.lexical_is_sparse:
+            lexical = np.asarray(self.lexical[rows].multiply(self.lexical[cols]).sum(axis=1)).ravel()
+        else:
+            lexical = np.einsum("ij,ij->i", self.lexical[rows], self.lexical[cols])
+        return self.semantic_weight * sims + (1.0 - self.semantic_weight) * lexical
+
+    def transform(self, embeddings: np.ndarray, lexical_texts: Any) -> "HybridRepresentation":
+        """
+        Representation of new keywords in this representation's space (same
+        weighting, lexical block from the fitted encoder). Without an encoder
+        only the dense block is used.
+        """
+        if self.lexical is None or self.lexical_encoder is None:
+            return HybridRepresentation(embeddings)
+        return HybridRepresentation(embeddings, self.lexical_encoder.transform(lexical_texts), self.semantic_weight)
+
+    def similarity_to(self, queries: "HybridRepresentation") -> np.ndarray:
+        """Hybrid similarity of each query row with every row, shape (queries, n)."""
+        sims = queries.dense @ self.dense.T
+        if self.lexical is None or queries.lexical is None:
+            return sims
+        sims *= self.semantic_weight
+        lexical = queries.lexical @ self.lexical.T
+        if self.lexical_is_sparse:
+            lexical = lexical.tocoo()
+            sims[lexical.row, lexical.col] += (1.0 - self.semantic_weight) * lexical.data
+        else:
+            sims += (1.0 - self.semantic_weight) * lexical
+        return sims
+
+    def query_knn(self, queries: "HybridRepresentation", n_neighbors: int, max_chunk_bytes: int = _MAX_CHUNK_BYTES) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The n_neighbors rows most similar to each query, chunked over queries.
+        Returns (indices, similarities), most similar first.
+        """
+        m, n = queries.n_rows, self.n_rows
+        k = min(n_neighbors, n)
+        indices = np.empty((m, k), dtype=np.int64)
+        sims_out = np.empty((m, k), dtype=np.float32)
+        chunk_rows = max(1, max_chunk_bytes // (max(n, 1) * 4))
+        for start in range(0, m, chunk_rows):
+            stop = min(start + chunk_rows, m)
+            sims = self.similarity_to(queries.rows(slice(start, stop)))
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k] if k < n else np.tile(np.arange(n), (stop - start, 1))
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1, kind="stable")
+            indices[start:stop] = np.take_along_axis(top, order, axis=1)
+            sims_out[start:stop] = np.take_along_axis(top_sims, order, axis=1)
+        return indices, sims_out
+
+    def rows(self, rows: Any) -> "HybridRepresentation":
+        """Subset of rows (already normalized, so no re-normalization is needed)."""
+        subset = HybridRepresentation.__new__(HybridRepresentation)
+        subset.lexical_encoder = self.lexical_encoder
+        subset.semantic_weight = self.semantic_weight
+        subset.dense = self.dense[rows]
+        subset.lexical = None if self.lexical is None else self.lexical[rows]
+        return subset
+
+    def stacked(self) -> Union[np.ndarray, Any]:
+        """
+        [sqrt(w)*dense | sqrt(1-w)*lexical]: one matrix whose cosine equals the
+        hybrid similarity. Dense when the lexical block is dense, CSR otherwise.
+        """
+        if self.lexical is None:
+            return self.dense
+        a, b = np.sqrt(self.semantic_weight), np.sqrt(1.0 - self.semantic_weight)
+        if self.lexical_is_sparse:
+            from scipy.sparse import csr_matrix, hstack
+            return hstack([csr_matrix(a * self.dense), b * self.lexical]).tocsr()
+        return np.hstack([a * self.dense, b * self.lexical]).astype(np.float32, copy=False)
+
+    def candidate_matrix(self) -> np.ndarray:
+        """
+        Dense matrix for approximate candidate search: the stacked matrix when
+        the lexical block is dense, otherwise the weighted dense block alone
+        (candidates are then re-ranked with the exact hybrid similarity).
+        """
+        if self.lexical is None or not self.lexical_is_sparse:
+            return self.stacked()
+        return self.dense
+
+    def umap_input(self, has_precomputed_knn: bool) -> Union[np.ndarray, Any]:
+        """
+        Matrix handed to UMAP. With a precomputed kNN graph UMAP only uses the
+        data to place disconnected components, so a sparse lexical block is not
+        stacked; without one, UMAP needs the full stacked matrix.
+        """
+        if has_precomputed_knn and self.lexical_is_sparse:
+            return self.dense
+        return self.stacked()
+
+    def exact_knn(self, n_neighbors: int, max_chunk_bytes: int = _MAX_CHUNK_BYTES) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact hybrid kNN, computed chunk by chunk (memory bounded by
+        `max_chunk_bytes`). Returns (indices, cosine distances), nearest first,
+        each row listing itself first at distance 0.
+        """
+        n = self.n_rows
+        k = min(n_neighbors, n)
+        indices = np.empty((n, k), dtype=np.int32)
+        distances = np.empty((n, k), dtype=np.float32)
+        chunk_rows = max(1, max_chunk_bytes // (n * 4))
+
+        for start in range(0, n, chunk_rows):
+            stop = min(start + chunk_rows, n)
+            sims = self.similarity(slice(start, stop))
+            local = np.arange(stop - start)
+            sims[local, local + start] = np.inf  # self first
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k] if k < n else np.tile(np.arange(n), (stop - start, 1))
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1, kind="stable")
+            indices[start:stop] = np.take_along_axis(top, order, axis=1)
+            distances[start:stop] = 1.0 - np.take_along_axis(top_sims, order, axis=1)
+
+        distances[:, 0] = 0.0
+        np.clip(distances, 0.0, 2.0, out=distances)
+        return indices, distances
+
+    def rerank(self, candidates: np.ndarray, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Keeps the n_neighbors best of each row's candidate indices (n, c) by
+        exact hybrid similarity. Self is always kept first.
+        """
+        n, c = candidates.shape
+        rows = np.repeat(np.arange(n), c)
+        sims = self.pair_similarity(rows, candidates.ravel()).reshape(n, c)
+        sims[candidates == np.arange(n)[:, None]] = np.inf
+        order = np.argsort(-sims, axis=1, kind="stable")[:, :n_neighbors]
+        indices = np.take_along_axis(candidates, order, axis=1).astype(np.int32, copy=False)
+        distances = 1.0 - np.take_along_axis(sims, order, axis=1).astype(np.float32)
+        distances[:, 0] = 0.0
+        return indices, np.clip(distances, 0.0, 2.0)
+
+
+def fit_lexical_encoder(lexical_texts: Any, mode: str = HYBRID_LEXICAL_MODE) -> Tuple[Any, Any]:
+    """
+    Fits the lexical feature extractor and returns (encoder, lexical block).
+    `encoder.transform(texts)` maps new keywords into the same space:
+    - "tfidf": word 1-2-gram TF-IDF (sparse, width = vocabulary)
+    - "hashed": hashed 1-2-grams with TF-IDF weighting (sparse, HYBRID_HASH_FEATURES wide)
+    - "svd": TF-IDF compressed to HYBRID_SVD_COMPONENTS dense columns
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.pipeline import make_pipeline
+
+    if mode == "hashed":
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+
+        encoder = make_pipeline(
+            HashingVectorizer(n_features=HYBRID_HASH_FEATURES, analyzer='word', ngram_range=(1, 2), alternate_sign=False, norm=None),
+            TfidfTransformer(),
+        )
+        return encoder, encoder.fit_transform(lexical_texts)
+
+    vectorizer = TfidfVectorizer(min_df=1, analyzer='word', ngram_range=(1, 2))
+    tfidf_matrix = vectorizer.fit_transform(lexical_texts)
+    if mode == "svd":
+        from sklearn.decomposition import TruncatedSVD
+
+        n_components = min(HYBRID_SVD_COMPONENTS, tfidf_matrix.shape[1] - 1, tfidf_matrix.shape[0] - 1)
+        if n_components >= 2:
+            svd = TruncatedSVD(n_components=n_components, random_state=42)
+            return make_pipeline(vectorizer, svd), svd.fit_transform(tfidf_matrix)
+        logger.info("Lexical vocabulary too small for SVD, keeping the TF-IDF block.")
+    elif mode != "tfidf":
+        logger.warning(f"Unknown HYBRID_LEXICAL_MODE '{mode}', using 'tfidf'.")
+    return vectorizer, tfidf_matrix
+
+
+def build_lexical_block(lexical_texts: Any, mode: str = HYBRID_LEXICAL_MODE) -> Any:
+    """Lexical features of the keywords (see `fit_lexical_encoder` for the modes)."""
+    return fit_lexical_encoder(lexical_texts, mode)[1]
+
+
+def build_hybrid_representation(
+    embeddings: np.ndarray,
+    lexical_texts: Any,
+    semantic_weight: Optional[float] = None,
+    lexical_mode: Optional[str] = None,
+) -> HybridRepresentation:
+    encoder, lexical = fit_lexical_encoder(lexical_texts, lexical_mode or HYBRID_LEXICAL_MODE)
+    return HybridRepresentation(
+        embeddings,
+        lexical,
+        HYBRID_SEMANTIC_WEIGHT if semantic_weight is None else semantic_weight,
+        lexical_encoder=encoder,
+    )
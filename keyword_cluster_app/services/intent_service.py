@@ -1,11 +1,152 @@
+import hashlib
+import os
 import re
+import threading
+import unicodedata
 import numpy as np
-from typing import Dict, List, Any, Tuple, Optional
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import Callable, Dict, List, Any, Tuple, Optional
 import logging
 
+from keyword_cluster_app.config import ENABLE_EMBEDDING_STORE, EMBEDDING_STORE_PATH
+from keyword_cluster_app.embedding_store import store_model_key
+from keyword_cluster_app.encoding_scheduler import encode_bucketed
+
 logger = logging.getLogger(__name__)
 
+# Unmatched keywords scored against the intent prototypes per matrix product
+SEMANTIC_CHUNK_ROWS = 8192
+
+# Minimum cosine similarity to the nearest prototype for a semantic intent
+SEMANTIC_THRESHOLD = 0.4
+
+_prototypes: Dict[str, Tuple[List[Tuple[str, str]], np.ndarray]] = {}
+_prototypes_lock = threading.Lock()
+
+
+def _prototype_path(model_key: str) -> Optional[str]:
+    """Prototype vectors of a model are persisted next to the embedding store (None when it is disabled)."""
+    if not ENABLE_EMBEDDING_STORE:
+        return None
+    digest = hashlib.sha1(model_key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.dirname(EMBEDDING_STORE_PATH) or ".", f"intent_prototypes_{digest}.npz")
+
+
+def get_prototype_embeddings(prototypes: Dict[Tuple[str, str], str], model) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+    """
+    (main, sub) keys and normalized prototype vectors for the active model,
+    cached per process and persisted next to the embedding store, so they are
+    encoded once per model rather than once per request. A persisted file is
+    only used if it holds the same prototype texts for the same model.
+    """
+    model_key = store_model_key()
+    cached = _prototypes.get(model_key)
+    if cached is not None:
+        return cached
+
+    with _prototypes_lock:
+        if model_key in _prototypes:
+            return _prototypes[model_key]
+        keys = list(prototypes.keys())
+        texts = [prototypes[key] for key in keys]
+        path = _prototype_path(model_key)
+        vectors = None
+        if path is not None and os.path.exists(path):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    if str(data["model"]) == model_key and data["texts"].tolist() == texts:
+                        vectors = data["vectors"].astype(np.float32)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable intent prototype file {path}: {e}")
+        if vectors is None:
+            logger.info("Calculating intent prototype embeddings...")
+            encode_stats: Dict[str, Any] = {}
+            vectors = encode_bucketed(model, texts, normalize_embeddings=True, stats=encode_stats)
+            logger.info(f"Intent prototypes encoded in {encode_stats.get('batches', 0)} batches (padding ratio {encode_stats.get('padding_ratio', 0.0)}).")
+            if path is not None:
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.tmp.npz"
+                    np.savez(tmp_path, model=np.array(model_key), texts=np.array(texts), vectors=vectors)
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    logger.warning(f"Could not persist intent prototypes to {path}: {e}")
+        _prototypes[model_key] = (keys, vectors)
+    return _prototypes[model_key]
+
+
+class IntentMatcher:
+    """
+    Intent patterns compiled into a word-level trie, matched as whole words
+    or phrases ("hay" no longer matches inside "thay", nor "giá" inside "giáo").
+
+    A keyword is split into words once; matching walks the trie from every
+    word and keeps the highest-priority pattern found (main intent, then
+    sub-intent, in INTENT_PATTERNS order) - the same result as trying each
+    pattern in priority order, in one pass over the words.
+    """
+
+    _WORDS = re.compile(r"\w+|\n")
+
+    def __init__(self, patterns: Dict[str, Dict[str, List[str]]]):
+        self.labels: List[Tuple[str, str]] = []
+        # word -> (label of the phrase ending here or None, children)
+        self.trie: Dict[str, list] = {}
+        for main_intent, sub_intents in patterns.items():
+            for sub_intent, sub_patterns in sub_intents.items():
+                label = len(self.labels)
+                self.labels.append((main_intent, sub_intent))
+                for pattern in sub_patterns:
+                    words = self._WORDS.findall(unicodedata.normalize("NFC", pattern.lower()))
+                    if not words or " ".join(words) != pattern.lower():
+                        raise ValueError(f"Intent pattern '{pattern}' must be plain words separated by spaces")
+                    children = self.trie
+                    for word in words[:-1]:
+                        children = children.setdefault(word, [None, {}])[1]
+                    node = children.setdefault(words[-1], [None, {}])
+                    if node[0] is None:  # first (highest-priority) owner wins
+                        node[0] = label
+
+    def _best(self, words: List[str], start: int, end: int) -> int:
+        best = -1
+        trie = self.trie
+        for i in range(start, end):
+            node = trie.get(words[i])
+            j = i + 1
+            while node is not None:
+                if node[0] is not None and (best < 0 or node[0] < best):
+                    best = node[0]
+                if j >= end or not node[1]:
+                    break
+                node = node[1].get(words[j])
+                j += 1
+            if best == 0:
+                break
+        return best
+
+    def match(self, keyword: str) -> Optional[Tuple[str, str]]:
+        """(main intent, sub-intent) of the best matching pattern, or None."""
+        words = self._WORDS.findall(unicodedata.normalize("NFC", keyword.lower()))
+        best = self._best(words, 0, len(words))
+        return None if best < 0 else self.labels[best]
+
+    def match_many(self, keywords: List[str]) -> np.ndarray:
+        """
+        Label index per keyword (into `labels`, -1 = no match). The column is
+        lower-cased and split into words in one regex scan (keywords joined
+        by newlines), then matched word by word.
+        """
+        column = unicodedata.normalize("NFC", "\n".join(kw.replace("\n", " ") for kw in keywords).lower())
+        words = self._WORDS.findall(column)
+        words.append("\n")
+        best = []
+        start = 0
+        for _ in range(len(keywords)):
+            end = words.index("\n", start)
+            best.append(self._best(words, start, end))
+            start = end + 1
+        return np.array(best, dtype=np.int64)
+
+
 class IntentService:
     """
     Service to classify search intent of keywords using Hybrid approach (Regex + Semantic).
@@ -70,54 +211,78 @@ class IntentService:
         ("NAVIGATIONAL", "DOWNLOAD"): "tải download ứng dụng"
     }
 
-    def __init__(self):
-        self.prototype_embeddings = None
-        self.prototype_keys = [] # List of (Main, Sub) tuples corresponding to embeddings
-
-    def _ensure_prototypes_loaded(self, model):
-        """Lazy load prototype embeddings using the provided model."""
-        if self.prototype_embeddings is None and model is not None:
-            logger.info("Calculating intent prototype embeddings...")
-            texts = list(self.INTENT_PROTOTYPES.values())
-            self.prototype_keys = list(self.INTENT_PROTOTYPES.keys())
-            self.prototype_embeddings = model.encode(texts, show_progress_bar=False, normalize_embeddings=True)
+    _matcher: Optional[IntentMatcher] = None
 
     def classify(self, keyword: str, embedding: Optional[np.ndarray] = None, model = None) -> Dict[str, str]:
         """
         Classifies a single keyword.
         Returns dict with 'intent' and 'sub_intent'.
         """
-        keyword_lower = keyword.lower()
-        
         # 1. Regex Classification (Priority)
-        for main_intent, sub_intents in self.INTENT_PATTERNS.items():
-            for sub_intent, patterns in sub_intents.items():
-                for pattern in patterns:
-                    if re.search(pattern, keyword_lower):
-                        return {"intent": main_intent, "sub_intent": sub_intent}
-        
+        matched = self.matcher().match(keyword)
+        if matched is not None:
+            return {"intent": matched[0], "sub_intent": matched[1]}
+
         # 2. Semantic Classification (Fallback)
-        if embedding is not None and model is not None:
-            self._ensure_prototypes_loaded(model)
-            if self.prototype_embeddings is not None:
-                # Calculate similarity
-                sims = cosine_similarity([embedding], self.prototype_embeddings).flatten()
-                best_idx = np.argmax(sims)
-                best_score = sims[best_idx]
-                
-                # Threshold for semantic match (adjust as needed)
-                if best_score > 0.4: 
-                    main, sub = self.prototype_keys[best_idx]
-                    return {"intent": main, "sub_intent": sub}
-
-        return {"intent": "UNCATEGORIZED", "sub_intent": "NONE"}
-
-    def classify_batch(self, keywords: List[str], embeddings: Optional[np.ndarray] = None, model = None) -> List[Dict[str, str]]:
+        return self._classify_semantic(embedding, model)
+
+    @classmethod
+    def matcher(cls) -> IntentMatcher:
+        """The compiled INTENT_PATTERNS matcher, built once per process."""
+        if cls._matcher is None:
+            cls._matcher = IntentMatcher(cls.INTENT_PATTERNS)
+        return cls._matcher
+
+    def _classify_semantic(self, embedding: Optional[np.ndarray], model) -> Dict[str, str]:
+        """Nearest intent prototype above the similarity threshold, else UNCATEGORIZED."""
+        if embedding is None or model is None:
+            return {"intent": "UNCATEGORIZED", "sub_intent": "NONE"}
+        return self._classify_semantic_many(np.asarray(embedding)[None, :], model)[0]
+
+    def _classify_semantic_many(self, embeddings: np.ndarray, model) -> List[Dict[str, str]]:
+        """Semantic intents for a block of embeddings: one product with the prototype matrix, argmax, threshold."""
+        keys, prototypes = get_prototype_embeddings(self.INTENT_PROTOTYPES, model)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        sims = embeddings @ prototypes.T
+        # Cosine similarity: prototypes are normalized, rows are divided by their norms
+        sims /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        best = np.argmax(sims, axis=1)
+        best_scores = sims[np.arange(len(best)), best]
+        results = [{"intent": main, "sub_intent": sub} for main, sub in keys]
+        return [
+            dict(results[b]) if score > SEMANTIC_THRESHOLD else {"intent": "UNCATEGORIZED", "sub_intent": "NONE"}
+            for b, score in zip(best.tolist(), best_scores.tolist())
+        ]
+
+    def classify_batch(self, keywords: List[str], embeddings: Optional[np.ndarray] = None, model = None, progress_callback: Optional[Callable[[int, int], None]] = None) -> List[Dict[str, str]]:
         """
-        Classifies a batch of keywords.
+        Classifies a batch of keywords: one regex pass over the whole batch,
+        then the keywords no pattern matched are scored against the intent
+        prototypes in blocks of SEMANTIC_CHUNK_ROWS, written back in place.
+        `progress_callback(done, total)` is called after the regex pass and
+        after each block.
         """
-        results = []
-        for i, kw in enumerate(keywords):
-            emb = embeddings[i] if embeddings is not None else None
-            results.append(self.classify(kw, emb, model))
+        n = len(keywords)
+        matcher = self.matcher()
+        labels = matcher.match_many(list(keywords))
+        label_results = [{"intent": main, "sub_intent": sub} for main, sub in matcher.labels]
+        results = [
+            dict(label_results[label]) if label >= 0 else {"intent": "UNCATEGORIZED", "sub_intent": "NONE"}
+            for label in labels.tolist()
+        ]
+
+        unmatched = np.flatnonzero(labels < 0)
+        done = n - len(unmatched)
+        if progress_callback is not None:
+            progress_callback(done, n)
+        if embeddings is None or model is None:
+            return results
+
+        for start in range(0, len(unmatched), SEMANTIC_CHUNK_ROWS):
+            rows = unmatched[start:start + SEMANTIC_CHUNK_ROWS]
+            for row, result in zip(rows.tolist(), self._classify_semantic_many(embeddings[rows], model)):
+                results[row] = result
+            done += len(rows)
+            if progress_callback is not None:
+                progress_callback(done, n)
         return results
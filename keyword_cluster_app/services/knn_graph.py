@@ -0,0 +1,203 @@
+"""
+Shared cosine kNN graph over the hybrid (semantic + lexical) representation.
+
+The graph is built once per job, using all cores, and reused by:
+- UMAP, as `precomputed_knn`, so it does not search neighbours itself;
+- noise reassignment, which only considers clusters present among a noise
+  keyword's neighbours;
+- the "similar keywords" lookup of the API.
+
+Graphs are stored as job artifacts under KNN_GRAPH_DIR, keyed by a fingerprint
+of the input (embeddings, lexical texts, hybrid weighting, k), so re-running the same keywords at
+another level loads the graph instead of rebuilding it.
+"""
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from keyword_cluster_app.config import KNN_GRAPH_DIR, KNN_GRAPH_MAX_FILES
+from keyword_cluster_app.services.hybrid_representation import HybridRepresentation
+
+logger = logging.getLogger(__name__)
+
+# Up to this many rows neighbours are exact (chunked, memory-bounded)
+_EXACT_MAX_ROWS = 20000
+# Approximate search collects this many times n_neighbors candidates to re-rank
+_CANDIDATE_FACTOR = 2
+_FORMAT_VERSION = "2"
+
+
+class KnnGraph:
+    """
+    k nearest neighbours per row: indices (n, k) int32 and cosine distances
+    (n, k) float32, nearest first. Each row normally lists itself first.
+    """
+
+    def __init__(self, indices: np.ndarray, distances: np.ndarray, texts: Sequence[str], fingerprint: str):
+        self.indices = indices
+        self.distances = distances
+        self.texts = list(texts)
+        self.fingerprint = fingerprint
+        self._row_of_text: Optional[Dict[str, int]] = None
+
+    @property
+    def n_neighbors(self) -> int:
+        return self.indices.shape[1]
+
+    def for_umap(self, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, distances) trimmed to n_neighbors, as UMAP's precomputed_knn."""
+        return (
+            np.ascontiguousarray(self.indices[:, :n_neighbors]),
+            np.ascontiguousarray(self.distances[:, :n_neighbors]),
+        )
+
+    def neighbor_labels(self, labels: np.ndarray) -> np.ndarray:
+        """Label of every neighbour, shape (n, k)."""
+        return np.asarray(labels)[self.indices]
+
+    def similar(self, text: str, top_n: int = 10) -> List[Dict[str, Any]]:
+        """Nearest keywords to `text` (which must be a row of the graph), excluding itself."""
+        if self._row_of_text is None:
+            self._row_of_text = {t: i for i, t in reversed(list(enumerate(self.texts)))}
+        row = self._row_of_text.get(text)
+        if row is None:
+            return []
+        similar = []
+        seen = {text}
+        for j, dist in zip(self.indices[row].tolist(), self.distances[row].tolist()):
+            if self.texts[j] in seen:
+                continue
+            seen.add(self.texts[j])
+            similar.append({"text": self.texts[j], "similarity": round(1.0 - dist, 4)})
+            if len(similar) >= top_n:
+                break
+        return similar
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            indices=self.indices,
+            distances=self.distances,
+            texts=np.array(self.texts, dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str) -> "KnnGraph":
+        with np.load(path) as data:
+            return cls(data["indices"], data["distances"], data["texts"].tolist(), fingerprint)
+
+
+def graph_fingerprint(representation: HybridRepresentation, texts: Sequence[str], n_neighbors: int) -> str:
+    """Content hash of everything the graph depends on."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{_FORMAT_VERSION}|{n_neighbors}|{representation.config_key()}|{representation.dense.shape}|".encode())
+    h.update(representation.dense.data)
+    h.update("\x00".join(texts).encode("utf-8"))
+    return h.hexdigest()
+
+
+def build_knn(representation: HybridRepresentation, n_neighbors: int, random_state: int = 42, n_jobs: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hybrid cosine kNN of every row. Exact (chunked dense + sparse products) for
+    up to _EXACT_MAX_ROWS rows; otherwise NN-descent finds candidates on a
+    dense matrix and they are re-ranked with the exact hybrid similarity.
+    """
+    n = representation.n_rows
+    n_neighbors = min(n_neighbors, n)
+    if n <= _EXACT_MAX_ROWS:
+        return representation.exact_knn(n_neighbors)
+
+    from pynndescent import NNDescent
+
+    # Same construction parameters UMAP uses internally
+    index = NNDescent(
+        representation.candidate_matrix(),
+        metric="cosine",
+        n_neighbors=min(n, n_neighbors * _CANDIDATE_FACTOR),
+        n_trees=min(64, 5 + int(round(n ** 0.5 / 20.0))),
+        n_iters=max(5, int(round(np.log2(n)))),
+        max_candidates=60,
+        low_memory=True,
+        random_state=random_state,
+        n_jobs=n_jobs,
+        compressed=False,
+    )
+    candidates, _ = index.neighbor_graph
+    # UMAP takes the first non-zero distance as each point's local radius, so
+    # self-distances must be exactly 0 (rerank guarantees it)
+    return representation.rerank(candidates, n_neighbors)
+
+
+def _graph_path(fingerprint: str) -> str:
+    return os.path.join(KNN_GRAPH_DIR, f"{fingerprint}.npz")
+
+
+def load_knn_graph(fingerprint: str) -> Optional[KnnGraph]:
+    """Loads a stored graph by fingerprint, or None if it is not (or no longer) stored."""
+    path = _graph_path(fingerprint)
+    if not os.path.exists(path):
+        return None
+    try:
+        return KnnGraph.load(path, fingerprint)
+    except Exception as e:
+        logger.warning(f"Could not read kNN graph {path}: {e}")
+        return None
+
+
+def _prune_graph_dir() -> None:
+    try:
+        files = [os.path.join(KNN_GRAPH_DIR, f) for f in os.listdir(KNN_GRAPH_DIR) if f.endswith(".npz")]
+    except OSError:
+        return
+    if len(files) <= KNN_GRAPH_MAX_FILES:
+        return
+    files.sort(key=lambda f: os.path.getmtime(f))
+    for f in files[:len(files) - KNN_GRAPH_MAX_FILES]:
+        try:
+            os.remove(f)
+        except OSError:
+            pass
+
+
+def get_or_build_knn_graph(
+    representation: HybridRepresentation,
+    texts: Sequence[str],
+    n_neighbors: int,
+    stats: Optional[Dict[str, Any]] = None,
+) -> KnnGraph:
+    """
+    Returns the kNN graph of `representation`, loading it from the artifact directory
+    when the same input was seen before, otherwise building and storing it.
+    """
+    start = time.perf_counter()
+    fingerprint = graph_fingerprint(representation, texts, n_neighbors)
+    graph = load_knn_graph(fingerprint)
+    cached = graph is not None
+
+    if graph is None:
+        indices, distances = build_knn(representation, n_neighbors)
+        graph = KnnGraph(indices, distances, texts, fingerprint)
+        try:
+            os.makedirs(KNN_GRAPH_DIR, exist_ok=True)
+            graph.save(_graph_path(fingerprint))
+            _prune_graph_dir()
+        except OSError as e:
+            logger.warning(f"Could not store kNN graph: {e}")
+    else:
+        # Touch so pruning keeps recently used graphs
+        try:
+            os.utime(_graph_path(fingerprint))
+        except OSError:
+            pass
+
+    seconds = time.perf_counter() - start
+    logger.info(f"kNN graph ({len(texts)} x {graph.n_neighbors}) {'loaded from cache' if cached else 'built'} in {seconds:.2f}s.")
+    if stats is not None:
+        stats.update({"fingerprint": fingerprint, "n_neighbors": graph.n_neighbors, "cached": cached, "seconds": round(seconds, 3)})
+    return graph
@@ -0,0 +1,177 @@
+"""
+Near-duplicate keyword groups, collapsed to one row before UMAP/HDBSCAN.
+
+Two cleaned keywords are near-duplicates when
+- their accent-folded key is the same: stopwords dropped, diacritics and "đ"
+  folded, each number bound to the word before it, words sorted
+  ("hoc toan lop 5", "học toán lớp 5" and "lớp 5 học toán" share one key,
+  "toán lớp 6 bài 8" and "toán lớp 8 bài 6" do not), or
+- MinHash signatures of the keys' character shingles land in the same LSH
+  bucket and agree on at least `threshold` of their positions (estimated
+  Jaccard similarity), which catches typos and joined or split words.
+
+Keywords whose numbered words differ are never grouped ("lớp 5" vs "lớp 6"), and
+groups are closed transitively. Hashing is seeded and content-based, so the
+same keywords always give the same groups (stage artifacts rely on it).
+"""
+import logging
+import re
+import time
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from keyword_cluster_app.config import NEAR_DUPLICATE_BANDS, NEAR_DUPLICATE_NUM_PERM, NEAR_DUPLICATE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Function words dropped before folding (matched with their diacritics, so "cô" survives while "có" goes)
+STOPWORDS = frozenset({
+    "và", "của", "là", "có", "cho", "các", "những", "với", "về", "ở", "thì", "mà", "một", "cái", "này", "đó",
+    "nào", "nhé", "ạ",
+})
+
+SHINGLE_SIZE = 3
+
+_MARKS = re.compile(r"[\u0300-\u036f]")
+_FOLD = str.maketrans({"đ": "d", "Đ": "D"})
+_WORDS = re.compile(r"\w+")
+_PRIME = (1 << 31) - 1
+_MAX_CHUNK_SHINGLES = 1 << 16
+
+
+def fold_accents(texts: Sequence[str]) -> List[str]:
+    """Texts without diacritics ("học toán" -> "hoc toan"), folded in one pass over the column."""
+    column = unicodedata.normalize("NFD", "\n".join(text.replace("\n", " ") for text in texts))
+    folded = _MARKS.sub("", column).translate(_FOLD)
+    return folded.split("\n") if texts else []
+
+
+def folded_keys(texts: Sequence[str]) -> List[str]:
+    """
+    Comparison key per keyword: words minus stopwords (all kept if that leaves
+    none), accent-folded, numbers joined to the previous word ("lop5"), sorted.
+    """
+    kept = []
+    for text in texts:
+        words = _WORDS.findall(text)
+        kept.append(" ".join([w for w in words if w not in STOPWORDS] or words))
+    keys = []
+    for folded in fold_accents(kept):
+        tokens: List[str] = []
+        for word in folded.split():
+            if word.isdigit() and tokens:
+                tokens[-1] += word
+            else:
+                tokens.append(word)
+        keys.append(" ".join(sorted(tokens)))
+    return keys
+
+
+def minhash_signatures(keys: Sequence[str], num_perm: int = NEAR_DUPLICATE_NUM_PERM, seed: int = 0) -> np.ndarray:
+    """(n, num_perm) MinHash signatures of the character shingles of each key."""
+    shingle_hash: Dict[str, int] = {}
+    hashes: List[int] = []
+    indptr = [0]
+    for key in keys:
+        padded = f" {key} "
+        for i in range(max(1, len(padded) - SHINGLE_SIZE + 1)):
+            shingle = padded[i:i + SHINGLE_SIZE]
+            h = shingle_hash.get(shingle)
+            if h is None:
+                h = shingle_hash[shingle] = zlib.crc32(shingle.encode("utf-8")) % _PRIME
+            hashes.append(h)
+        indptr.append(len(hashes))
+
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+    values = np.asarray(hashes, dtype=np.uint64)
+    bounds = np.asarray(indptr, dtype=np.int64)
+    signatures = np.empty((len(keys), num_perm), dtype=np.uint64)
+    start = 0
+    while start < len(keys):
+        # Rows whose shingles fit in one bounded (shingles x num_perm) block
+        stop = max(start + 1, int(np.searchsorted(bounds, bounds[start] + _MAX_CHUNK_SHINGLES, side="right")) - 1)
+        stop = min(stop, len(keys))
+        block = (values[bounds[start]:bounds[stop], None] * a + b) % _PRIME
+        signatures[start:stop] = np.minimum.reduceat(block, bounds[start:stop] - bounds[start], axis=0)
+        start = stop
+    return signatures
+
+
+def _lsh_pairs(signatures: np.ndarray, number_keys: np.ndarray, bands: int, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Verified candidate pairs: each bucket member vs the bucket's first member, for every band."""
+    n, num_perm = signatures.shape
+    rows_per_band = max(1, num_perm // bands)
+    left: List[np.ndarray] = []
+    right: List[np.ndarray] = []
+    for start in range(0, rows_per_band * bands, rows_per_band):
+        band = np.column_stack([number_keys.astype(np.uint64), signatures[:, start:start + rows_per_band]])
+        _, first, bucket = np.unique(band, axis=0, return_index=True, return_inverse=True)
+        leader = first[bucket.ravel()]
+        candidates = np.flatnonzero(leader != np.arange(n))
+        if not len(candidates):
+            continue
+        agreement = (signatures[candidates] == signatures[leader[candidates]]).mean(axis=1)
+        keep = candidates[agreement >= threshold]
+        left.append(keep)
+        right.append(leader[keep])
+    if not left:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+
+def near_duplicate_groups(
+    texts: Sequence[str],
+    threshold: float = NEAR_DUPLICATE_THRESHOLD,
+    num_perm: int = NEAR_DUPLICATE_NUM_PERM,
+    bands: int = NEAR_DUPLICATE_BANDS,
+    stats: Optional[Dict[str, Any]] = None,
+) -> np.ndarray:
+    """
+    Group id per cleaned keyword (0..n_groups-1, numbered in order of first
+    appearance). `stats`, if given, receives the group counts and timing.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    start = time.perf_counter()
+    n = len(texts)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # 1. Exact accent-folded keys
+    keys = folded_keys(texts)
+    key_of_text: Dict[str, int] = {}
+    key_codes = np.fromiter((key_of_text.setdefault(key, len(key_of_text)) for key in keys), dtype=np.int64, count=n)
+    unique_keys = list(key_of_text)
+
+    # 2. MinHash/LSH over the distinct keys, only between keys with the same numbered words
+    number_of_key: Dict[Tuple[str, ...], int] = {}
+    number_keys = np.fromiter(
+        (number_of_key.setdefault(tuple(w for w in key.split() if w[-1].isdigit()), len(number_of_key)) for key in unique_keys),
+        dtype=np.int64, count=len(unique_keys),
+    )
+    signatures = minhash_signatures(unique_keys, num_perm)
+    left, right = _lsh_pairs(signatures, number_keys, bands, threshold)
+
+    m = len(unique_keys)
+    graph = coo_matrix((np.ones(len(left), dtype=np.int8), (left, right)), shape=(m, m))
+    _, key_groups = connected_components(graph, directed=False)
+    # Renumber by first appearance, independent of the graph traversal
+    _, first, inverse = np.unique(key_groups[key_codes], return_index=True, return_inverse=True)
+    groups = np.argsort(np.argsort(first, kind="stable"), kind="stable")[inverse.ravel()]
+
+    if stats is not None:
+        n_groups = int(groups.max()) + 1
+        stats.update({
+            "keywords": n,
+            "folded_keys": m,
+            "groups": n_groups,
+            "collapsed": n - n_groups,
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+    return groups
@@ -0,0 +1,177 @@
+"""
+Vectorized nearest-centroid engine used to force-assign HDBSCAN noise.
+
+Centroids are computed as segment means in one pass over the sorted labels,
+and similarities come from chunked matrix products over the L2-normalized
+embeddings, so memory stays bounded by `max_chunk_bytes` for any n.
+"""
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Confidence threshold: only assign noise if cosine similarity >= this value
+NOISE_CONFIDENCE_THRESHOLD = 0.65
+
+# Upper bound for one (rows x clusters) similarity block
+_MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def segment_centroids(embeddings: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean embedding per cluster label (noise excluded), L2-normalized.
+    Returns (cluster_ids, centroids) with centroids[i] belonging to cluster_ids[i].
+    """
+    labels = np.asarray(labels)
+    mask = labels >= 0
+    if not mask.any():
+        return np.empty(0, dtype=labels.dtype), np.empty((0, embeddings.shape[1]), dtype=np.float32)
+
+    cluster_ids, inverse = np.unique(labels[mask], return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    counts = np.bincount(inverse, minlength=len(cluster_ids))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    sums = np.add.reduceat(embeddings[mask][order].astype(np.float32, copy=False), starts, axis=0)
+    centroids = sums / counts[:, None]
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    centroids = centroids / np.clip(norms, 1e-12, None)
+    return cluster_ids, centroids.astype(np.float32, copy=False)
+
+
+def top2_centroids(
+    embeddings: np.ndarray,
+    centroids: np.ndarray,
+    max_chunk_bytes: int = _MAX_CHUNK_BYTES,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Best and second-best centroid per row by cosine similarity (rows assumed
+    L2-normalized). Returns (best_idx, best_sim, second_idx, second_sim);
+    second_idx is -1 and second_sim is -1.0 when there is only one centroid.
+    """
+    n, k = len(embeddings), len(centroids)
+    best_idx = np.full(n, -1, dtype=np.int64)
+    second_idx = np.full(n, -1, dtype=np.int64)
+    best_sim = np.full(n, -1.0, dtype=np.float32)
+    second_sim = np.full(n, -1.0, dtype=np.float32)
+    if n == 0 or k == 0:
+        return best_idx, best_sim, second_idx, second_sim
+
+    chunk_rows = max(1, max_chunk_bytes // (k * 4))
+    centroids_t = np.ascontiguousarray(centroids.T, dtype=np.float32)
+
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        sims = embeddings[start:stop].astype(np.float32, copy=False) @ centroids_t
+        rows = np.arange(stop - start)
+        if k == 1:
+            best_idx[start:stop] = 0
+            best_sim[start:stop] = sims[:, 0]
+            continue
+
+        top2 = np.argpartition(sims, k - 2, axis=1)[:, -2:]
+        top2_sims = sims[rows[:, None], top2]
+        swap = top2_sims[:, 0] > top2_sims[:, 1]
+        first = np.where(swap, top2[:, 0], top2[:, 1])
+        second = np.where(swap, top2[:, 1], top2[:, 0])
+
+        best_idx[start:stop] = first
+        second_idx[start:stop] = second
+        best_sim[start:stop] = sims[rows, first]
+        second_sim[start:stop] = sims[rows, second]
+
+    return best_idx, best_sim, second_idx, second_sim
+
+
+def best_neighbor_cluster(
+    embeddings: np.ndarray,
+    cluster_ids: np.ndarray,
+    centroids: np.ndarray,
+    neighbor_labels: np.ndarray,
+    max_chunk_bytes: int = _MAX_CHUNK_BYTES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each row, the most similar centroid among the clusters of its kNN
+    neighbours (`neighbor_labels`, shape (n, k), -1 = noise neighbour).
+    Returns (best_label, best_sim); -1 / -1.0 when no neighbour is clustered.
+    """
+    n, k = neighbor_labels.shape
+    best_label = np.full(n, -1, dtype=np.int64)
+    best_sim = np.full(n, -1.0, dtype=np.float32)
+    if n == 0 or len(cluster_ids) == 0:
+        return best_label, best_sim
+
+    positions = np.clip(np.searchsorted(cluster_ids, neighbor_labels), 0, len(cluster_ids) - 1)
+    valid = (neighbor_labels >= 0) & (cluster_ids[positions] == neighbor_labels)
+    chunk_rows = max(1, max_chunk_bytes // (k * centroids.shape[1] * 4))
+
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        rows = embeddings[start:stop].astype(np.float32, copy=False)
+        sims = np.einsum("id,ikd->ik", rows, centroids[positions[start:stop]])
+        sims = np.where(valid[start:stop], sims, -np.inf)
+        best = np.argmax(sims, axis=1)
+        top = sims[np.arange(stop - start), best]
+        found = np.isfinite(top)
+        best_label[start:stop] = np.where(found, neighbor_labels[start:stop][np.arange(stop - start), best], -1)
+        best_sim[start:stop] = np.where(found, top, -1.0)
+
+    return best_label, best_sim
+
+
+def reassign_noise(
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    threshold: float = NOISE_CONFIDENCE_THRESHOLD,
+    max_chunk_bytes: int = _MAX_CHUNK_BYTES,
+    neighbor_labels: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """
+    Assigns each noise row (-1) to its nearest cluster centroid when the cosine
+    similarity reaches `threshold`. With `neighbor_labels` (labels of each
+    row's kNN neighbours, from the shared kNN graph), a noise row may only
+    join a cluster that one of its neighbours belongs to.
+
+    Returns a dict with per-row arrays:
+    - labels: labels after reassignment
+    - reassigned: rows that moved from noise to a cluster
+    - best_label / best_similarity: nearest cluster and its similarity
+    - second_label / second_similarity: runner-up cluster (-1 / -1.0 if none)
+    - margin: best_similarity - second_similarity
+    """
+    labels = np.asarray(labels)
+    cluster_ids, centroids = segment_centroids(embeddings, labels)
+    best_idx, best_sim, second_idx, second_sim = top2_centroids(embeddings, centroids, max_chunk_bytes)
+
+    def _to_labels(idx: np.ndarray) -> np.ndarray:
+        out = np.full(len(idx), -1, dtype=labels.dtype)
+        valid = idx >= 0
+        out[valid] = cluster_ids[idx[valid]]
+        return out
+
+    best_label = _to_labels(best_idx)
+    new_labels = labels.copy()
+    if neighbor_labels is None:
+        reassigned = (labels == -1) & (best_label >= 0) & (best_sim >= threshold)
+        new_labels[reassigned] = best_label[reassigned]
+    else:
+        noise_rows = np.flatnonzero(labels == -1)
+        local_label, local_sim = best_neighbor_cluster(
+            embeddings[noise_rows], cluster_ids, centroids, np.asarray(neighbor_labels)[noise_rows], max_chunk_bytes
+        )
+        accept = (local_label >= 0) & (local_sim >= threshold)
+        reassigned = np.zeros(len(labels), dtype=bool)
+        reassigned[noise_rows[accept]] = True
+        new_labels[noise_rows[accept]] = local_label[accept]
+
+    return {
+        "labels": new_labels,
+        "reassigned": reassigned,
+        "best_label": best_label,
+        "best_similarity": best_sim,
+        "second_label": _to_labels(second_idx),
+        "second_similarity": second_sim,
+        "margin": best_sim - second_sim,
+    }
@@ -0,0 +1,309 @@
+"""
+Out-of-core pipeline for keyword files too large to hold in RAM.
+
+The input is read in chunks; each chunk is cleaned, encoded and classified,
+then spooled to disk (embeddings, volumes and intent codes as raw binary
+files read back through np.memmap, keyword texts as lines). UMAP/HDBSCAN run
+on a random sample of the rows; every row is then assigned to the nearest
+sample-cluster centroid in a streaming pass, and results are written to disk
+row by row. Chunk size and sample size come from a memory budget, so peak
+memory does not grow with the input size.
+"""
+import csv
+import heapq
+import json
+import logging
+import os
+import resource
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from keyword_cluster_app.config import (
+    EMBEDDING_CACHE_MAX_BYTES,
+    OUT_OF_CORE_MEMORY_BUDGET_MB,
+    OUT_OF_CORE_SAMPLE_SIZE,
+    OUT_OF_CORE_CHUNK_ROWS,
+)
+from keyword_cluster_app.model import get_embeddings
+from keyword_cluster_app.services.noise_assignment import top2_centroids, NOISE_CONFIDENCE_THRESHOLD
+from keyword_cluster_app.utils.file_io import iter_keyword_chunks
+from keyword_cluster_app.utils.text_processing import clean_keywords
+
+logger = logging.getLogger(__name__)
+
+# Embedding width assumed when sizing chunks before the first chunk is encoded
+_ASSUMED_DIM = 1024
+# Rough working memory per streamed row: pandas chunk, Python strings, float32 embedding copies
+_STREAM_BYTES_PER_ROW_BASE = 2048
+# Rough working memory per clustered sample row: TF-IDF, kNN graph, UMAP and HDBSCAN
+_CLUSTER_BYTES_PER_ROW = 24 * 1024
+_MIN_CHUNK_ROWS = 1000
+_MAX_CHUNK_ROWS = 200000
+_MIN_SAMPLE_SIZE = 1000
+
+KEYWORDS_FILE = "keywords.csv"
+CLUSTERS_FILE = "clusters.json"
+SUMMARY_FILE = "summary.json"
+
+
+def plan_memory(
+    memory_budget_mb: Optional[int] = None,
+    sample_size: Optional[int] = None,
+    chunk_rows: Optional[int] = None,
+    dim: int = _ASSUMED_DIM,
+) -> Dict[str, int]:
+    """
+    Splits the working-memory budget (on top of the loaded models and the
+    in-memory embedding cache): a quarter for one streamed chunk, half for
+    clustering the sample. Explicit `sample_size` / `chunk_rows` are capped
+    by the budget as well.
+    """
+    budget_mb = OUT_OF_CORE_MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+    budget = max(0, budget_mb * 1024 * 1024 - EMBEDDING_CACHE_MAX_BYTES)
+    sample_size = OUT_OF_CORE_SAMPLE_SIZE if sample_size is None else sample_size
+    chunk_rows = OUT_OF_CORE_CHUNK_ROWS if chunk_rows is None else chunk_rows
+
+    max_chunk_rows = int(budget * 0.25 // (dim * 4 * 3 + _STREAM_BYTES_PER_ROW_BASE))
+    if chunk_rows <= 0:
+        chunk_rows = max_chunk_rows
+    chunk_rows = max(_MIN_CHUNK_ROWS, min(chunk_rows, max_chunk_rows, _MAX_CHUNK_ROWS))
+    sample_size = max(_MIN_SAMPLE_SIZE, min(sample_size, int(budget * 0.5 // _CLUSTER_BYTES_PER_ROW)))
+    return {"memory_budget_mb": budget_mb, "chunk_rows": chunk_rows, "sample_size": sample_size}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (Linux reports KiB)."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class KeywordSpool:
+    """
+    Append-only on-disk store of keyword rows. Embeddings (float32), volumes
+    (int64) and intent codes (int16) are flat binary files; texts are one per
+    line. After `close()` the columns are read back as memory maps.
+    """
+
+    def __init__(self, work_dir: str):
+        os.makedirs(work_dir, exist_ok=True)
+        self.work_dir = work_dir
+        self.n = 0
+        self.dim: Optional[int] = None
+        self.intent_codes: Dict[Tuple[str, str], int] = {}
+        self._files = {
+            "embeddings": open(self._path("embeddings.f32"), "wb"),
+            "volumes": open(self._path("volumes.i64"), "wb"),
+            "intents": open(self._path("intents.i16"), "wb"),
+        }
+        self._texts = open(self._path("texts.txt"), "w", encoding="utf-8", newline="\n")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.work_dir, name)
+
+    def append(self, texts: Sequence[str], volumes: Sequence[int], embeddings: np.ndarray, intents: Sequence[Dict[str, str]]) -> None:
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        codes = np.fromiter(
+            (self.intent_codes.setdefault((i["intent"], i["sub_intent"]), len(self.intent_codes)) for i in intents),
+            dtype=np.int16, count=len(intents),
+        )
+        self._files["embeddings"].write(embeddings.tobytes())
+        self._files["volumes"].write(np.asarray(volumes, dtype=np.int64).tobytes())
+        self._files["intents"].write(codes.tobytes())
+        self._texts.writelines(t.replace("\r", " ").replace("\n", " ") + "\n" for t in texts)
+        self.n += len(texts)
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._texts.close()
+
+    def _memmap(self, name: str, dtype: Any, shape: Tuple[int, ...]) -> np.ndarray:
+        if self.n == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode="r", shape=shape)
+
+    def embeddings(self) -> np.ndarray:
+        return self._memmap("embeddings.f32", np.float32, (self.n, self.dim or 0))
+
+    def volumes(self) -> np.ndarray:
+        return self._memmap("volumes.i64", np.int64, (self.n,))
+
+    def intents(self) -> np.ndarray:
+        return self._memmap("intents.i16", np.int16, (self.n,))
+
+    def intent_names(self) -> List[Tuple[str, str]]:
+        names = [("", "")] * len(self.intent_codes)
+        for name, code in self.intent_codes.items():
+            names[code] = name
+        return names
+
+    def iter_texts(self, chunk_rows: int) -> Iterator[List[str]]:
+        with open(self._path("texts.txt"), "r", encoding="utf-8", newline="\n") as f:
+            chunk: List[str] = []
+            for line in f:
+                chunk.append(line[:-1])
+                if len(chunk) == chunk_rows:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    def read_texts(self, rows: np.ndarray) -> List[str]:
+        """Texts of the given rows (sorted ascending), in one sequential scan."""
+        wanted = iter(np.asarray(rows).tolist())
+        target = next(wanted, None)
+        texts = []
+        with open(self._path("texts.txt"), "r", encoding="utf-8", newline="\n") as f:
+            for i, line in enumerate(f):
+                if target is None:
+                    break
+                if i == target:
+                    texts.append(line[:-1])
+                    target = next(wanted, None)
+        return texts
+
+
+def spool_keywords(input_path: str, spool: KeywordSpool, chunk_rows: int, intent_service: Any, model: Any, stats: Optional[Dict[str, Any]] = None) -> KeywordSpool:
+    """
+    Streams the input file through cleaning, embedding (caches first) and
+    intent classification into `spool`, one chunk at a time. Duplicates are
+    encoded and classified once per chunk.
+    """
+    for texts, volumes in iter_keyword_chunks(input_path, chunk_rows=chunk_rows):
+        codes, unique_cleaned = pd.factorize(pd.Series(clean_keywords(texts)))
+        unique_cleaned = list(unique_cleaned)
+        chunk_stats: Dict[str, Any] = {}
+        unique_embeddings = get_embeddings(unique_cleaned, batch_size=512, show_progress_bar=False, normalize_embeddings=True, stats=chunk_stats)
+        if unique_embeddings is None:
+            raise RuntimeError("Embedding model is not loaded")
+        unique_intents = intent_service.classify_batch(unique_cleaned, unique_embeddings, model)
+        spool.append(texts, volumes, unique_embeddings[codes], [unique_intents[c] for c in codes])
+        if stats is not None:
+            for key in ("memory_hits", "store_hits", "misses"):
+                stats[key] = stats.get(key, 0) + chunk_stats.get(key, 0)
+        logger.info(f"Spooled {spool.n} keywords (peak RSS {peak_rss_mb()} MB).")
+    spool.close()
+    return spool
+
+
+def choose_sample(n: int, sample_size: int, seed: int = 42) -> np.ndarray:
+    """Sorted row indices of a uniform random sample (all rows if n <= sample_size)."""
+    if n <= sample_size:
+        return np.arange(n)
+    return np.sort(np.random.default_rng(seed).choice(n, size=sample_size, replace=False))
+
+
+def assign_and_write(
+    spool: KeywordSpool,
+    sample_rows: np.ndarray,
+    sample_labels: np.ndarray,
+    cluster_ids: np.ndarray,
+    centroids: np.ndarray,
+    output_dir: str,
+    chunk_rows: int,
+    threshold: float = NOISE_CONFIDENCE_THRESHOLD,
+) -> Dict[str, Any]:
+    """
+    Streaming assignment and output. Sample rows keep their clustered label;
+    every other row joins its nearest centroid when the cosine similarity
+    reaches `threshold`, otherwise it is noise (a singleton cluster, as in the
+    in-memory pipeline).
+
+    Pass 1 assigns labels and accumulates per-cluster volume, size and name
+    keyword (highest volume, first in input order). Pass 2 writes one CSV row
+    per keyword with its cluster name and matching_point (similarity to the
+    name keyword). Writes keywords.csv and clusters.json to `output_dir` and
+    returns the summary.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n = spool.n
+    embeddings, volumes = spool.embeddings(), spool.volumes()
+    k = len(cluster_ids)
+    labels = np.lib.format.open_memmap(os.path.join(spool.work_dir, "labels.npy"), mode="w+", dtype=np.int32, shape=(n,)) if n else np.empty(0, dtype=np.int32)
+
+    totals = np.zeros(k, dtype=np.int64)
+    counts = np.zeros(k, dtype=np.int64)
+    name_volume = np.full(k, -1, dtype=np.int64)
+    name_rows = np.zeros(k, dtype=np.int64)
+    noise_keywords = 0
+    noise_volume = 0
+    top_noise_volumes: List[int] = []
+
+    # Pass 1: labels and cluster statistics
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        rows = np.asarray(embeddings[start:stop])
+        best_idx, best_sim, _, _ = top2_centroids(rows, centroids)
+        pos = np.where((best_idx >= 0) & (best_sim >= threshold), best_idx, -1)
+        lo, hi = np.searchsorted(sample_rows, [start, stop])
+        if hi > lo:
+            in_sample = sample_labels[lo:hi]
+            sample_pos = np.searchsorted(cluster_ids, in_sample)
+            pos[sample_rows[lo:hi] - start] = np.where(in_sample >= 0, sample_pos, -1)
+        labels[start:stop] = pos
+
+        vol = np.asarray(volumes[start:stop])
+        clustered = pos >= 0
+        totals += np.bincount(pos[clustered], weights=vol[clustered], minlength=k).astype(np.int64)
+        counts += np.bincount(pos[clustered], minlength=k)
+        if clustered.any():
+            local = np.flatnonzero(clustered)
+            order = local[np.lexsort((local, -vol[local], pos[local]))]
+            firsts = order[np.r_[True, pos[order][1:] != pos[order][:-1]]]
+            better = vol[firsts] > name_volume[pos[firsts]]
+            name_volume[pos[firsts[better]]] = vol[firsts[better]]
+            name_rows[pos[firsts[better]]] = firsts[better] + start
+
+        noise_vol = vol[~clustered]
+        noise_keywords += len(noise_vol)
+        noise_volume += int(noise_vol.sum())
+        top_noise_volumes = heapq.nlargest(10, top_noise_volumes + np.sort(noise_vol)[-10:].tolist())
+
+    named_rows = np.sort(name_rows[counts > 0])
+    text_of_row = dict(zip(named_rows.tolist(), spool.read_texts(named_rows)))
+    names = [text_of_row.get(r, "") for r in name_rows.tolist()]
+    name_embeddings = np.asarray(embeddings[name_rows], dtype=np.float32)
+
+    # Pass 2: one output row per keyword, in input order
+    intent_names = spool.intent_names()
+    intents = spool.intents()
+    with open(os.path.join(output_dir, KEYWORDS_FILE), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["keyword", "volume", "cluster_name", "matching_point", "intent", "sub_intent"])
+        start = 0
+        for texts in spool.iter_texts(chunk_rows):
+            stop = start + len(texts)
+            pos = np.asarray(labels[start:stop])
+            clustered = pos >= 0
+            sims = np.zeros(len(pos), dtype=np.float32)
+            if k:
+                sims = np.einsum("ij,ij->i", np.asarray(embeddings[start:stop]), name_embeddings[np.maximum(pos, 0)])
+            points = np.where(clustered, np.round(sims.astype(np.float64) * 100, 1), 100.0).tolist()
+            writer.writerows(
+                (text, vol, names[p] if p >= 0 else text, point, *intent_names[code])
+                for text, vol, p, point, code in zip(
+                    texts, volumes[start:stop].tolist(), pos.tolist(), points, intents[start:stop].tolist()
+                )
+            )
+            start = stop
+
+    cluster_order = np.argsort(-totals, kind="stable")
+    clusters = [
+        {"cluster_name": names[g], "keyword_count": int(counts[g]), "total_volume_topic": int(totals[g])}
+        for g in cluster_order.tolist() if counts[g] > 0
+    ]
+    with open(os.path.join(output_dir, CLUSTERS_FILE), "w", encoding="utf-8") as f:
+        json.dump(clusters, f, ensure_ascii=False, indent=2)
+
+    total_volume = int(totals.sum()) + noise_volume
+    top_volume = sum(heapq.nlargest(10, [c["total_volume_topic"] for c in clusters[:10]] + top_noise_volumes))
+    return {
+        "total_keywords_processed": n,
+        "total_clusters_found": len(clusters) + noise_keywords,
+        "top10_cluster_volume_percent": round(top_volume / total_volume * 100, 1) if total_volume > 0 else 0,
+        "noise_keywords_found": noise_keywords,
+        "noise_volume": noise_volume,
+    }
@@ -0,0 +1,224 @@
+"""
+Partitioned (divide-and-conquer) clustering for large jobs.
+
+UMAP and HDBSCAN scale super-linearly, so a large job is split with a cheap
+pass into partitions of about PARTITION_TARGET_SIZE rows (mini-batch k-means
+on the embeddings, or the IntentService buckets further split by k-means).
+Each partition runs the regular UMAP/HDBSCAN path in its own process; the
+partition labels are then offset into one label space, and clusters on
+either side of a partition border are merged when their centroids reach
+PARTITION_MERGE_THRESHOLD cosine similarity.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from keyword_cluster_app.config import (
+    PARTITION_METHOD,
+    PARTITION_TARGET_SIZE,
+    PARTITION_MAX_WORKERS,
+    PARTITION_MERGE_THRESHOLD,
+)
+from keyword_cluster_app.services.noise_assignment import segment_centroids
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one (clusters x clusters) similarity block in the merge step
+_MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+LevelSpecs = Dict[str, Tuple[Dict[str, Any], int]]
+
+_thread_limits = None
+
+
+def _kmeans_split(embeddings: np.ndarray, n_parts: int, random_state: int = 42) -> np.ndarray:
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(n_clusters=n_parts, batch_size=4096, n_init=3, random_state=random_state)
+    return kmeans.fit_predict(np.asarray(embeddings, dtype=np.float32))
+
+
+def partition_rows(
+    embeddings: np.ndarray,
+    target_size: int = PARTITION_TARGET_SIZE,
+    method: str = PARTITION_METHOD,
+    intents: Optional[Sequence[str]] = None,
+    random_state: int = 42,
+) -> np.ndarray:
+    """
+    Partition id per row. "kmeans" splits all rows into ceil(n / target_size)
+    k-means partitions; "intent" starts from the intent buckets, splits
+    buckets above target_size with k-means and pools buckets below a tenth
+    of target_size into one partition.
+    """
+    n = len(embeddings)
+    if method == "intent" and intents is not None:
+        import pandas as pd
+        groups, _ = pd.factorize(pd.Series(list(intents)))
+    else:
+        if method != "kmeans":
+            logger.warning(f"Unknown partition method '{method}' (or no intents), using 'kmeans'.")
+        groups = np.zeros(n, dtype=np.int64)
+
+    partitions = np.full(n, -1, dtype=np.int64)
+    small_rows: List[np.ndarray] = []
+    next_id = 0
+    for group in np.unique(groups):
+        rows = np.flatnonzero(groups == group)
+        if len(rows) < max(1, target_size // 10):
+            small_rows.append(rows)
+            continue
+        n_parts = math.ceil(len(rows) / target_size)
+        parts = _kmeans_split(embeddings[rows], n_parts, random_state) if n_parts > 1 else np.zeros(len(rows), dtype=np.int64)
+        partitions[rows] = next_id + parts
+        next_id += n_parts
+    if small_rows:
+        partitions[np.concatenate(small_rows)] = next_id
+
+    # Dense ids, no empty partitions
+    _, partitions = np.unique(partitions, return_inverse=True)
+    return partitions
+
+
+def _cluster_partition(
+    embeddings: np.ndarray, lexical_texts: List[str], level_specs: LevelSpecs, hybrid_lexical: bool = True
+) -> Dict[str, np.ndarray]:
+    """Process-pool task: the regular UMAP/HDBSCAN path on one partition."""
+    from keyword_cluster_app.services.clustering_service import ClusteringService
+
+    level_labels, _ = ClusteringService._reduce_and_cluster_levels(embeddings, lexical_texts, level_specs, hybrid_lexical=hybrid_lexical)
+    return level_labels
+
+
+def _limit_worker_threads(threads: int) -> None:
+    """Pool initializer: split the cores between workers instead of oversubscribing BLAS/numba."""
+    global _thread_limits
+    from threadpoolctl import threadpool_limits
+
+    _thread_limits = threadpool_limits(threads)
+    os.environ["NUMBA_NUM_THREADS"] = str(threads)
+
+
+def merge_border_clusters(
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    partition_of_label: Dict[int, int],
+    threshold: float = PARTITION_MERGE_THRESHOLD,
+    max_chunk_bytes: int = _MAX_CHUNK_BYTES,
+) -> Tuple[np.ndarray, int]:
+    """
+    Merges clusters from different partitions whose centroids have cosine
+    similarity >= threshold (transitively, union-find). Returns the new labels
+    (merged clusters take the smallest label of their group) and the number
+    of clusters merged away.
+    """
+    cluster_ids, centroids = segment_centroids(embeddings, labels)
+    k = len(cluster_ids)
+    if k < 2:
+        return labels, 0
+
+    parts = np.array([partition_of_label[int(c)] for c in cluster_ids])
+    parent = np.arange(k)
+
+    def _find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    chunk_rows = max(1, max_chunk_bytes // (k * 4))
+    for start in range(0, k, chunk_rows):
+        stop = min(start + chunk_rows, k)
+        sims = centroids[start:stop] @ centroids.T
+        close = (sims >= threshold) & (parts[start:stop, None] != parts[None, :])
+        close &= np.arange(k)[None, :] > np.arange(start, stop)[:, None]
+        for i, j in np.argwhere(close).tolist():
+            root_i, root_j = _find(i + start), _find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    roots = np.array([_find(i) for i in range(k)])
+    merged = int(k - len(np.unique(roots)))
+    new_labels = np.asarray(labels).copy()
+    clustered = new_labels >= 0
+    new_labels[clustered] = cluster_ids[roots[np.searchsorted(cluster_ids, new_labels[clustered])]]
+    return new_labels, merged
+
+
+def cluster_partitioned(
+    embeddings: np.ndarray,
+    lexical_texts: List[str],
+    level_specs: LevelSpecs,
+    intents: Optional[Sequence[str]] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    hybrid_lexical: bool = True,
+) -> Dict[str, np.ndarray]:
+    """
+    Per-level labels for all rows from partitioned clustering. Partitions run
+    in a spawn-context process pool (PARTITION_MAX_WORKERS, 0 = all cores);
+    with a single worker they run in this process. `progress_callback(done, total)`
+    is called as partitions complete. `hybrid_lexical` off clusters each
+    partition on the dense embeddings only.
+    """
+    start = time.perf_counter()
+    partitions = partition_rows(embeddings, intents=intents)
+    n_partitions = int(partitions.max()) + 1 if len(partitions) else 0
+    part_rows = [np.flatnonzero(partitions == p) for p in range(n_partitions)]
+    # Largest partitions first, so the slowest tasks start early
+    part_rows.sort(key=len, reverse=True)
+    split_seconds = time.perf_counter() - start
+
+    cpu_count = os.cpu_count() or 1
+    max_workers = min(n_partitions, PARTITION_MAX_WORKERS or cpu_count)
+    logger.info(f"Partitioned clustering: {n_partitions} partitions (sizes {[len(r) for r in part_rows]}), {max_workers} workers.")
+    tasks = [(embeddings[rows], [lexical_texts[i] for i in rows.tolist()], level_specs, hybrid_lexical) for rows in part_rows]
+    results = []
+    if max_workers <= 1:
+        for task in tasks:
+            results.append(_cluster_partition(*task))
+            if progress_callback is not None:
+                progress_callback(len(results), n_partitions)
+    else:
+        context = multiprocessing.get_context("spawn")
+        threads = max(1, cpu_count // max_workers)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_limit_worker_threads, initargs=(threads,)) as executor:
+            for result in executor.map(_cluster_partition, *zip(*tasks)):
+                results.append(result)
+                if progress_callback is not None:
+                    progress_callback(len(results), n_partitions)
+
+    merge_start = time.perf_counter()
+    level_labels: Dict[str, np.ndarray] = {}
+    merged_clusters: Dict[str, int] = {}
+    for lvl in level_specs:
+        labels = np.full(len(embeddings), -1, dtype=np.int64)
+        partition_of_label: Dict[int, int] = {}
+        offset = 0
+        for p, (rows, result) in enumerate(zip(part_rows, results)):
+            local = np.asarray(result[lvl])
+            clustered = local >= 0
+            labels[rows[clustered]] = local[clustered] + offset
+            n_local = int(local.max()) + 1 if clustered.any() else 0
+            partition_of_label.update({offset + c: p for c in range(n_local)})
+            offset += n_local
+        level_labels[lvl], merged_clusters[lvl] = merge_border_clusters(embeddings, labels, partition_of_label)
+
+    if stats is not None:
+        stats.update({
+            "method": PARTITION_METHOD,
+            "partitions": n_partitions,
+            "largest_partition": len(part_rows[0]) if part_rows else 0,
+            "workers": max_workers,
+            "merged_clusters": merged_clusters,
+            "split_seconds": round(split_seconds, 3),
+            "merge_seconds": round(time.perf_counter() - merge_start, 3),
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+    return level_labels
@@ -0,0 +1,166 @@
+"""
+Stage-level progress of a clustering run.
+
+The pipeline reports through a `ProgressReporter`, which turns "stage X is
+done/total" into events for a `progress_callback(event)`:
+
+    {"stage": "encoding", "stage_index": 2, "stages": 8, "stage_percent": 42.0,
+     "percent": 17.5, "level": None, "done": 2100, "total": 5000}
+
+"percent" is the overall progress, weighted by the rough share of wall time
+each stage takes on a cold run. With several levels, noise assignment,
+refinement and result building run once per level ("level" is set), and
+count as one block split evenly between levels.
+
+The reporter also times every stage that runs, with or without a callback
+(`seconds`, in run order); optional work nested in a stage, such as the
+lexical block built during "umap", is added with `add_seconds`.
+
+`ProgressTracker` is the publishing side (the worker): it adds elapsed time
+and ETAs per stage and overall, and throttles events to one per interval,
+always letting the first event of a stage through.
+"""
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+STAGES = ("cleaning", "encoding", "intent", "umap", "hdbscan", "noise_assignment", "refinement", "results")
+
+# Stages repeated for each level of a multi-level run
+LEVEL_STAGES = ("noise_assignment", "refinement", "results")
+
+# Approximate share of a cold 100k-keyword run spent in each stage
+STAGE_WEIGHTS = {
+    "cleaning": 0.02,
+    "encoding": 0.35,
+    "intent": 0.08,
+    "umap": 0.28,
+    "hdbscan": 0.08,
+    "noise_assignment": 0.04,
+    "refinement": 0.12,
+    "results": 0.03,
+}
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class ProgressReporter:
+    """Pipeline-side progress: stage updates -> overall percent events. No-op without a callback."""
+
+    def __init__(self, callback: Optional[ProgressCallback] = None, levels: Sequence[str] = ()):
+        self.callback = callback
+        self.levels: List[str] = list(levels) or [None]
+        total = sum(STAGE_WEIGHTS.values())
+        self._weights = {stage: weight / total for stage, weight in STAGE_WEIGHTS.items()}
+        self._before: Dict[str, float] = {}
+        cumulative = 0.0
+        for stage in STAGES:
+            if stage in LEVEL_STAGES:
+                continue
+            self._before[stage] = cumulative
+            cumulative += self._weights[stage]
+        self._level_block_start = cumulative
+        self._level_block = sum(self._weights[stage] for stage in LEVEL_STAGES)
+        within = 0.0
+        for stage in LEVEL_STAGES:
+            self._before[stage] = within
+            within += self._weights[stage]
+        self._percent = 0.0
+        self.seconds: Dict[str, float] = {}
+        self._timing: Optional[Tuple[str, float]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.callback is not None
+
+    def update(self, stage: str, done: int = 0, total: int = 1, level: Optional[str] = None) -> None:
+        """Reports `done` of `total` units of `stage` (of `level`, for per-level stages)."""
+        fraction = min(1.0, done / total) if total > 0 else 1.0
+        self._time(stage, fraction >= 1.0)
+        if self.callback is None:
+            return
+        if stage in LEVEL_STAGES:
+            index = self.levels.index(level) if level in self.levels else 0
+            within = (self._before[stage] + self._weights[stage] * fraction) / self._level_block
+            overall = self._level_block_start + self._level_block * (index + within) / len(self.levels)
+        else:
+            overall = self._before[stage] + self._weights[stage] * fraction
+        # Skipped or re-used stages never move the overall progress backwards
+        self._percent = max(self._percent, round(overall * 100, 1))
+        self.callback({
+            "stage": stage,
+            "stage_index": STAGES.index(stage) + 1,
+            "stages": len(STAGES),
+            "stage_percent": round(fraction * 100, 1),
+            "percent": self._percent,
+            "level": level,
+            "done": done,
+            "total": total,
+        })
+
+    def start(self, stage: str, level: Optional[str] = None) -> None:
+        self.update(stage, 0, 1, level)
+
+    def finish(self, stage: str, level: Optional[str] = None) -> None:
+        self.update(stage, 1, 1, level)
+
+    def add_seconds(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def _time(self, stage: str, done: bool) -> None:
+        # A stage runs from its first update until it is done or another stage reports;
+        # a stage only ever reported as done (re-used, skipped) is not timed
+        now = time.perf_counter()
+        if self._timing is not None and (done or self._timing[0] != stage):
+            timed_stage, started = self._timing
+            self.add_seconds(timed_stage, now - started)
+            self._timing = None
+        if self._timing is None and not done:
+            self._timing = (stage, now)
+
+    def counter(self, stage: str, level: Optional[str] = None) -> Optional[Callable[[int, int], None]]:
+        """A `progress_callback(done, total)` for batch loops, or None when reporting is off."""
+        if self.callback is None:
+            return None
+        return lambda done, total: self.update(stage, done, total, level)
+
+
+def _eta(elapsed: float, percent: float) -> Optional[float]:
+    if percent <= 0:
+        return None
+    return round(elapsed * (100.0 - percent) / percent, 1)
+
+
+class ProgressTracker:
+    """
+    Publishing-side progress: adds timing to reporter events and decides
+    which ones are worth publishing (at most one per `min_interval` seconds,
+    plus the first event of every stage and the final one).
+    """
+
+    def __init__(self, min_interval: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.min_interval = min_interval
+        self.clock = clock
+        self.started = clock()
+        self._stage_started: Dict[Any, float] = {}
+        self._published_at: Optional[float] = None
+
+    def update(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The event with "elapsed_seconds", "stage_elapsed_seconds", "stage_eta_seconds" and "eta_seconds", or None if throttled."""
+        now = self.clock()
+        stage_key = (event["stage"], event.get("level"))
+        new_stage = stage_key not in self._stage_started
+        stage_started = self._stage_started.setdefault(stage_key, now)
+        last = event["percent"] >= 100.0
+        if not (new_stage or last or self._published_at is None or now - self._published_at >= self.min_interval):
+            return None
+        self._published_at = now
+
+        elapsed = now - self.started
+        stage_elapsed = now - stage_started
+        return {
+            **event,
+            "elapsed_seconds": round(elapsed, 1),
+            "stage_elapsed_seconds": round(stage_elapsed, 1),
+            "stage_eta_seconds": _eta(stage_elapsed, event["stage_percent"]),
+            "eta_seconds": _eta(elapsed, event["percent"]),
+        }
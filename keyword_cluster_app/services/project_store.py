@@ -0,0 +1,411 @@
+"""
+Persisted clustering projects for incremental updates.
+
+A project keeps what is needed to place new keywords into an existing
+clustering without re-running it: the hybrid representation of the clustered
+rows (with its fitted lexical encoder), their UMAP coordinates, the fitted
+HDBSCAN model (built with prediction_data=True), the final labels with
+cluster centroids and names, and the keyword list.
+
+New keywords are placed in the UMAP space as the membership-weighted mean of
+their hybrid nearest neighbours (the initialisation UMAP.transform starts
+from, without its optimisation epochs) and classified with
+hdbscan.approximate_predict; a prediction is kept only if the keyword also
+reaches NOISE_CONFIDENCE_THRESHOLD similarity to the cluster centroid. Other
+keywords go through the same neighbour-restricted centroid fallback as a
+full run.
+
+Files under PROJECTS_DIR/<project_id>/:
+    model.pkl      representation, reduced coordinates, HDBSCAN model, labels, centroids
+    centroids.npz  cluster keys, centroids and name keyword embeddings (real-time assignment)
+    keywords.json  keywords of the last full clustering and their cluster keys
+    delta.jsonl    keywords added since, one JSON object per line
+    meta.json      level, settings, sizes and drift counters
+"""
+import fcntl
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+from keyword_cluster_app.config import (
+    PROJECTS_DIR,
+    PROJECT_DRIFT_THRESHOLD,
+    PROJECT_DRIFT_MIN_KEYWORDS,
+    PROJECT_MAX_GROWTH,
+    PROJECT_CACHE_SIZE,
+)
+from keyword_cluster_app.services.hybrid_representation import HybridRepresentation
+from keyword_cluster_app.services.noise_assignment import (
+    NOISE_CONFIDENCE_THRESHOLD,
+    best_neighbor_cluster,
+    segment_centroids,
+)
+from keyword_cluster_app.utils.text_processing import clean_keyword
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.pkl"
+KEYWORDS_FILE = "keywords.json"
+CENTROIDS_FILE = "centroids.npz"
+DELTA_FILE = "delta.jsonl"
+META_FILE = "meta.json"
+_LOCK_FILE = ".lock"
+
+_PROJECT_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+_cache: "OrderedDict[str, ClusteringProject]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def validate_project_id(project_id: str) -> str:
+    """Project ids become directory names: letters, digits, '_', '-', '.' (max 64)."""
+    if not isinstance(project_id, str) or not _PROJECT_ID_PATTERN.match(project_id):
+        raise ValueError(f"Invalid project_id '{project_id}': use letters, digits, '_', '-' or '.' (max 64 characters)")
+    return project_id
+
+
+def project_dir(project_id: str) -> str:
+    return os.path.join(PROJECTS_DIR, validate_project_id(project_id))
+
+
+@contextmanager
+def project_lock(project_id: str) -> Iterator[None]:
+    """Exclusive lock on one project, across processes (API and workers share the volume)."""
+    os.makedirs(PROJECTS_DIR, exist_ok=True)
+    with open(os.path.join(PROJECTS_DIR, f"{validate_project_id(project_id)}{_LOCK_FILE}"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_json(path: str, data: Any) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def drift_status(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Drift of a project since its last full clustering: the share of added
+    keywords that fit no existing cluster, and the added keywords relative
+    to the clustered ones. `recluster_required` once either crosses its threshold.
+    """
+    delta = meta.get("delta", {})
+    added, noise = delta.get("keywords", 0), delta.get("noise", 0)
+    noise_ratio = noise / added if added else 0.0
+    growth = added / meta["keywords"] if meta.get("keywords") else 0.0
+    return {
+        "added_keywords": added,
+        "noise_keywords": noise,
+        "noise_ratio": round(noise_ratio, 4),
+        "growth": round(growth, 4),
+        "threshold": PROJECT_DRIFT_THRESHOLD,
+        "recluster_required": bool(
+            (added >= PROJECT_DRIFT_MIN_KEYWORDS and noise_ratio >= PROJECT_DRIFT_THRESHOLD)
+            or growth >= PROJECT_MAX_GROWTH
+        ),
+    }
+
+
+class ClusteringProject:
+    """A loaded project: the fitted model plus the keyword -> cluster assignments."""
+
+    def __init__(self, project_id: str, meta: Dict[str, Any], model: Dict[str, Any], keywords: List[Dict[str, Any]], assignments: Dict[str, str]):
+        self.project_id = project_id
+        self.meta = meta
+        self.model = model
+        self.keywords = keywords
+        # cleaned keyword -> cluster key, for keywords already in the project
+        self.assignments = assignments
+
+    @property
+    def representation(self) -> HybridRepresentation:
+        return self.model["representation"]
+
+    def assign(self, embeddings: np.ndarray, lexical_texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Places new keywords into the project's clusters. Returns per-keyword
+        "labels" (-1 = fits no cluster), "cluster_keys", "probabilities"
+        (HDBSCAN membership strength, 0 for centroid fallbacks), "status"
+        ("clustered", "reassigned" or "noise") and "matching_point" (0-100
+        similarity to the cluster name keyword).
+        """
+        from hdbscan import approximate_predict
+
+        model = self.model
+        n = len(embeddings)
+        representation = self.representation
+        queries = representation.transform(embeddings, lexical_texts)
+        knn_indices, knn_sims = representation.query_knn(queries, model["n_neighbors"])
+
+        if model["reduced_space"] == "umap":
+            from umap.umap_ import smooth_knn_dist
+
+            # UMAP.transform's membership weights (local_connectivity - 1 = 0, so no rho offset)
+            distances = np.clip(1.0 - knn_sims, 0.0, 2.0).astype(np.float32)
+            sigmas, _ = smooth_knn_dist(distances, float(distances.shape[1]), local_connectivity=0.0)
+            weights = np.exp(-distances / sigmas[:, None])
+            weights /= np.clip(weights.sum(axis=1, keepdims=True), 1e-12, None)
+            coords = np.einsum("ik,ikd->id", weights, model["reduced"][knn_indices])
+        else:
+            coords = queries.dense
+        if len(model["cluster_ids"]):
+            labels, probabilities = approximate_predict(model["clusterer"], coords)
+            labels = np.asarray(labels, dtype=np.int64)
+            probabilities = np.asarray(probabilities, dtype=np.float32)
+        else:
+            labels, probabilities = np.full(n, -1, dtype=np.int64), np.zeros(n, dtype=np.float32)
+
+        # Interpolated coordinates always land near existing points, so an HDBSCAN
+        # prediction only stands if the keyword is also close to that cluster's centroid
+        cluster_ids = model["cluster_ids"]
+        predicted = np.flatnonzero(labels >= 0)
+        if len(predicted):
+            centroid_sims = np.einsum(
+                "id,id->i", queries.dense[predicted], model["centroids"][np.searchsorted(cluster_ids, labels[predicted])]
+            )
+            labels[predicted[centroid_sims < NOISE_CONFIDENCE_THRESHOLD]] = -1
+
+        status = np.where(labels >= 0, "clustered", "noise").astype(object)
+        noise = labels < 0
+        if noise.any():
+            fallback, fallback_sim = best_neighbor_cluster(
+                queries.dense[noise], model["cluster_ids"], model["centroids"], model["labels"][knn_indices[noise]]
+            )
+            fallback[fallback_sim < NOISE_CONFIDENCE_THRESHOLD] = -1
+            labels[noise] = fallback
+            probabilities[noise] = 0.0
+            status[np.flatnonzero(noise)[fallback >= 0]] = "reassigned"
+
+        positions = np.clip(np.searchsorted(cluster_ids, labels), 0, max(len(cluster_ids) - 1, 0))
+        clustered = labels >= 0
+        matching_point = np.full(n, 100.0)
+        if clustered.any():
+            sims = np.einsum("id,id->i", queries.dense[clustered], model["name_embeddings"][positions[clustered]])
+            matching_point[clustered] = np.round(sims.astype(np.float64) * 100, 1)
+        cluster_keys = [model["cluster_keys"][p] if c else None for p, c in zip(positions.tolist(), clustered.tolist())]
+        return {
+            "labels": labels,
+            "cluster_keys": cluster_keys,
+            "probabilities": probabilities,
+            "status": status,
+            "matching_point": matching_point,
+        }
+
+
+def save_project(
+    project_id: str,
+    prepared: Dict[str, Any],
+    artifacts: Dict[str, Any],
+    level: str,
+    results: Dict[str, Any],
+    settings: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Persists a finished single-level clustering as a project (replacing any
+    previous version and its added keywords). `artifacts` are the fitted
+    intermediates collected by the clustering run. Returns the project's
+    summary block.
+    """
+    labels = np.asarray(artifacts["labels"])
+    row_map = prepared["row_map"]
+    representation: HybridRepresentation = artifacts["representation"]
+    if row_map is None:
+        row_labels = labels
+    else:
+        # Duplicates share one clustered row and always get the same label
+        row_labels = np.full(representation.n_rows, -1, dtype=np.int64)
+        row_labels[row_map] = labels
+    cluster_ids, centroids = segment_centroids(representation.dense, row_labels)
+
+    # Cluster key and name keyword embedding per label (names as built by the result builder)
+    original_texts = prepared["original_texts"]
+    clusters = results["clusters"]
+    key_of_label: Dict[int, str] = {}
+    name_row_of_label: Dict[int, int] = {}
+    for key, rows in artifacts["cluster_rows"].items():
+        label = int(labels[rows[0]])
+        if label < 0:
+            continue
+        name = clusters.get(key, {}).get("cluster_name")
+        key_of_label[label] = key
+        name_row_of_label[label] = next((r for r in rows if original_texts[r] == name), rows[0])
+    ids = cluster_ids.tolist()
+    embeddings = prepared["embeddings"]
+    name_embeddings = (
+        np.stack([embeddings[name_row_of_label[c]] for c in ids]).astype(np.float32)
+        if ids else np.empty((0, embeddings.shape[1]), dtype=np.float32)
+    )
+
+    model = {
+        "representation": representation,
+        "reduced_space": artifacts["reduced_space"],
+        "reduced": artifacts["reduced"][level],
+        "n_neighbors": artifacts["n_neighbors"][level],
+        "clusterer": artifacts["clusterers"][level],
+        "labels": row_labels,
+        "cluster_ids": cluster_ids,
+        "centroids": centroids,
+        "cluster_keys": [key_of_label[c] for c in ids],
+        "name_embeddings": name_embeddings,
+    }
+    assignments: Dict[str, str] = {}
+    for key, cluster in clusters.items():
+        for kw in cluster["keywords"]:
+            assignments.setdefault(clean_keyword(kw["text"]), key)
+    keywords = {
+        "keywords": [{"text": t, "volume": int(v)} for t, v in zip(original_texts, prepared["volumes"])],
+        "assignments": assignments,
+    }
+    meta = {
+        "project_id": project_id,
+        "version": uuid.uuid4().hex,
+        "level": level,
+        "settings": settings,
+        "keywords": len(original_texts),
+        "clustered_rows": representation.n_rows,
+        "clusters": len(ids),
+        "updated_at": time.time(),
+        "delta": {"keywords": 0, "noise": 0, "batches": 0},
+    }
+
+    path = project_dir(project_id)
+    tmp_path = f"{path}.tmp-{meta['version']}"
+    os.makedirs(tmp_path)
+    with open(os.path.join(tmp_path, MODEL_FILE), "wb") as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    np.savez(
+        os.path.join(tmp_path, CENTROIDS_FILE),
+        cluster_keys=np.array(model["cluster_keys"], dtype=str),
+        centroids=centroids,
+        name_embeddings=name_embeddings,
+    )
+    _write_json(os.path.join(tmp_path, KEYWORDS_FILE), keywords)
+    _write_json(os.path.join(tmp_path, META_FILE), meta)
+
+    with project_lock(project_id):
+        old_path = f"{path}.old-{meta['version']}"
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    logger.info(f"Saved clustering project '{project_id}': {meta['keywords']} keywords, {meta['clusters']} clusters.")
+    return {"project_id": project_id, "version": meta["version"], "clusters": meta["clusters"]}
+
+
+def read_meta(project_id: str) -> Dict[str, Any]:
+    """The project's metadata; FileNotFoundError when the project does not exist."""
+    return _read_json(os.path.join(project_dir(project_id), META_FILE))
+
+
+def read_centroids(project_id: str) -> Dict[str, np.ndarray]:
+    """Cluster keys, centroids and name keyword embeddings of a project, without loading its model."""
+    path = project_dir(project_id)
+    centroids_path = os.path.join(path, CENTROIDS_FILE)
+    if os.path.exists(centroids_path):
+        with np.load(centroids_path) as data:
+            return {name: data[name] for name in ("cluster_keys", "centroids", "name_embeddings")}
+    model = load_project(project_id).model
+    return {
+        "cluster_keys": np.array(model["cluster_keys"], dtype=str),
+        "centroids": model["centroids"],
+        "name_embeddings": model["name_embeddings"],
+    }
+
+
+def read_delta(project_id: str) -> List[Dict[str, Any]]:
+    path = os.path.join(project_dir(project_id), DELTA_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_project(project_id: str) -> ClusteringProject:
+    """
+    Loads a project (the model is cached per process until the project is
+    re-clustered); keywords added since the last clustering count as known.
+    """
+    path = project_dir(project_id)
+    meta = read_meta(project_id)
+    with _cache_lock:
+        cached = _cache.get(project_id)
+        if cached is not None and cached.meta["version"] == meta["version"]:
+            _cache.move_to_end(project_id)
+            project = cached
+        else:
+            project = None
+    if project is None:
+        with open(os.path.join(path, MODEL_FILE), "rb") as f:
+            model = pickle.load(f)
+        keywords = _read_json(os.path.join(path, KEYWORDS_FILE))
+        project = ClusteringProject(project_id, meta, model, keywords["keywords"], keywords["assignments"])
+        with _cache_lock:
+            _cache[project_id] = project
+            while len(_cache) > max(PROJECT_CACHE_SIZE, 1):
+                _cache.popitem(last=False)
+
+    assignments = dict(project.assignments)
+    for row in read_delta(project_id):
+        assignments.setdefault(clean_keyword(row["text"]), row["cluster_name"])
+    return ClusteringProject(project_id, meta, project.model, project.keywords, assignments)
+
+
+def append_delta(project_id: str, version: str, rows: List[Dict[str, Any]], noise: int) -> Dict[str, Any]:
+    """
+    Records keywords added to a project and updates its drift counters.
+    Returns the drift status; raises RuntimeError when the project was
+    re-clustered since `version` was loaded.
+    """
+    path = project_dir(project_id)
+    with project_lock(project_id):
+        meta = read_meta(project_id)
+        if meta["version"] != version:
+            raise RuntimeError(f"Project '{project_id}' was re-clustered while keywords were being added, retry.")
+        if rows:
+            with open(os.path.join(path, DELTA_FILE), "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        delta = meta.setdefault("delta", {"keywords": 0, "noise": 0, "batches": 0})
+        delta["keywords"] += len(rows)
+        delta["noise"] += noise
+        delta["batches"] += 1
+        meta["updated_at"] = time.time()
+        _write_json(os.path.join(path, META_FILE), meta)
+    return drift_status(meta)
+
+
+def project_keywords(project_id: str) -> List[Dict[str, Any]]:
+    """All keywords of a project (last clustering + added since), for a full re-cluster."""
+    project = load_project(project_id)
+    return project.keywords + [{"text": row["text"], "volume": row["volume"]} for row in read_delta(project_id)]
+
+
+def delete_project(project_id: str) -> bool:
+    path = project_dir(project_id)
+    with project_lock(project_id):
+        if not os.path.exists(path):
+            return False
+        shutil.rmtree(path)
+    with _cache_lock:
+        _cache.pop(project_id, None)
+    return True
@@ -0,0 +1,185 @@
+"""
+Real-time keyword -> cluster assignment against a stored clustering project.
+
+A centroid index holds one normalized centroid per cluster of a project
+(read from its centroids.npz), so scoring a keyword is a single (1, d) x
+(d, clusters) product. Encoding goes through a micro-batcher: requests that
+arrive while the encoder is busy, or within ASSIGN_BATCH_WAIT_MS of each
+other, share one `get_embeddings` call (memory cache -> persistent store ->
+shared model), run on one background thread so the event loop never blocks.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from keyword_cluster_app.config import (
+    ASSIGN_MAX_BATCH,
+    ASSIGN_BATCH_WAIT_MS,
+    ASSIGN_INDEX_REFRESH_SECONDS,
+)
+from keyword_cluster_app.services.project_store import read_centroids, read_meta
+from keyword_cluster_app.utils.text_processing import clean_keyword
+
+logger = logging.getLogger(__name__)
+
+
+class CentroidIndex:
+    """Normalized cluster centroids of one project version."""
+
+    def __init__(self, project_id: str, version: str, cluster_keys: Sequence[str], centroids: np.ndarray, name_embeddings: np.ndarray):
+        self.project_id = project_id
+        self.version = version
+        self.cluster_keys = [str(key) for key in cluster_keys]
+        self.centroids_t = np.ascontiguousarray(np.asarray(centroids, dtype=np.float32).T)
+        self.name_embeddings = np.asarray(name_embeddings, dtype=np.float32)
+        self.checked_at = time.monotonic()
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.cluster_keys)
+
+    def top_k(self, embeddings: np.ndarray, k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        The k most similar clusters per (normalized) embedding, best first:
+        "cluster_name" (cluster key), "score" (cosine to the centroid) and
+        "matching_point" (0-100 similarity to the cluster name keyword).
+        """
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        k = min(k, self.n_clusters)
+        if k == 0:
+            return [[] for _ in range(len(embeddings))]
+        sims = embeddings @ self.centroids_t
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k] if k < self.n_clusters else np.tile(np.arange(k), (len(sims), 1))
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+        name_sims = np.einsum("id,ikd->ik", embeddings, self.name_embeddings[top])
+        return [
+            [
+                {"cluster_name": self.cluster_keys[c], "score": round(float(s), 4), "matching_point": round(float(p) * 100, 1)}
+                for c, s, p in zip(row_top.tolist(), row_sims.tolist(), row_names.tolist())
+            ]
+            for row_top, row_sims, row_names in zip(top, top_sims, name_sims)
+        ]
+
+
+_indexes: Dict[str, CentroidIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_centroid_index(project_id: str) -> CentroidIndex:
+    """
+    The project's centroid index, cached per process. The project version is
+    re-checked at most every ASSIGN_INDEX_REFRESH_SECONDS, so a re-clustered
+    project is picked up without a restart. FileNotFoundError if the project
+    does not exist.
+    """
+    with _indexes_lock:
+        index = _indexes.get(project_id)
+    now = time.monotonic()
+    if index is not None and now - index.checked_at < ASSIGN_INDEX_REFRESH_SECONDS:
+        return index
+
+    version = read_meta(project_id)["version"]
+    if index is not None and index.version == version:
+        index.checked_at = now
+        return index
+    data = read_centroids(project_id)
+    index = CentroidIndex(project_id, version, data["cluster_keys"], data["centroids"], data["name_embeddings"])
+    with _indexes_lock:
+        _indexes[project_id] = index
+    logger.info(f"Loaded centroid index for project '{project_id}' ({index.n_clusters} clusters).")
+    return index
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    from keyword_cluster_app.model import get_embeddings
+
+    embeddings = get_embeddings(texts, batch_size=ASSIGN_MAX_BATCH, show_progress_bar=False, normalize_embeddings=True)
+    if embeddings is None:
+        raise RuntimeError("Embedding model is not loaded")
+    return embeddings
+
+
+class MicroBatcher:
+    """
+    Collects texts from concurrent coroutines into batches for one encoder
+    call. A batch starts with the first waiting text, takes everything queued
+    meanwhile, and waits up to `max_wait_ms` for more when it is not full.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray] = _encode,
+        max_batch: int = ASSIGN_MAX_BATCH,
+        max_wait_ms: float = ASSIGN_BATCH_WAIT_MS,
+    ):
+        self._encode = encode
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="assign-encoder")
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"texts": 0, "batches": 0, "largest_batch": 0}
+
+    async def encode(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        future = loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    def _drain(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch and self.max_wait > 0:
+                await asyncio.sleep(self.max_wait)
+                self._drain(batch)
+
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await loop.run_in_executor(self._executor, self._encode, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+            self.stats["texts"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+
+
+_batcher: Optional[MicroBatcher] = None
+
+
+def get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher()
+    return _batcher
+
+
+async def assign_keyword(project_id: str, keyword: str, top_k: int = 3) -> List[Dict[str, Any]]:
+    """Top-k clusters of a project for one keyword (micro-batched encoding)."""
+    index = get_centroid_index(project_id)
+    embedding = await get_batcher().encode(clean_keyword(keyword))
+    return index.top_k(embedding, top_k)[0]
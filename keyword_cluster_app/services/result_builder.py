@@ -0,0 +1,183 @@
+"""
+Columnar, linear-time construction of the clustering result JSON.
+
+Rows are grouped with one stable argsort over the labels; per-cluster volume,
+name keyword (highest volume) and similarity to the name are computed with
+NumPy segment operations, so building 100k-keyword results avoids the
+per-cluster rescans of the label list.
+"""
+import heapq
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def group_rows_by_label(labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Groups clustered rows (label >= 0) by label.
+    Returns (order, cluster_labels, starts, counts): rows of cluster g are
+    order[starts[g]:starts[g] + counts[g]], in original row order.
+    """
+    labels = np.asarray(labels)
+    clustered = np.flatnonzero(labels >= 0)
+    order = clustered[np.argsort(labels[clustered], kind="stable")]
+    cluster_labels, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    return order, cluster_labels, starts, counts
+
+
+def _similarity_to_anchor(embeddings: np.ndarray, row_group: np.ndarray, anchor_rows: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+    """
+    Cosine similarity of each row with the anchor row of its group
+    (row_group[i] = -1 for ungrouped rows, which get 0). Rows are read in
+    contiguous chunks; only the small anchor matrix is gathered.
+    """
+    anchors = embeddings[anchor_rows].astype(np.float32)
+    anchors /= np.clip(np.linalg.norm(anchors, axis=1, keepdims=True), 1e-12, None)
+    sims = np.zeros(len(embeddings), dtype=np.float32)
+    for start in range(0, len(embeddings), chunk_size):
+        groups = row_group[start:start + chunk_size]
+        block = embeddings[start:start + chunk_size]
+        dots = np.einsum("ij,ij->i", block, anchors[np.maximum(groups, 0)])
+        dots /= np.clip(np.linalg.norm(block, axis=1), 1e-12, None)
+        sims[start:start + chunk_size] = np.where(groups >= 0, dots, 0.0)
+    return sims
+
+
+def unique_cluster_key(name: str, used: Dict[str, int]) -> str:
+    """
+    Dict key for a cluster: duplicate names get "x (2)", "x (3)", ... instead
+    of overwriting each other. The cluster's "cluster_name" keeps the real name.
+    """
+    if name not in used:
+        used[name] = 1
+        return name
+    used[name] += 1
+    key = f"{name} ({used[name]})"
+    while key in used:
+        used[name] += 1
+        key = f"{name} ({used[name]})"
+    used[key] = 1
+    return key
+
+
+def build_cluster_map(
+    original_texts: Sequence[str],
+    volumes: Sequence[int],
+    labels: np.ndarray,
+    embeddings: np.ndarray,
+    cluster_rows: Optional[Dict[str, List[int]]] = None,
+) -> Tuple[Dict[str, Dict[str, Any]], int, int, Dict[str, int]]:
+    """
+    Builds the name-keyed cluster dict: clusters sorted by total volume, each
+    named after its highest-volume keyword, followed by one singleton cluster
+    per noise keyword.
+
+    Returns (clusters, noise_keywords, noise_volume, used_names); `used_names`
+    lets callers add more clusters without key collisions. If `cluster_rows`
+    is given, it is filled with the input row of every keyword, per cluster key.
+    """
+    labels = np.asarray(labels)
+    volumes_arr = np.asarray(volumes, dtype=np.int64)
+    volume_values = volumes_arr.tolist()
+
+    order, cluster_labels, starts, counts = group_rows_by_label(labels)
+    n_clusters = len(cluster_labels)
+    clusters: Dict[str, Dict[str, Any]] = {}
+    used_names: Dict[str, int] = {}
+
+    if n_clusters:
+        group_of_sorted = np.repeat(np.arange(n_clusters), counts)
+        sorted_volumes = volumes_arr[order]
+        totals = np.bincount(group_of_sorted, weights=sorted_volumes, minlength=n_clusters).astype(np.int64)
+
+        # Name = first keyword (in input order) with the cluster's max volume
+        max_volume = np.maximum.reduceat(sorted_volumes, starts)
+        positions = np.where(sorted_volumes == max_volume[group_of_sorted], np.arange(len(order)), len(order))
+        name_rows = order[np.minimum.reduceat(positions, starts)]
+
+        # Cosine similarity of every keyword with its cluster's name keyword
+        row_group = np.full(len(labels), -1, dtype=np.int64)
+        row_group[order] = group_of_sorted
+        sims = _similarity_to_anchor(embeddings, row_group, name_rows)[order]
+        points = np.round(sims.astype(np.float64) * 100, 1).tolist()
+        order_list = order.tolist()
+
+        for g in np.argsort(-totals, kind="stable").tolist():
+            start, stop = int(starts[g]), int(starts[g] + counts[g])
+            name = original_texts[name_rows[g]]
+            kw_list = [
+                {"text": original_texts[i], "volume": volume_values[i], "matching_point": points[j]}
+                for j, i in zip(range(start, stop), order_list[start:stop])
+            ]
+            key = unique_cluster_key(name, used_names)
+            clusters[key] = {
+                "cluster_name": name,
+                "keywords": kw_list,
+                "total_volume_topic": int(totals[g]),
+            }
+            if cluster_rows is not None:
+                cluster_rows[key] = order_list[start:stop]
+
+    # Noise keywords become singleton clusters (Topic = Keyword), so every
+    # keyword appears in the Excel/JSON output
+    noise_rows = np.flatnonzero(labels == -1).tolist()
+    noise_volume = 0
+    for i in noise_rows:
+        vol = volume_values[i]
+        noise_volume += vol
+        key = unique_cluster_key(original_texts[i], used_names)
+        clusters[key] = {
+            "cluster_name": original_texts[i],
+            "keywords": [{"text": original_texts[i], "volume": vol, "matching_point": 100.0}],
+            "total_volume_topic": vol,
+        }
+        if cluster_rows is not None:
+            cluster_rows[key] = [i]
+
+    return clusters, len(noise_rows), noise_volume, used_names
+
+
+def top_clusters_volume_percent(clusters: Dict[str, Dict[str, Any]], total_raw_volume: int, top_n: int = 10) -> float:
+    top_volume = sum(heapq.nlargest(top_n, (c["total_volume_topic"] for c in clusters.values())))
+    return round(top_volume / total_raw_volume * 100, 1) if total_raw_volume > 0 else 0
+
+
+def add_singleton_clusters(
+    clusters: Dict[str, Dict[str, Any]],
+    keywords: List[Dict[str, Any]],
+    used_names: Dict[str, int],
+) -> int:
+    """Adds one singleton cluster per keyword dict; returns their total volume."""
+    total_volume = 0
+    for kw in keywords:
+        vol = kw["volume"]
+        total_volume += vol
+        key = unique_cluster_key(kw["text"], used_names)
+        clusters[key] = {
+            "cluster_name": kw["text"],
+            "keywords": [{**kw, "matching_point": 100.0}],
+            "total_volume_topic": vol,
+        }
+    return total_volume
+
+
+def add_keyword_intents(
+    clusters: Dict[str, Dict[str, Any]],
+    cluster_rows: Dict[str, List[int]],
+    intents: Sequence[Dict[str, Any]],
+) -> None:
+    """Sets "intent" and "sub_intent" on every keyword, from its row (see `build_cluster_map`'s `cluster_rows`)."""
+    for key, rows in cluster_rows.items():
+        for kw, row in zip(clusters[key]["keywords"], rows):
+            kw["intent"] = intents[row]["intent"]
+            kw["sub_intent"] = intents[row]["sub_intent"]
+
+
+def add_cluster_intents(clusters: Dict[str, Dict[str, Any]]) -> None:
+    """Sets each cluster's "cluster_intent": the keyword intent carrying most of its volume (ties: most keywords)."""
+    for cluster in clusters.values():
+        weights: Dict[Any, Tuple[int, int]] = {}
+        for kw in cluster["keywords"]:
+            volume, count = weights.get(kw.get("intent"), (0, 0))
+            weights[kw.get("intent")] = (volume + kw["volume"], count + 1)
+        cluster["cluster_intent"] = max(weights, key=weights.get) if weights else None
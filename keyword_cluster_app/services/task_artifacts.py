@@ -0,0 +1,172 @@
+"""
+Per-task stage artifacts, for re-running a finished task with new parameters.
+
+An async task keeps the expensive intermediates of its run on local disk, so a
+re-run with another min_cluster_size or level starts from the latest reusable
+stage instead of from scratch:
+
+    embeddings.npy    unique-keyword embeddings (float16, the embedding store's precision)
+    codes.npy         keyword row -> unique keyword (int32)
+    volumes.npy       keyword volumes (int64)
+    texts.json        keyword texts
+    intents.json      intent result per unique keyword
+    reduced_<n_neighbors>x<n_components>.npy              UMAP coordinates (float32)
+    tree_<n_neighbors>x<n_components>_ms<min_samples>.npy  HDBSCAN single linkage tree
+    manifest.json     settings, kNN graph fingerprint and the stage files above
+
+HDBSCAN's condensed tree depends on min_cluster_size, so the single linkage
+tree (which only depends on min_samples) is what is kept: cluster selection
+for any min_cluster_size / cluster_selection_epsilon is a cheap pass over it.
+
+Redis holds a pointer per task (task:<id>:artifacts -> directory) that expires
+after TASK_ARTIFACTS_TTL_SECONDS; directories are pruned by age and count.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from keyword_cluster_app.config import (
+    TASK_ARTIFACTS_DIR,
+    TASK_ARTIFACTS_TTL_SECONDS,
+    TASK_ARTIFACTS_MAX_TASKS,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+UmapKey = Tuple[int, int]
+
+
+def task_artifacts_dir(task_id: str) -> str:
+    return os.path.join(TASK_ARTIFACTS_DIR, task_id)
+
+
+def redis_key(task_id: str) -> str:
+    return f"task:{task_id}:artifacts"
+
+
+def _reduced_file(key: UmapKey) -> str:
+    return f"reduced_{key[0]}x{key[1]}.npy"
+
+
+def _tree_file(key: UmapKey, min_samples: int) -> str:
+    return f"tree_{key[0]}x{key[1]}_ms{min_samples}.npy"
+
+
+def _save_npy(path: str, array: np.ndarray) -> None:
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]) -> None:
+    tmp_path = os.path.join(directory, f"{MANIFEST_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_FILE))
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """The artifact manifest; FileNotFoundError when the artifacts are gone."""
+    with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_task_artifacts(task_id: str, prepared: Dict[str, Any], settings: Dict[str, Any], knn_fingerprint: Optional[str] = None) -> str:
+    """
+    Writes the keyword-stage artifacts (embeddings, intents, texts, volumes)
+    of a task and returns the directory. Reduction / clustering stages are
+    added with `add_stage_artifacts`.
+    """
+    directory = task_artifacts_dir(task_id)
+    os.makedirs(directory, exist_ok=True)
+    _save_npy(os.path.join(directory, "embeddings.npy"), np.asarray(prepared["unique_embeddings"], dtype=np.float16))
+    _save_npy(os.path.join(directory, "codes.npy"), np.asarray(prepared["codes"], dtype=np.int32))
+    _save_npy(os.path.join(directory, "volumes.npy"), np.asarray(prepared["volumes"], dtype=np.int64))
+    with open(os.path.join(directory, "texts.json"), "w", encoding="utf-8") as f:
+        json.dump(prepared["original_texts"], f, ensure_ascii=False)
+    with open(os.path.join(directory, "intents.json"), "w", encoding="utf-8") as f:
+        json.dump(prepared["unique_intents"], f, ensure_ascii=False)
+    _write_manifest(directory, {
+        "task_id": task_id,
+        "created_at": time.time(),
+        "keywords": len(prepared["original_texts"]),
+        "cluster_unique_only": prepared["row_map"] is not None,
+        "settings": settings,
+        "knn_fingerprint": knn_fingerprint,
+        "reduced": {},
+        "trees": {},
+    })
+    prune_task_artifacts(keep=directory)
+    return directory
+
+
+def add_stage_artifacts(
+    directory: str,
+    reduced: Dict[UmapKey, np.ndarray],
+    trees: Dict[Tuple[UmapKey, int], np.ndarray],
+    knn_fingerprint: Optional[str] = None,
+) -> List[str]:
+    """
+    Adds UMAP coordinates and HDBSCAN single linkage trees to a task's
+    artifacts (existing ones are kept). Returns the stored stage names.
+    """
+    manifest = read_manifest(directory)
+    for key, coords in reduced.items():
+        name = _reduced_file(key)
+        if name not in manifest["reduced"].values():
+            _save_npy(os.path.join(directory, name), np.asarray(coords, dtype=np.float32))
+            manifest["reduced"][f"{key[0]}x{key[1]}"] = name
+    for (key, min_samples), tree in trees.items():
+        name = _tree_file(key, min_samples)
+        if name not in manifest["trees"].values():
+            _save_npy(os.path.join(directory, name), np.asarray(tree, dtype=np.float64))
+            manifest["trees"][f"{key[0]}x{key[1]}_ms{min_samples}"] = name
+    if knn_fingerprint and not manifest.get("knn_fingerprint"):
+        manifest["knn_fingerprint"] = knn_fingerprint
+    _write_manifest(directory, manifest)
+    return ["prepare"] + [f"reduce:{name}" for name in manifest["reduced"]] + [f"cluster:{name}" for name in manifest["trees"]]
+
+
+def load_keyword_stage(directory: str) -> Dict[str, Any]:
+    """Embeddings, codes, volumes, texts and intents saved by `save_task_artifacts`."""
+    with open(os.path.join(directory, "texts.json"), "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    with open(os.path.join(directory, "intents.json"), "r", encoding="utf-8") as f:
+        unique_intents = json.load(f)
+    return {
+        "original_texts": texts,
+        "volumes": np.load(os.path.join(directory, "volumes.npy")).tolist(),
+        "codes": np.load(os.path.join(directory, "codes.npy")).astype(np.int64),
+        "unique_embeddings": np.load(os.path.join(directory, "embeddings.npy")).astype(np.float32),
+        "unique_intents": unique_intents,
+    }
+
+
+def load_reduced(directory: str, manifest: Dict[str, Any], key: UmapKey) -> Optional[np.ndarray]:
+    name = manifest["reduced"].get(f"{key[0]}x{key[1]}")
+    return np.load(os.path.join(directory, name)) if name else None
+
+
+def load_tree(directory: str, manifest: Dict[str, Any], key: UmapKey, min_samples: int) -> Optional[np.ndarray]:
+    name = manifest["trees"].get(f"{key[0]}x{key[1]}_ms{min_samples}")
+    return np.load(os.path.join(directory, name)) if name else None
+
+
+def prune_task_artifacts(keep: Optional[str] = None) -> None:
+    """Removes task artifacts older than the TTL, and the oldest beyond TASK_ARTIFACTS_MAX_TASKS."""
+    try:
+        entries = [os.path.join(TASK_ARTIFACTS_DIR, name) for name in os.listdir(TASK_ARTIFACTS_DIR)]
+        entries = sorted((e for e in entries if os.path.isdir(e) and e != keep), key=os.path.getmtime, reverse=True)
+        now = time.time()
+        for i, path in enumerate(entries):
+            if i >= TASK_ARTIFACTS_MAX_TASKS - 1 or now - os.path.getmtime(path) > TASK_ARTIFACTS_TTL_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+    except OSError as e:
+        logger.warning(f"Task artifact cleanup failed: {e}")
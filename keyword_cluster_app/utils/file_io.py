@@ -1,9 +1,25 @@
 import os
 import pandas as pd
 import chardet
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from keyword_cluster_app.utils.text_processing import parse_volume_value
 
+SEP_CANDIDATES = [",", "\t", ";"]
+KEYWORD_COL_ALIASES = [
+    "keyword",
+    "keywords",
+    "search term",
+    "search terms",
+    "từ khóa",
+]
+VOLUME_COL_ALIASES = [
+    "avg. monthly searches",
+    "average monthly searches",
+    "search volume",
+    "volume",
+    "số lượng tìm kiếm",
+]
+
 def detect_file_encoding(path: str, sample_size: int = 4000) -> str:
     """
     Đoán encoding file dùng chardet.
@@ -14,6 +30,15 @@ def detect_file_encoding(path: str, sample_size: int = 4000) -> str:
     enc = result.get("encoding") or "utf-8"
     return enc
 
+def _match_columns(columns) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Tìm cột keyword và cột volume theo danh sách tên cột quen thuộc.
+    """
+    lowered_cols = {str(c).lower(): c for c in columns}
+    keyword_col = next((lowered_cols[a] for a in KEYWORD_COL_ALIASES if a in lowered_cols), None)
+    volume_col = next((lowered_cols[a] for a in VOLUME_COL_ALIASES if a in lowered_cols), None)
+    return keyword_col, volume_col
+
 def load_keywords_from_file(path: str) -> List[Dict[str, Any]]:
     """
     Đọc file keyword CSV hoặc TSV và trả về list gồm text và volume.
@@ -23,46 +48,18 @@ def load_keywords_from_file(path: str) -> List[Dict[str, Any]]:
         raise FileNotFoundError(f"File not found: {path}")
 
     encoding = detect_file_encoding(path)
-    sep_candidates = [",", "\t", ";"]
 
     df: Optional[pd.DataFrame] = None
     found_keyword_col = None
     found_volume_col = None
 
-    keyword_col_aliases = [
-        "keyword",
-        "keywords",
-        "search term",
-        "search terms",
-        "từ khóa",
-    ]
-    volume_col_aliases = [
-        "avg. monthly searches",
-        "average monthly searches",
-        "search volume",
-        "volume",
-        "số lượng tìm kiếm",
-    ]
-
     # Try reading with different separators
     temp_df = None
-    for sep in sep_candidates:
+    for sep in SEP_CANDIDATES:
         try:
             # Use on_bad_lines='skip' to handle messy CSVs
             temp_df = pd.read_csv(path, sep=sep, encoding=encoding, on_bad_lines='skip')
-            lowered_cols = {c.lower(): c for c in temp_df.columns}
-
-            current_keyword_col = None
-            for alias in keyword_col_aliases:
-                if alias in lowered_cols:
-                    current_keyword_col = lowered_cols[alias]
-                    break
-
-            current_volume_col = None
-            for alias in volume_col_aliases:
-                if alias in lowered_cols:
-                    current_volume_col = lowered_cols[alias]
-                    break
+            current_keyword_col, current_volume_col = _match_columns(temp_df.columns)
 
             if current_keyword_col:
                 df = temp_df
@@ -98,3 +95,50 @@ def load_keywords_from_file(path: str) -> List[Dict[str, Any]]:
         records.append({"text": text, "volume": volume})
 
     return records
+
+def iter_keyword_chunks(path: str, chunk_rows: int = 100000, sample_rows: int = 1000) -> Iterator[Tuple[List[str], List[int]]]:
+    """
+    Đọc file keyword theo từng khối (không nạp cả file vào RAM).
+    Dấu phân cách và tên cột được nhận dạng trên `sample_rows` dòng đầu.
+    Mỗi khối trả về (texts, volumes); dòng keyword rỗng bị bỏ qua.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File not found: {path}")
+
+    encoding = detect_file_encoding(path)
+    found = None
+    columns = "Unknown"
+    for sep in SEP_CANDIDATES:
+        try:
+            head = pd.read_csv(path, sep=sep, encoding=encoding, on_bad_lines='skip', nrows=sample_rows)
+        except Exception:
+            continue
+        columns = list(head.columns)
+        keyword_col, volume_col = _match_columns(head.columns)
+        if keyword_col:
+            found = (sep, keyword_col, volume_col)
+            break
+
+    if found is None:
+        raise ValueError(
+            "Không tìm thấy cột keyword trong file với các dấu phân cách thử nghiệm. "
+            f"Các cột hiện có: {columns}"
+        )
+
+    sep, keyword_col, volume_col = found
+    usecols = [keyword_col] if volume_col is None else [keyword_col, volume_col]
+    reader = pd.read_csv(
+        path, sep=sep, encoding=encoding, on_bad_lines='skip', usecols=usecols,
+        dtype=str, keep_default_na=False, chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        texts = chunk[keyword_col].str.strip()
+        keep = texts != ""
+        texts = texts[keep]
+        if texts.empty:
+            continue
+        if volume_col is None:
+            volumes = [0] * len(texts)
+        else:
+            volumes = chunk.loc[keep, volume_col].map(parse_volume_value).tolist()
+        yield texts.tolist(), volumes
@@ -1,28 +1,41 @@
 import re
-from typing import Any, List, Dict
+import unicodedata
+from typing import Any, Iterable, List, Dict
 import numpy as np
 import math
 
+# Khoảng trắng (trừ "\n", dấu phân tách khi xử lý cả cột) -> một dấu cách
+_WHITESPACE = re.compile(r"[^\S\n]+")
+# Chuẩn hóa lớp, tập, trang, bài + số ("lớp5" -> "lớp 5") – cực kỳ quan trọng với giáo dục VN
+_NUMBERED = re.compile(r"(lớp|tập|trang|bài) ?(\d+)")
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFC", text.lower())
+    return _NUMBERED.sub(r"\1 \2", _WHITESPACE.sub(" ", text))
+
 def clean_keyword(text: str) -> str:
     """
     Chuẩn hóa từ khóa:
+    - Chuẩn hóa Unicode NFC (dạng dựng sẵn và tổ hợp của cùng một từ là một).
     - Chuyển về chữ thường.
     - Xóa khoảng trắng thừa.
     - Chuẩn hóa các mẫu câu đặc thù (giáo dục).
     """
     if not isinstance(text, str):
         return ""
-    
-    text = text.lower()
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Chuẩn hóa lớp, tập, trang – cực kỳ quan trọng với giáo dục VN
-    text = re.sub(r'lớp\s*(\d+)', r'lớp \1', text)
-    text = re.sub(r'tập\s*(\d+)', r'tập \1', text)
-    text = re.sub(r'trang\s*(\d+)', r'trang \1', text)
-    text = re.sub(r'bài\s*(\d+)', r'bài \1', text)
-    
-    return text.strip()
+    return _normalize(text.replace("\n", " ")).strip()
+
+def clean_keywords(texts: Iterable[Any]) -> List[str]:
+    """
+    Phiên bản theo cột của `clean_keyword` (cùng kết quả): mỗi giá trị khác
+    nhau chỉ được chuẩn hóa một lần, và tất cả được xử lý trong một lượt
+    regex trên cả cột thay vì từng từ khóa.
+    """
+    texts = list(texts)
+    unique = list(dict.fromkeys(text for text in texts if isinstance(text, str)))
+    column = _normalize("\n".join(text.replace("\n", " ") for text in unique))
+    cleaned: Dict[str, str] = dict(zip(unique, (part.strip() for part in column.split("\n"))))
+    return [cleaned[text] if isinstance(text, str) else "" for text in texts]
 
 def parse_volume_value(value: Any) -> int:
     """
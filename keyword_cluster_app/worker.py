@@ -1,12 +1,18 @@
 # keyword_cluster_app/worker.py
+import asyncio
+import functools
 import logging
 import json
 from arq import ArqRedis
 from arq.connections import RedisSettings
-from typing import Dict, Any
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List
 
-from keyword_cluster_app.services.clustering_service import ClusteringService
-from keyword_cluster_app.config import REDIS_URL
+from keyword_cluster_app.services.clustering_service import ClusteringService, warm_up
+from keyword_cluster_app.embedding_pool import start_embedding_pool, shutdown_embedding_pool
+from keyword_cluster_app.config import REDIS_URL, TASK_ARTIFACTS_TTL_SECONDS, PROGRESS_UPDATE_INTERVAL_SECONDS
+from keyword_cluster_app.services.progress import ProgressTracker
+from keyword_cluster_app.services.task_artifacts import redis_key as artifacts_key, task_artifacts_dir
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -15,6 +21,43 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+class RedisProgress:
+    """
+    Progress callback for a job running in a worker thread: stage events get
+    elapsed time and ETAs, are throttled, and are written to Redis from the
+    event loop ("task:<id>:progress" as "NN%", "task:<id>:progress_detail" as JSON).
+    """
+
+    def __init__(self, redis: ArqRedis, task_id: str, loop: asyncio.AbstractEventLoop):
+        self.redis = redis
+        self.task_id = task_id
+        self.loop = loop
+        self.tracker = ProgressTracker(PROGRESS_UPDATE_INTERVAL_SECONDS)
+        self._pending: List[Future] = []
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        payload = self.tracker.update(event)
+        if payload is not None:
+            self._pending = [f for f in self._pending if not f.done()]
+            self._pending.append(asyncio.run_coroutine_threadsafe(self._publish(payload), self.loop))
+
+    async def _publish(self, payload: Dict[str, Any]) -> None:
+        await self.redis.set(f"task:{self.task_id}:progress", f"{int(payload['percent'])}%")
+        await self.redis.set(f"task:{self.task_id}:progress_detail", json.dumps(payload, ensure_ascii=False))
+
+    async def flush(self) -> None:
+        """Waits for queued updates, so none lands after the final status."""
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in self._pending), return_exceptions=True)
+
+async def _run_with_progress(redis: ArqRedis, task_id: str, run: Callable[..., Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+    """Runs a blocking clustering call in a thread, publishing its progress events."""
+    loop = asyncio.get_running_loop()
+    progress = RedisProgress(redis, task_id, loop)
+    try:
+        return await loop.run_in_executor(None, functools.partial(run, progress_callback=progress, **kwargs))
+    finally:
+        await progress.flush()
+
 async def background_process_clustering(ctx: Dict[str, Any], task_id: str, payload: Dict[str, Any]):
     """
     Background task to perform keyword clustering.
@@ -29,13 +72,29 @@ async def background_process_clustering(ctx: Dict[str, Any], task_id: str, paylo
     try:
         # Call the main clustering logic
         service = ClusteringService()
-        results = service.process_clustering(
+        common_args = dict(
             raw_keywords_with_volume=payload['raw_keywords_with_volume'],
-            level=payload.get('level', 'trung bình'),
             min_cluster_size_override=payload.get('min_cluster_size_override', payload.get('min_cluster_size', None)),
             clustering_method=payload.get('clustering_method', 'semantic'),
+            refine_mode=payload.get('refine_mode'),
+            refine_max_pairs=payload.get('refine_max_pairs'),
+            refine_time_budget=payload.get('refine_time_budget'),
+            partitioned=payload.get('partitioned'),
+            stages=payload.get('stages'),
         )
+        if payload.get('levels'):
+            results = await _run_with_progress(redis, task_id, service.process_clustering_levels, levels=payload['levels'], task_id=task_id, **common_args)
+        else:
+            results = await _run_with_progress(
+                redis, task_id, service.process_clustering,
+                level=payload.get('level', 'trung bình'), project_id=payload.get('project_id'), task_id=task_id, **common_args,
+            )
         
+        # Pointer to the stage artifacts, for re-runs with new parameters
+        level_results = list(results.get("levels", {}).values()) or [results]
+        if level_results[0].get("summary", {}).get("artifacts"):
+            await redis.set(artifacts_key(task_id), task_artifacts_dir(task_id), ex=TASK_ARTIFACTS_TTL_SECONDS)
+
         # Store results and update status to completed
         await redis.set(f"task:{task_id}:status", "completed")
         await redis.set(f"task:{task_id}:progress", "100%")
@@ -48,11 +107,93 @@ async def background_process_clustering(ctx: Dict[str, Any], task_id: str, paylo
         await redis.set(f"task:{task_id}:error", str(e))
         logger.exception(f"Task {task_id}: Failed during clustering.")
 
+async def background_rerun_clustering(ctx: Dict[str, Any], task_id: str, source_task_id: str, payload: Dict[str, Any]):
+    """
+    Background task to re-run a finished task with new parameters from its
+    stage artifacts (no re-embedding; UMAP only when its settings changed).
+    """
+    redis: ArqRedis = ctx['redis']
+
+    await redis.set(f"task:{task_id}:status", "in_progress")
+    await redis.set(f"task:{task_id}:progress", "0%")
+    logger.info(f"Task {task_id}: Re-running task {source_task_id} from its artifacts.")
+
+    try:
+        artifacts_dir = await redis.get(artifacts_key(source_task_id))
+        if artifacts_dir is None:
+            raise RuntimeError(f"Artifacts of task {source_task_id} have expired.")
+        artifacts_dir = artifacts_dir.decode('utf-8')
+        results = await _run_with_progress(
+            redis, task_id, ClusteringService().process_clustering_from_artifacts,
+            artifacts_dir=artifacts_dir,
+            level=payload.get('level', 'trung bình'),
+            levels=payload.get('levels'),
+            min_cluster_size_override=payload.get('min_cluster_size_override'),
+            refine_mode=payload.get('refine_mode'),
+            refine_max_pairs=payload.get('refine_max_pairs'),
+            refine_time_budget=payload.get('refine_time_budget'),
+            from_stage=payload.get('from_stage', 'auto'),
+        )
+        # The re-run shares (and extends) the source task's artifacts
+        await redis.set(artifacts_key(task_id), artifacts_dir, ex=TASK_ARTIFACTS_TTL_SECONDS)
+
+        await redis.set(f"task:{task_id}:status", "completed")
+        await redis.set(f"task:{task_id}:progress", "100%")
+        await redis.set(f"task:{task_id}:result", json.dumps(results, ensure_ascii=False))
+        logger.info(f"Task {task_id}: Re-run completed.")
+
+    except Exception as e:
+        await redis.set(f"task:{task_id}:status", "failed")
+        await redis.set(f"task:{task_id}:error", str(e))
+        logger.exception(f"Task {task_id}: Failed re-running task {source_task_id}.")
+
+async def background_recluster_project(ctx: Dict[str, Any], task_id: str, project_id: str):
+    """
+    Background task to fully re-cluster a clustering project (its keywords
+    plus the ones added since), replacing the persisted project.
+    """
+    redis: ArqRedis = ctx['redis']
+
+    await redis.set(f"task:{task_id}:status", "in_progress")
+    await redis.set(f"task:{task_id}:progress", "0%")
+    logger.info(f"Task {task_id}: Re-clustering project '{project_id}'.")
+
+    try:
+        results = await _run_with_progress(redis, task_id, ClusteringService().recluster_project, project_id=project_id)
+
+        await redis.set(f"task:{task_id}:status", "completed")
+        await redis.set(f"task:{task_id}:progress", "100%")
+        await redis.set(f"task:{task_id}:result", json.dumps(results, ensure_ascii=False))
+        logger.info(f"Task {task_id}: Project '{project_id}' re-clustered.")
+
+    except Exception as e:
+        await redis.set(f"task:{task_id}:status", "failed")
+        await redis.set(f"task:{task_id}:error", str(e))
+        logger.exception(f"Task {task_id}: Failed re-clustering project '{project_id}'.")
+
+async def startup(ctx: Dict[str, Any]):
+    """
+    Load the model and heavy clustering libraries once per worker process,
+    before the first job is picked up.
+    """
+    logger.info("Worker starting: warming up AI model and clustering pipeline...")
+    if warm_up():
+        logger.info("Worker warm-up complete.")
+    else:
+        logger.error("Worker warm-up failed: AI model could not be loaded.")
+
+    # Long-lived multi-process encoder for large jobs (no-op unless EMBEDDING_POOL_WORKERS > 0)
+    start_embedding_pool()
+
+async def shutdown(ctx: Dict[str, Any]):
+    shutdown_embedding_pool()
+
 class WorkerSettings:
-    functions = [background_process_clustering]
+    functions = [background_process_clustering, background_rerun_clustering, background_recluster_project]
+    on_startup = startup
+    on_shutdown = shutdown
     redis_settings = RedisSettings.from_dsn(REDIS_URL)
     max_jobs = 1 # Process one job at a time per worker instance
     keep_result = 3600 # Keep results for 1 hour (in seconds)
     keep_result_forever = False # Do not keep results forever
     job_timeout = 3600 # Max 1 hour for a job to complete
-    # You can add more settings here, e.g., on_startup, on_shutdown
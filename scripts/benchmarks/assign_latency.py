@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Load test for real-time keyword assignment (/assign).
+
+Open-loop: requests are scheduled at a fixed rate (--rps) for --duration
+seconds regardless of how fast earlier ones finish, and each latency is
+measured from its scheduled send time, so queueing delay is included.
+--unseen is the share of requests for keywords the embedding cache has
+not seen (variants with a random suffix), which forces an encoder call.
+
+Two targets:
+- in-process (default): the same MicroBatcher + centroid index the API uses,
+  without HTTP, to measure the assignment path itself;
+- --url http://host:port: POST /assign on a running API (stdlib HTTP client
+  in a thread pool, so the client's own overhead is included).
+
+Without --project-id, the sample file is clustered first into a project
+named "assign-benchmark".
+
+Usage:
+    python scripts/benchmarks/assign_latency.py [--rps 300] [--duration 10] [--unseen 0.2]
+        [--project-id ID] [--file data/sample/keywords_toan.csv] [--url http://localhost:8000 --api-key KEY]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))]
+
+
+def _keywords(args, rng):
+    from keyword_cluster_app.utils.file_io import load_keywords_from_file
+
+    texts = [kw["text"] for kw in load_keywords_from_file(args.file)]
+    total = int(args.rps * args.duration)
+    return [
+        f"{rng.choice(texts)} {rng.randrange(10 ** 6)}" if rng.random() < args.unseen else rng.choice(texts)
+        for _ in range(total)
+    ]
+
+
+def _ensure_project(args):
+    if args.project_id:
+        return args.project_id
+    from keyword_cluster_app.services.clustering_service import ClusteringService
+    from keyword_cluster_app.utils.file_io import load_keywords_from_file
+
+    print(f"Clustering {args.file} into project 'assign-benchmark'...")
+    ClusteringService().process_clustering(load_keywords_from_file(args.file), project_id="assign-benchmark")
+    return "assign-benchmark"
+
+
+async def _run_open_loop(keywords, rps, send):
+    loop = asyncio.get_running_loop()
+    start = loop.time() + 0.1
+    latencies, errors = [], 0
+
+    async def _one(i, keyword):
+        nonlocal errors
+        scheduled = start + i / rps
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        try:
+            await send(keyword)
+            latencies.append((loop.time() - scheduled) * 1000)
+        except Exception:
+            errors += 1
+
+    await asyncio.gather(*(_one(i, kw) for i, kw in enumerate(keywords)))
+    return sorted(latencies), errors, loop.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop latency test for keyword -> cluster assignment.")
+    parser.add_argument("--rps", type=float, default=300)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--unseen", type=float, default=0.2, help="Share of requests with keywords not in the embedding cache.")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--project-id", default=None)
+    parser.add_argument("--file", default=os.path.join(ROOT, "data", "sample", "keywords_toan.csv"))
+    parser.add_argument("--url", default=None, help="Base URL of a running API; in-process when omitted.")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", ""))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keywords = _keywords(args, rng)
+
+    if args.url:
+        if not args.project_id:
+            parser.error("--project-id is required with --url")
+        project_id = args.project_id
+        pool = ThreadPoolExecutor(max_workers=256)
+
+        def _post(keyword):
+            body = json.dumps({"project_id": project_id, "keyword": keyword, "top_k": args.top_k}).encode("utf-8")
+            req = urllib.request.Request(
+                f"{args.url.rstrip('/')}/assign", data=body,
+                headers={"Content-Type": "application/json", "X-API-Key": args.api_key},
+            )
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                resp.read()
+
+        async def send(keyword):
+            await asyncio.get_running_loop().run_in_executor(pool, _post, keyword)
+        batcher = None
+    else:
+        from keyword_cluster_app.model import get_model
+        from keyword_cluster_app.services.realtime_assign import assign_keyword, get_batcher, get_centroid_index
+
+        project_id = _ensure_project(args)
+        get_model()
+        index = get_centroid_index(project_id)
+        print(f"Project '{project_id}': {index.n_clusters} clusters.")
+
+        async def send(keyword):
+            await assign_keyword(project_id, keyword, args.top_k)
+        batcher = get_batcher()
+
+    async def _warm_and_run():
+        await asyncio.gather(*(send(kw) for kw in keywords[:50]))
+        if batcher is not None:
+            # Same as the API after startup: long-lived objects leave the collected generations
+            gc.collect()
+            gc.freeze()
+            batcher.stats.update(texts=0, batches=0, largest_batch=0)
+        return await _run_open_loop(keywords, args.rps, send)
+
+    latencies, errors, elapsed = asyncio.run(_warm_and_run())
+    target = args.url or "in-process"
+    print(f"Target: {target}, {len(keywords)} requests at {args.rps:.0f} rps (unseen {args.unseen:.0%}), top_k={args.top_k}")
+    print(f"Achieved: {len(latencies) / elapsed:.0f} rps, errors: {errors}")
+    print(f"Latency ms: p50 {_percentile(latencies, 50):.2f}  p95 {_percentile(latencies, 95):.2f}  "
+          f"p99 {_percentile(latencies, 99):.2f}  max {latencies[-1] if latencies else float('nan'):.2f}")
+    if batcher is not None and batcher.stats["batches"]:
+        print(f"Encoder batches: {batcher.stats['batches']}, mean size {batcher.stats['texts'] / batcher.stats['batches']:.1f}, "
+              f"largest {batcher.stats['largest_batch']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Parity check and throughput comparison between the PyTorch and ONNX (int8)
+embedding backends on a keyword file (default: data/sample/keywords_toan.csv).
+
+Reports per-keyword cosine drift (1 - cos(torch, onnx)) and keywords/second
+for each backend. Exits with code 1 if the max drift exceeds --max-drift.
+
+Usage:
+    python scripts/benchmarks/compare_embedding_backends.py [file] [--no-quantize]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from keyword_cluster_app.config import EMBEDDING_MODEL
+from keyword_cluster_app.utils.file_io import load_keywords_from_file
+from keyword_cluster_app.utils.text_processing import clean_keyword
+
+
+def time_encode(backend, texts, batch_size, repeats):
+    backend.encode(texts[:batch_size], batch_size=batch_size, normalize_embeddings=True)  # warm-up
+    best = float("inf")
+    embeddings = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        embeddings = backend.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        best = min(best, time.perf_counter() - start)
+    return np.asarray(embeddings, dtype=np.float32), best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare torch vs ONNX embedding backends.")
+    parser.add_argument("file_path", nargs="?", default="data/sample/keywords_toan.csv")
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-quantize", action="store_true", help="Compare against the fp32 ONNX graph.")
+    parser.add_argument("--max-drift", type=float, default=0.02, help="Fail if max(1 - cosine) exceeds this.")
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from keyword_cluster_app.model import OnnxEmbeddingBackend, onnx_model_dir
+
+    torch.set_num_threads(os.cpu_count() or 1)
+    texts = [clean_keyword(kw["text"]) for kw in load_keywords_from_file(args.file_path)]
+    print(f"Loaded {len(texts)} keywords from {args.file_path}")
+
+    torch_backend = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    onnx_backend = OnnxEmbeddingBackend(EMBEDDING_MODEL, onnx_model_dir(), quantize=not args.no_quantize)
+
+    torch_emb, torch_time = time_encode(torch_backend, texts, args.batch_size, args.repeats)
+    onnx_emb, onnx_time = time_encode(onnx_backend, texts, args.batch_size, args.repeats)
+
+    cosine = np.sum(torch_emb * onnx_emb, axis=1)
+    drift = 1.0 - cosine
+
+    label = "onnx-fp32" if args.no_quantize else "onnx-int8"
+    print(f"\n{'Backend':<12} {'Time (s)':>10} {'Keywords/s':>12}")
+    print(f"{'torch':<12} {torch_time:>10.2f} {len(texts) / torch_time:>12.1f}")
+    print(f"{label:<12} {onnx_time:>10.2f} {len(texts) / onnx_time:>12.1f}")
+    print(f"\nSpeedup: {torch_time / onnx_time:.2f}x")
+    print(
+        f"Cosine drift: mean={drift.mean():.5f} p99={np.percentile(drift, 99):.5f} "
+        f"max={drift.max():.5f} (min cosine {cosine.min():.4f})"
+    )
+
+    if drift.max() > args.max_drift:
+        print(f"FAIL: max drift {drift.max():.5f} > {args.max_drift}")
+        sys.exit(1)
+    print("Parity OK.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: keyword cleaning throughput.
+
+Compares, on the sample keyword files:
+- legacy: the former clean_keyword, five re.sub passes per keyword through
+  pandas .apply;
+- clean_keyword: the precompiled combined rules, one keyword at a time;
+- clean_keywords: the column version, each distinct text cleaned once in a
+  single regex pass over the whole column.
+
+--unique appends the row number to every keyword (no duplicates to share),
+the worst case for the column version. Also counts keywords whose cleaned
+text differs from the legacy one (only NFD input should).
+
+Usage:
+    python scripts/benchmarks/keyword_cleaning.py [--repeat 5] [--scale 20] [--unique] [files ...]
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+from keyword_cluster_app.utils.file_io import load_keywords_from_file  # noqa: E402
+from keyword_cluster_app.utils.text_processing import clean_keyword, clean_keywords  # noqa: E402
+
+
+def legacy_clean(text):
+    if not isinstance(text, str):
+        return ""
+    text = text.lower()
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'lớp\s*(\d+)', r'lớp \1', text)
+    text = re.sub(r'tập\s*(\d+)', r'tập \1', text)
+    text = re.sub(r'trang\s*(\d+)', r'trang \1', text)
+    text = re.sub(r'bài\s*(\d+)', r'bài \1', text)
+    return text.strip()
+
+
+def _best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword cleaning throughput: legacy per-keyword passes vs column cleaning.")
+    parser.add_argument("files", nargs="*", default=sorted(glob.glob(os.path.join(ROOT, "data", "sample", "*.csv"))))
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N timings.")
+    parser.add_argument("--scale", type=int, default=20, help="Repeat each file's keywords N times (larger column).")
+    parser.add_argument("--unique", action="store_true", help="Make every keyword distinct.")
+    args = parser.parse_args()
+
+    print(f"{'file':<24} {'keywords':>9} {'legacy kw/s':>12} {'single kw/s':>12} {'column kw/s':>12} {'speedup':>8} {'changed':>8}")
+    for path in args.files:
+        texts = [kw["text"] for kw in load_keywords_from_file(path)] * args.scale
+        if args.unique:
+            texts = [f"{text} {i}" for i, text in enumerate(texts)]
+        column = pd.Series(texts)
+        legacy_seconds, legacy = _best_of(args.repeat, lambda: column.apply(legacy_clean).tolist())
+        single_seconds, single = _best_of(args.repeat, lambda: [clean_keyword(t) for t in texts])
+        column_seconds, cleaned = _best_of(args.repeat, lambda: clean_keywords(column))
+
+        assert cleaned == single, "clean_keywords disagrees with clean_keyword"
+        changed = sum(1 for a, b in zip(legacy, cleaned) if a != b)
+        n = len(texts)
+        print(f"{os.path.basename(path):<24} {n:>9} {n / legacy_seconds:>12,.0f} {n / single_seconds:>12,.0f} "
+              f"{n / column_seconds:>12,.0f} {legacy_seconds / column_seconds:>7.1f}x {changed:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Partitioned vs monolithic clustering benchmark.
+
+Each mode runs in a fresh interpreter on the same keyword file (embeddings
+are warmed up first, so both modes measure clustering, not encoding). The
+script reports wall-clock, peak memory of the main process and of the
+largest child process (partition workers), cluster counts, and the
+agreement of the partitioned keyword->cluster assignment with the
+monolithic one (adjusted Rand index, normalized mutual information).
+
+The bundled sample files are small, so the partition size defaults to 500
+keywords to get several partitions; use --partition-size 20000 on real jobs.
+
+Usage:
+    python scripts/benchmarks/partitioned_clustering.py [--file data/sample/keywords_toan.csv]
+        [--level "trung bình"] [--partition-size 500] [--workers 0] [--method kmeans]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+_CHILD = r"""
+import json, resource, sys, time
+from keyword_cluster_app.utils.file_io import load_keywords_from_file
+from keyword_cluster_app.utils.text_processing import clean_keyword
+from keyword_cluster_app.model import get_embeddings
+from keyword_cluster_app.services.clustering_service import ClusteringService
+
+path, level, partitioned = sys.argv[1], sys.argv[2], sys.argv[3] == "1"
+keywords = load_keywords_from_file(path)
+service = ClusteringService()
+get_embeddings(list(dict.fromkeys(clean_keyword(k["text"]) for k in keywords)), normalize_embeddings=True)
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+start = time.perf_counter()
+result = service.process_clustering(keywords, level=level, partitioned=partitioned)
+seconds = time.perf_counter() - start
+
+cluster_of = {}
+for key, cluster in result["clusters"].items():
+    for kw in cluster["keywords"]:
+        cluster_of.setdefault(kw["text"], key)
+print(json.dumps({
+    "seconds": seconds,
+    "baseline_mb": baseline,
+    "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "child_peak_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    "clusters": result["summary"]["total_clusters_found"],
+    "noise": result["summary"]["noise_keywords_found"],
+    "partitioning": result["summary"].get("partitioning"),
+    "assignment": [cluster_of.get(k["text"]) for k in keywords],
+}, ensure_ascii=False))
+"""
+
+
+def run(path: str, level: str, partitioned: bool, env: dict) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", _CHILD, path, level, "1" if partitioned else "0"],
+        cwd=ROOT, capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "benchmark child failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare partitioned and monolithic clustering.")
+    parser.add_argument("--file", default=os.path.join(ROOT, "data", "sample", "keywords_toan.csv"))
+    parser.add_argument("--level", default="trung bình")
+    parser.add_argument("--partition-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=0, help="Partition worker processes (0 = all cores).")
+    parser.add_argument("--method", default="kmeans", choices=["kmeans", "intent"])
+    args = parser.parse_args()
+
+    from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(p for p in (ROOT, os.environ.get("PYTHONPATH")) if p),
+        "PARTITION_TARGET_SIZE": str(args.partition_size),
+        "PARTITION_MAX_WORKERS": str(args.workers),
+        "PARTITION_METHOD": args.method,
+    }
+    monolithic = run(args.file, args.level, False, env)
+    partitioned = run(args.file, args.level, True, env)
+
+    print(f"File: {args.file} ({len(monolithic['assignment'])} keywords), level '{args.level}'")
+    if partitioned["partitioning"]:
+        p = partitioned["partitioning"]
+        print(f"Partitions: {p['partitions']} ({args.method}, largest {p['largest_partition']}), "
+              f"{p['workers']} workers, merged clusters {p['merged_clusters']}")
+    else:
+        print("Partitioned run fell back to monolithic (input not larger than one partition).")
+
+    print(f"\n{'Mode':<12} {'Wall (s)':>9} {'Peak RSS (MB)':>14} {'+ over baseline':>16} {'Child peak (MB)':>17} {'Clusters':>9} {'Noise':>6}")
+    for name, r in (("monolithic", monolithic), ("partitioned", partitioned)):
+        child = f"{r['child_peak_mb']:.0f}" if r["child_peak_mb"] else "-"
+        print(f"{name:<12} {r['seconds']:>9.2f} {r['peak_mb']:>14.0f} {r['peak_mb'] - r['baseline_mb']:>16.0f} {child:>17} {r['clusters']:>9} {r['noise']:>6}")
+
+    a, b = monolithic["assignment"], partitioned["assignment"]
+    print(f"\nAgreement with monolithic: ARI {adjusted_rand_score(a, b):.3f}, NMI {normalized_mutual_info_score(a, b):.3f}")
+    print(f"Speed-up: {monolithic['seconds'] / partitioned['seconds']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
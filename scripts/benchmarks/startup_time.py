@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark with a budget.
+
+Each target runs in a fresh interpreter (best of --repeats runs). The script
+also lists heavy libraries that got imported and exits with code 1 when a
+target exceeds its budget or pulls in a library it should load lazily.
+
+Usage:
+    python scripts/benchmarks/startup_time.py [--scale 2.0]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "umap", "hdbscan", "sklearn", "numba", "transformers"]
+
+_PROBE = (
+    "import sys, time; t = time.perf_counter(); {stmt}; "
+    "elapsed = time.perf_counter() - t; "
+    "heavy = [m for m in {heavy!r} if m in sys.modules]; "
+    "print(repr((elapsed, heavy)))"
+)
+
+# name -> (statement, budget in seconds)
+TARGETS = {
+    "cli --help": ("import runpy, sys; sys.argv = ['cli', '--help']\ntry:\n    runpy.run_module('keyword_cluster_app.cli', run_name='__main__')\nexcept SystemExit:\n    pass", 1.0),
+    "import model": ("import keyword_cluster_app.model", 1.0),
+    "import clustering_service": ("import keyword_cluster_app.services.clustering_service", 2.0),
+    "import worker": ("import keyword_cluster_app.worker", 2.5),
+    "import api": ("import keyword_cluster_app.api", 3.0),
+}
+
+
+def measure(stmt: str):
+    code = _PROBE.format(stmt="exec(" + repr(stmt) + ")", heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        return None, wall, [], proc.stderr.strip().splitlines()[-1:] or ["failed"]
+    elapsed, heavy = eval(proc.stdout.strip().splitlines()[-1])
+    return elapsed, wall, heavy, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import/startup time against a budget.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=float(os.getenv("STARTUP_BUDGET_SCALE", "1.0")),
+                        help="Multiply every budget (slow CI machines).")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'Target':<28} {'Import (s)':>10} {'Process (s)':>12} {'Budget (s)':>11}  Heavy modules")
+    for name, (stmt, budget) in TARGETS.items():
+        budget *= args.scale
+        runs = [measure(stmt) for _ in range(args.repeats)]
+        errors = [r[3] for r in runs if r[3]]
+        if errors:
+            print(f"{name:<28} {'error':>10} {'':>12} {budget:>11.2f}  {errors[0][0]}")
+            failed = True
+            continue
+        best_import = min(r[0] for r in runs)
+        best_wall = min(r[1] for r in runs)
+        heavy = runs[0][2]
+        status = "" if best_import <= budget and not heavy else "  <-- OVER BUDGET" if best_import > budget else "  <-- EAGER IMPORT"
+        print(f"{name:<28} {best_import:>10.2f} {best_wall:>12.2f} {budget:>11.2f}  {', '.join(heavy) or '-'}{status}")
+        failed = failed or bool(status)
+
+    if failed:
+        print("\nFAIL: startup budget exceeded.")
+        sys.exit(1)
+    print("\nStartup budget OK.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import numpy as np
+
+from keyword_cluster_app.services.cross_encoder_refiner import CrossEncoderRefiner, select_uncertain
+
+
+class _CountingCrossEncoder:
+    """Scores a pair by word overlap; records every predict call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append([tuple(p) for p in pairs])
+        return np.array([len(set(a.split()) & set(b.split())) * 3.0 - 3.0 for a, b in pairs], dtype=np.float32)
+
+
+def _cluster(name, texts):
+    return {
+        "cluster_name": name,
+        "keywords": [{"text": t, "volume": 10, "matching_point": 50.0} for t in texts],
+        "total_volume_topic": 10 * len(texts),
+    }
+
+
+def test_score_pairs_single_length_sorted_predict_and_cache():
+    model = _CountingCrossEncoder()
+    refiner = CrossEncoderRefiner(model, batch_size=4, cache_size=100)
+    pairs = [("giá vàng hôm nay", "giá vàng"), ("a", "b"), ("giá vàng hôm nay", "giá vàng"), ("xe", "xe máy")]
+
+    stats = {}
+    scores = refiner.score_pairs(pairs, stats=stats)
+
+    assert len(model.calls) == 1
+    lengths = [len(a) + len(b) for a, b in model.calls[0]]
+    assert lengths == sorted(lengths)
+    assert len(model.calls[0]) == 3  # duplicate pair scored once
+    assert scores[0] == scores[2]
+    assert stats == {"pairs": 4, "scored_pairs": 3, "cached_pairs": 0}
+
+    stats = {}
+    again = refiner.score_pairs(pairs, stats=stats)
+    assert len(model.calls) == 1
+    np.testing.assert_array_equal(again, scores)
+    assert stats["cached_pairs"] == 4
+
+
+def test_refine_splits_scores_back_per_cluster():
+    model = _CountingCrossEncoder()
+    refiner = CrossEncoderRefiner(model)
+    clusters = {
+        "giá vàng": _cluster("giá vàng", ["giá vàng", "giá vàng sjc", "thời tiết"]),
+        "xe máy": _cluster("xe máy", ["xe máy", "xe máy điện"]),
+        "lẻ": _cluster("lẻ", ["lẻ"]),
+    }
+
+    refined, rejected = refiner.refine(clusters)
+
+    assert len(model.calls) == 1
+    assert sorted(model.calls[0]) == sorted([("giá vàng", "giá vàng sjc"), ("giá vàng", "thời tiết"), ("xe máy", "xe máy điện")])
+    assert [kw["text"] for kw in rejected] == ["thời tiết"]
+    assert [kw["text"] for kw in refined["giá vàng"]["keywords"]] == ["giá vàng", "giá vàng sjc"]
+    assert refined["giá vàng"]["total_volume_topic"] == 20
+    assert refined["giá vàng"]["keywords"][0]["matching_point"] == 50.0  # name keyword untouched
+    assert refined["xe máy"]["keywords"][1]["matching_point"] == 70.0
+    assert set(refined) == {"giá vàng", "xe máy", "lẻ"}
+
+
+def test_cache_evicts_least_recently_used():
+    model = _CountingCrossEncoder()
+    refiner = CrossEncoderRefiner(model, cache_size=2)
+    refiner.score_pairs([("a", "x"), ("b", "x")])
+    refiner.score_pairs([("a", "x")])  # refresh ("a", "x")
+    refiner.score_pairs([("c", "x")])  # evicts ("b", "x")
+
+    assert len(refiner.cache) == 2
+    refiner.score_pairs([("a", "x"), ("b", "x")])
+    assert model.calls[-1] == [("b", "x")]
+
+
+def test_gated_refine_checks_only_candidates_within_pair_budget():
+    model = _CountingCrossEncoder()
+    refiner = CrossEncoderRefiner(model)
+    clusters = {"xe máy": _cluster("xe máy", ["xe máy", "xe máy điện", "xe máy cũ", "mũ bảo hiểm"])}
+    clusters["xe máy"]["keywords"][1]["matching_point"] = 97.0
+    clusters["xe máy"]["keywords"][2]["matching_point"] = 60.0
+    clusters["xe máy"]["keywords"][3]["matching_point"] = 40.0
+
+    stats = {}
+    refined, rejected = refiner.refine(clusters, stats=stats, candidates={"xe máy": [2, 3]}, max_pairs=1)
+
+    # Only the least certain candidate fits in the budget
+    assert model.calls == [[("xe máy", "mũ bảo hiểm")]]
+    assert [kw["text"] for kw in rejected] == ["mũ bảo hiểm"]
+    assert refined["xe máy"]["keywords"][2]["matching_point"] == 60.0
+    assert stats["mode"] == "gated"
+    assert stats["eligible_pairs"] == 3
+    assert stats["checked_pairs"] == 1
+    assert stats["skipped_pairs"] == 2
+
+
+def test_select_uncertain_uses_matching_point_and_flagged_rows():
+    clusters = {
+        "a": _cluster("a", ["a", "a b", "a c"]),
+        "d": _cluster("d", ["d", "d e"]),
+    }
+    clusters["a"]["keywords"][1]["matching_point"] = 95.0
+    clusters["a"]["keywords"][2]["matching_point"] = 70.0
+    clusters["d"]["keywords"][0]["matching_point"] = 100.0
+    clusters["d"]["keywords"][1]["matching_point"] = 99.0
+    cluster_rows = {"a": [0, 2, 4], "d": [1, 3]}
+    flagged = np.array([False, False, False, True, False])
+
+    candidates = select_uncertain(clusters, cluster_rows, flagged, min_matching_point=80.0)
+
+    assert candidates == {"a": [0, 2], "d": [1]}
@@ -0,0 +1,45 @@
+import numpy as np
+
+from keyword_cluster_app.embedding_cache import EmbeddingLRUCache, _KEY_OVERHEAD_BYTES
+
+
+def _budget_for(n_entries: int, dim: int) -> int:
+    return n_entries * (dim * 4 + _KEY_OVERHEAD_BYTES)
+
+
+def test_cache_respects_byte_budget_and_evicts_lru():
+    cache = EmbeddingLRUCache(_budget_for(2, 4))
+    cache.put("a", np.full(4, 1.0))
+    cache.put("b", np.full(4, 2.0))
+    cache.get("a")  # "b" is now least recently used
+    cache.put("c", np.full(4, 3.0))
+
+    assert cache.capacity == 2
+    assert "b" not in cache
+    np.testing.assert_array_equal(cache.get("a"), np.full(4, 1.0))
+    np.testing.assert_array_equal(cache.get("c"), np.full(4, 3.0))
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_get_returns_copy_safe_from_slot_reuse():
+    cache = EmbeddingLRUCache(_budget_for(1, 3))
+    cache.put("a", np.array([1.0, 2.0, 3.0]))
+    vector = cache.get("a")
+    cache.put("b", np.array([9.0, 9.0, 9.0]))
+
+    np.testing.assert_array_equal(vector, [1.0, 2.0, 3.0])
+    assert cache.get("a") is None
+
+
+def test_cache_stats_counts_hits_and_misses():
+    cache = EmbeddingLRUCache(_budget_for(10, 2))
+    cache.put("a", np.ones(2))
+    cache.get("a")
+    cache.get("missing")
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["entries"] == 1
+    assert stats["slab_bytes"] <= stats["max_bytes"]
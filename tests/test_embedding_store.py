@@ -0,0 +1,37 @@
+import numpy as np
+
+from keyword_cluster_app.embedding_store import EmbeddingStore
+
+
+def test_embedding_store_roundtrip(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "emb.sqlite3"), "test-model")
+    vectors = np.random.default_rng(0).normal(size=(3, 8)).astype(np.float32)
+    store.put_many(["học toán lớp 5", "giải bài tập", "mua iphone"], vectors)
+
+    found = store.get_many(["học toán lớp 5", "không có", "mua iphone"])
+
+    assert set(found) == {"học toán lớp 5", "mua iphone"}
+    assert found["mua iphone"].dtype == np.float32
+    np.testing.assert_allclose(found["học toán lớp 5"], vectors[0], atol=1e-2)
+    assert store.count() == 3
+
+
+def test_embedding_store_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    EmbeddingStore(path, "model-a").put_many(["keyword"], np.ones((1, 4), dtype=np.float32))
+
+    other = EmbeddingStore(path, "model-b")
+
+    assert other.get_many(["keyword"]) == {}
+    assert other.count() == 0
+
+
+def test_embedding_store_persists_across_instances(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    first = EmbeddingStore(path, "test-model")
+    first.put_many(["keyword"], np.full((1, 4), 0.5, dtype=np.float32))
+    first.close()
+
+    found = EmbeddingStore(path, "test-model").get_many(["keyword"])
+
+    np.testing.assert_allclose(found["keyword"], np.full(4, 0.5))
@@ -0,0 +1,45 @@
+import numpy as np
+
+from keyword_cluster_app.encoding_scheduler import encode_bucketed, padding_ratio, plan_batches
+
+
+class _LengthEncoder:
+    """Fake backend: embedding = [number of words, position-independent id]."""
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, normalize_embeddings=False):
+        self.batches.append(list(texts))
+        return np.array([[len(t.split()), sum(map(ord, t))] for t in texts], dtype=np.float32)
+
+
+def test_plan_batches_respects_token_budget_and_covers_all():
+    lengths = np.array([3, 12, 4, 3, 15, 5, 4, 3])
+    batches = plan_batches(lengths, token_budget=16, max_batch_size=100)
+
+    covered = np.sort(np.concatenate(batches))
+    np.testing.assert_array_equal(covered, np.arange(len(lengths)))
+    for batch in batches:
+        assert len(batch) == 1 or len(batch) * lengths[batch].max() <= 16
+
+
+def test_plan_batches_reduces_padding_vs_input_order():
+    lengths = np.array([2, 14, 3, 13, 2, 15, 3, 12])
+    fixed = [np.arange(0, 4), np.arange(4, 8)]
+    bucketed = plan_batches(lengths, token_budget=32, max_batch_size=4)
+
+    assert padding_ratio(lengths, bucketed) < padding_ratio(lengths, fixed)
+
+
+def test_encode_bucketed_restores_input_order():
+    texts = ["một hai ba bốn năm", "a", "học toán", "giải bài tập toán lớp 5 tập 1", "x y"]
+    encoder = _LengthEncoder()
+    stats = {}
+
+    result = encode_bucketed(encoder, texts, normalize_embeddings=False, token_budget=8, stats=stats)
+
+    expected = encoder.encode(texts)
+    np.testing.assert_array_equal(result, expected)
+    assert stats["batches"] == len(encoder.batches) - 1
+    assert 0.0 <= stats["padding_ratio"] < 1.0
@@ -0,0 +1,60 @@
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+from keyword_cluster_app.services.hybrid_representation import HybridRepresentation, build_lexical_block
+
+
+TEXTS = ["giá vàng hôm nay", "giá vàng sjc", "vàng 9999", "xe máy điện", "xe máy cũ", "mũ bảo hiểm", "giá xe máy"]
+
+
+def _dense(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, 6)).astype(np.float32)
+
+
+def test_similarity_is_weighted_sum_of_dense_and_lexical_cosine():
+    dense = _dense(len(TEXTS))
+    lexical = build_lexical_block(TEXTS, "tfidf")
+    representation = HybridRepresentation(dense, lexical, semantic_weight=0.7)
+
+    unit = dense / np.linalg.norm(dense, axis=1, keepdims=True)
+    expected = 0.7 * unit @ unit.T + 0.3 * (lexical @ lexical.T).toarray()
+    np.testing.assert_allclose(representation.similarity(slice(2, 5)), expected[2:5], atol=1e-5)
+
+    rows, cols = np.array([0, 3, 6]), np.array([1, 4, 3])
+    np.testing.assert_allclose(representation.pair_similarity(rows, cols), expected[rows, cols], atol=1e-5)
+
+    # Same cosine as the weighted stacked matrix
+    stacked = hstack([csr_matrix(np.sqrt(0.7) * unit), np.sqrt(0.3) * lexical]).toarray()
+    np.testing.assert_allclose(representation.stacked().toarray(), stacked, atol=1e-6)
+
+
+def test_exact_knn_is_chunk_independent_and_self_first():
+    dense = _dense(40, seed=1)
+    texts = [TEXTS[i % len(TEXTS)] + f" {i % 5}" for i in range(40)]
+    representation = HybridRepresentation(dense, build_lexical_block(texts, "tfidf"), semantic_weight=0.6)
+
+    indices, distances = representation.exact_knn(5)
+    chunked_indices, chunked_distances = representation.exact_knn(5, max_chunk_bytes=40 * 4 * 3)
+
+    np.testing.assert_array_equal(indices, chunked_indices)
+    np.testing.assert_allclose(distances, chunked_distances)
+    np.testing.assert_array_equal(indices[:, 0], np.arange(40))
+    assert np.all(distances[:, 0] == 0.0)
+    assert np.all(np.diff(distances, axis=1) >= -1e-6)
+
+    expected = 1.0 - representation.similarity(slice(0, 40))
+    np.fill_diagonal(expected, 0.0)
+    np.testing.assert_allclose(np.sort(expected, axis=1)[:, :5], distances, atol=1e-5)
+
+
+def test_fixed_width_lexical_blocks():
+    hashed = build_lexical_block(TEXTS, "hashed")
+    assert hashed.shape[1] == 4096
+
+    svd = build_lexical_block(TEXTS, "svd")
+    assert isinstance(svd, np.ndarray) and svd.shape[0] == len(TEXTS)
+
+    representation = HybridRepresentation(_dense(len(TEXTS)), svd)
+    assert not representation.lexical_is_sparse
+    assert isinstance(representation.umap_input(has_precomputed_knn=True), np.ndarray)
+    assert representation.config_key() != HybridRepresentation(_dense(len(TEXTS)), svd, semantic_weight=0.5).config_key()
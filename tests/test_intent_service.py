@@ -0,0 +1,114 @@
+import re
+
+import numpy as np
+import pytest
+
+from keyword_cluster_app.services import intent_service
+from keyword_cluster_app.services.intent_service import IntentMatcher, IntentService
+
+
+def _pattern_loop(keyword):
+    """Priority order of the patterns, with whole-word matching."""
+    for main_intent, sub_intents in IntentService.INTENT_PATTERNS.items():
+        for sub_intent, patterns in sub_intents.items():
+            if any(re.search(rf"\b{pattern}\b", keyword.lower()) for pattern in patterns):
+                return main_intent, sub_intent
+    return None
+
+
+KEYWORDS = [
+    "giá vàng hôm nay", "giáo trình toán lớp 10", "thay lốp xe", "iphone 15 hay 15 pro",
+    "đánh giá iphone 15", "top 10 điện thoại bán chạy", "tải app ngân hàng", "happy birthday",
+    "Cách Làm Bánh", "so sánh a vs b", "shopee", "là gì", "", "xe\nmáy mua",
+]
+
+
+def test_matcher_keeps_pattern_priority_and_matches_whole_words():
+    matcher = IntentService.matcher()
+
+    assert [matcher.match(kw) for kw in KEYWORDS] == [_pattern_loop(kw.replace("\n", " ")) for kw in KEYWORDS]
+    assert matcher.match("thay lốp xe") is None and matcher.match("giáo trình") == ("INFORMATIONAL", "KNOWLEDGE")
+    # "giá" (PRICE) outranks "đánh giá" (REVIEW), as before
+    assert matcher.match("đánh giá") == ("TRANSACTIONAL", "PRICE")
+    assert IntentService.matcher() is matcher
+
+
+def test_match_many_agrees_with_match():
+    matcher = IntentService.matcher()
+
+    labels = matcher.match_many(KEYWORDS)
+
+    assert [matcher.labels[i] if i >= 0 else None for i in labels.tolist()] == [matcher.match(kw) for kw in KEYWORDS]
+    assert matcher.match_many([]).tolist() == []
+    with pytest.raises(ValueError):
+        IntentMatcher({"X": {"Y": [r"mua\w*"]}})
+
+
+def test_classify_batch_uses_patterns_before_the_semantic_fallback():
+    service = IntentService()
+
+    results = service.classify_batch(["mua xe", "xe đạp"])
+
+    assert results == [
+        {"intent": "TRANSACTIONAL", "sub_intent": "BUY"},
+        {"intent": "UNCATEGORIZED", "sub_intent": "NONE"},
+    ]
+    assert results[0] == service.classify("mua xe")
+
+
+class _PrototypeEncoder:
+    """Fake backend: prototype i -> unit vector e_i."""
+
+    def __init__(self):
+        self.calls = 0
+        self.index = {text: i for i, text in enumerate(IntentService.INTENT_PROTOTYPES.values())}
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, normalize_embeddings=False):
+        self.calls += 1
+        return np.eye(len(self.index), dtype=np.float32)[[self.index[t] for t in texts]]
+
+
+@pytest.fixture
+def prototype_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(intent_service, "EMBEDDING_STORE_PATH", str(tmp_path / "store.sqlite3"))
+    monkeypatch.setattr(intent_service, "ENABLE_EMBEDDING_STORE", True)
+    monkeypatch.setattr(intent_service, "_prototypes", {})
+    return tmp_path
+
+
+def test_semantic_fallback_scores_unmatched_rows_in_one_block(prototype_store):
+    model = _PrototypeEncoder()
+    keys = list(IntentService.INTENT_PROTOTYPES)
+    embeddings = np.zeros((4, len(keys)), dtype=np.float32)
+    embeddings[0, 0] = 1.0                       # regex match, embedding ignored
+    embeddings[1, keys.index(("NAVIGATIONAL", "LOCATION"))] = 2.0
+    embeddings[2, [1, 2]] = [0.3, 1.0]           # cosine 0.96 to DISCOUNT
+    embeddings[3, :] = 1.0                       # cosine 0.29 to every prototype
+    progress = []
+
+    results = IntentService().classify_batch(["mua xe", "xe a", "xe b", "xe c"], embeddings, model, lambda done, total: progress.append(done))
+
+    assert [(r["intent"], r["sub_intent"]) for r in results] == [
+        ("TRANSACTIONAL", "BUY"), ("NAVIGATIONAL", "LOCATION"), ("TRANSACTIONAL", "DISCOUNT"), ("UNCATEGORIZED", "NONE"),
+    ]
+    assert [IntentService().classify(kw, emb, model) for kw, emb in zip(["xe a", "xe c"], embeddings[[1, 3]])] == [results[1], results[3]]
+    assert progress == [1, 4] and model.calls == 1
+
+
+def test_prototypes_are_encoded_once_and_persisted(prototype_store, monkeypatch):
+    model = _PrototypeEncoder()
+    keys, vectors = intent_service.get_prototype_embeddings(IntentService.INTENT_PROTOTYPES, model)
+    assert intent_service.get_prototype_embeddings(IntentService.INTENT_PROTOTYPES, model)[1] is vectors
+    assert model.calls == 1 and len(list(prototype_store.glob("intent_prototypes_*.npz"))) == 1
+
+    # A new process loads them from disk; changed prototype texts are re-encoded
+    monkeypatch.setattr(intent_service, "_prototypes", {})
+    reloaded = _PrototypeEncoder()
+    np.testing.assert_array_equal(intent_service.get_prototype_embeddings(IntentService.INTENT_PROTOTYPES, reloaded)[1], vectors)
+    assert reloaded.calls == 0
+
+    monkeypatch.setattr(intent_service, "_prototypes", {})
+    changed = dict(IntentService.INTENT_PROTOTYPES)
+    changed[keys[0]] = IntentService.INTENT_PROTOTYPES[keys[1]]
+    intent_service.get_prototype_embeddings(changed, reloaded)
+    assert reloaded.calls == 1
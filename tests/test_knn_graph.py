@@ -0,0 +1,72 @@
+import numpy as np
+
+from keyword_cluster_app.services import knn_graph
+from keyword_cluster_app.services.hybrid_representation import HybridRepresentation
+from keyword_cluster_app.services.knn_graph import KnnGraph, build_knn, get_or_build_knn_graph
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_build_knn_matches_brute_force_with_exact_self_distance():
+    rng = np.random.default_rng(0)
+    x = _unit(rng.normal(size=(200, 8)))
+
+    indices, distances = build_knn(HybridRepresentation(x), 5)
+
+    exact = 1.0 - x @ x.T
+    expected = np.argsort(exact, axis=1, kind="stable")[:, :5]
+    np.testing.assert_array_equal(np.sort(indices, axis=1), np.sort(expected, axis=1))
+    np.testing.assert_array_equal(indices[:, 0], np.arange(200))
+    assert np.all(distances[:, 0] == 0.0)
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+
+def test_similar_skips_self_and_duplicate_texts():
+    texts = ["giá vàng", "giá vàng", "giá vàng sjc", "vàng 9999"]
+    indices = np.array([[0, 1, 2, 3], [1, 0, 2, 3], [2, 0, 1, 3], [3, 2, 0, 1]], dtype=np.int32)
+    distances = np.array([[0, 0, 0.1, 0.3], [0, 0, 0.1, 0.3], [0, 0.1, 0.1, 0.2], [0, 0.2, 0.3, 0.3]], dtype=np.float32)
+    graph = KnnGraph(indices, distances, texts, "fp")
+
+    assert graph.similar("giá vàng", top_n=5) == [
+        {"text": "giá vàng sjc", "similarity": 0.9},
+        {"text": "vàng 9999", "similarity": 0.7},
+    ]
+    assert graph.similar("không có", top_n=5) == []
+
+
+def test_graph_is_cached_by_fingerprint(tmp_path, monkeypatch):
+    monkeypatch.setattr(knn_graph, "KNN_GRAPH_DIR", str(tmp_path))
+    rng = np.random.default_rng(1)
+    x = _unit(rng.normal(size=(50, 8)))
+    texts = [f"kw {i}" for i in range(50)]
+
+    representation = HybridRepresentation(x)
+    stats = {}
+    built = get_or_build_knn_graph(representation, texts, 6, stats=stats)
+    assert stats["cached"] is False
+
+    stats = {}
+    loaded = get_or_build_knn_graph(representation, texts, 6, stats=stats)
+    assert stats["cached"] is True
+    assert loaded.fingerprint == built.fingerprint
+    np.testing.assert_array_equal(loaded.indices, built.indices)
+    assert loaded.texts == texts
+
+    umap_indices, umap_distances = loaded.for_umap(4)
+    assert umap_indices.shape == (50, 4) and umap_distances.shape == (50, 4)
+
+
+def test_approximate_knn_reranks_candidates_with_exact_similarity(monkeypatch):
+    monkeypatch.setattr(knn_graph, "_EXACT_MAX_ROWS", 10)
+    rng = np.random.default_rng(2)
+    representation = HybridRepresentation(rng.normal(size=(300, 8)))
+
+    indices, distances = build_knn(representation, 5)
+    exact_indices, exact_distances = representation.exact_knn(5)
+
+    np.testing.assert_array_equal(indices[:, 0], np.arange(300))
+    assert np.all(distances[:, 0] == 0.0)
+    assert np.mean(np.sort(indices, axis=1) == np.sort(exact_indices, axis=1)) > 0.95
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "umap", "hdbscan", "sklearn", "numba"]
+
+
+def _imported_heavy_modules(statement: str):
+    code = f"import sys; {statement}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return [m for m in proc.stdout.strip().split(",") if m]
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "keyword_cluster_app.model",
+        "keyword_cluster_app.cli",
+        "keyword_cluster_app.services.clustering_service",
+    ],
+)
+def test_import_does_not_load_model_or_heavy_libraries(module):
+    assert _imported_heavy_modules(f"import {module}") == []
+
+
+def test_model_is_not_loaded_at_import():
+    proc = subprocess.run(
+        [sys.executable, "-c", "import keyword_cluster_app.model as m; print(m.is_model_loaded())"],
+        capture_output=True, text=True,
+    )
+    assert proc.stdout.strip() == "False"
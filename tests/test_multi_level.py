@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("hdbscan")
+
+from hdbscan import HDBSCAN
+
+from keyword_cluster_app.services.clustering_service import ClusteringService
+
+
+def _blobs(seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=8.0, size=(12, 5))
+    sizes = rng.integers(3, 40, size=12)
+    return np.vstack([c + rng.normal(size=(s, 5)) for c, s in zip(centers, sizes)])
+
+
+def test_levels_sharing_min_samples_match_independent_fits():
+    x = _blobs()
+    specs = {
+        "a": ({"min_samples": 2, "cluster_selection_epsilon": 0.0}, 5),
+        "b": ({"min_samples": 2, "cluster_selection_epsilon": 0.5}, 15),
+        "c": ({"min_samples": 1, "cluster_selection_epsilon": 0.0}, 3),
+    }
+
+    labels = ClusteringService._hdbscan_levels(x, specs)
+
+    for lvl, (config, min_cluster_size) in specs.items():
+        expected = HDBSCAN(
+            min_cluster_size=min_cluster_size,
+            min_samples=config["min_samples"],
+            cluster_selection_epsilon=config["cluster_selection_epsilon"],
+            metric="euclidean",
+            cluster_selection_method="eom",
+        ).fit_predict(x)
+        np.testing.assert_array_equal(labels[lvl], expected)
+
+
+def test_umap_params_shrink_for_small_inputs():
+    small = ClusteringService._umap_params({"n_neighbors": 30, "n_components": 15}, 12)
+    assert small == {"n_neighbors": 11, "n_components": 5}
+    assert ClusteringService._umap_params({"n_neighbors": 10, "n_components": 5}, 1000) == {"n_neighbors": 10, "n_components": 5}
+
+
+def test_stage_plan_is_validated_and_turns_refinement_off():
+    assert ClusteringService._stage_plan(["Refine", "intent"]) == ["intent", "refine"]
+    assert ClusteringService._stage_plan([]) == []
+    with pytest.raises(ValueError):
+        ClusteringService._stage_plan(["intent", "umap"])
+
+    assert ClusteringService._refine_options("strict", None, None, ["intent"])["mode"] == "off"
+    assert ClusteringService._refine_options("strict", None, None, ["refine"])["mode"] == "strict"
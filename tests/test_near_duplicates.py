@@ -0,0 +1,40 @@
+import numpy as np
+
+from keyword_cluster_app.services.clustering_service import ClusteringService
+from keyword_cluster_app.services.near_duplicates import fold_accents, folded_keys, near_duplicate_groups
+
+
+def test_keys_fold_accents_stopwords_and_word_order():
+    assert fold_accents(["học toán lớp 5", "đề thi"]) == ["hoc toan lop 5", "de thi"]
+    assert folded_keys(["học toán lớp 5", "hoc toan lop 5", "lớp 5 của học toán"]) == ["hoc lop5 toan"] * 3
+    assert folded_keys(["toán lớp 6 bài 8"]) != folded_keys(["toán lớp 8 bài 6"])
+    assert folded_keys(["của"]) == ["cua"]
+
+
+def test_groups_merge_variants_but_never_different_numbers():
+    texts = [
+        "học toán lớp 5", "hoc toan lop 5", "toán lớp 5 học", "học toán lớp 6",
+        "toán lớp 6 bài 8", "toán lớp 8 bài 6", "luyện tập toán lớp 5", "toán lớp 5 luyện tập",
+        "giải bài tập sách giáo khoa", "giải bài tập sách giáo khoaa", "và", "của",
+    ]
+    stats = {}
+
+    groups = near_duplicate_groups(texts, stats=stats)
+
+    assert groups.tolist() == [0, 0, 0, 1, 2, 3, 4, 4, 5, 5, 6, 7]
+    assert stats["groups"] == 8 and stats["collapsed"] == 4
+    np.testing.assert_array_equal(near_duplicate_groups(texts), groups)
+    assert near_duplicate_groups([]).tolist() == []
+
+
+def test_collapsed_rows_use_the_highest_volume_variant():
+    texts = ["học toán lớp 5", "hoc toan lop 5", "Hoc Toan Lop 5", "văn mẫu"]
+    codes = np.array([0, 1, 1, 2])
+    unique_embeddings = np.eye(3, dtype=np.float32)
+
+    prepared = ClusteringService._assemble_prepared(texts, [10, 30, 5, 1], codes, unique_embeddings, None, False, {}, collapse=True)
+
+    assert prepared["lexical_texts"] == ["hoc toan lop 5", "văn mẫu"]
+    np.testing.assert_array_equal(prepared["cluster_embeddings"], unique_embeddings[[1, 2]])
+    assert prepared["row_map"].tolist() == [0, 0, 0, 1]
+    assert prepared["near_duplicates"]["groups"] == 2
@@ -0,0 +1,62 @@
+import numpy as np
+
+from keyword_cluster_app.services.noise_assignment import reassign_noise, segment_centroids
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_segment_centroids_are_normalized_cluster_means():
+    embeddings = _unit([[1, 0], [1, 0.2], [0, 1], [0.1, 1], [1, 1]])
+    labels = np.array([3, 3, 7, 7, -1])
+
+    cluster_ids, centroids = segment_centroids(embeddings, labels)
+
+    np.testing.assert_array_equal(cluster_ids, [3, 7])
+    expected = _unit([embeddings[:2].mean(axis=0), embeddings[2:4].mean(axis=0)])
+    np.testing.assert_allclose(centroids, expected, atol=1e-6)
+
+
+def test_reassign_noise_matches_per_pair_loop():
+    rng = np.random.default_rng(1)
+    embeddings = _unit(rng.normal(size=(300, 16)))
+    labels = rng.integers(-1, 12, size=300)
+
+    result = reassign_noise(embeddings, labels, threshold=0.2, max_chunk_bytes=1024)
+
+    cluster_ids, centroids = segment_centroids(embeddings, labels)
+    sims = embeddings @ centroids.T
+    order = np.argsort(-sims, axis=1)
+    np.testing.assert_array_equal(result["best_label"], cluster_ids[order[:, 0]])
+    np.testing.assert_array_equal(result["second_label"], cluster_ids[order[:, 1]])
+    np.testing.assert_allclose(result["margin"], sims[np.arange(300), order[:, 0]] - sims[np.arange(300), order[:, 1]], atol=1e-5)
+
+    expected = labels.copy()
+    for i in np.where(labels == -1)[0]:
+        if sims[i, order[i, 0]] >= 0.2:
+            expected[i] = cluster_ids[order[i, 0]]
+    np.testing.assert_array_equal(result["labels"], expected)
+
+
+def test_reassign_noise_without_clusters_keeps_noise():
+    embeddings = _unit([[1, 0], [0, 1]])
+    result = reassign_noise(embeddings, np.array([-1, -1]))
+
+    np.testing.assert_array_equal(result["labels"], [-1, -1])
+    assert not result["reassigned"].any()
+
+
+def test_neighbor_labels_restrict_noise_to_neighbouring_clusters():
+    embeddings = _unit([[1, 0], [1, 0.1], [0, 1], [0.1, 1], [0.9, 0.3]])
+    labels = np.array([0, 0, 1, 1, -1])
+    # The noise row is closest to cluster 0, but its neighbours are all in cluster 1
+    neighbor_labels = np.array([[0, 0], [0, 0], [1, 1], [1, 1], [1, -1]])
+
+    unrestricted = reassign_noise(embeddings, labels, threshold=0.0)
+    restricted = reassign_noise(embeddings, labels, threshold=0.0, neighbor_labels=neighbor_labels)
+
+    assert unrestricted["labels"][4] == 0
+    assert restricted["labels"][4] == 1
+    assert restricted["reassigned"].tolist() == [False, False, False, False, True]
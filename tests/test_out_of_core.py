@@ -0,0 +1,83 @@
+import csv
+import json
+
+import numpy as np
+
+from keyword_cluster_app.services.out_of_core import KeywordSpool, assign_and_write, choose_sample, plan_memory
+from keyword_cluster_app.utils.file_io import iter_keyword_chunks
+
+
+def _spool(tmp_path, texts, volumes, embeddings, chunk=2):
+    spool = KeywordSpool(str(tmp_path / "spool"))
+    intents = [{"intent": "INFO", "sub_intent": "NONE"}] * len(texts)
+    for start in range(0, len(texts), chunk):
+        stop = start + chunk
+        spool.append(texts[start:stop], volumes[start:stop], embeddings[start:stop], intents[start:stop])
+    spool.close()
+    return spool
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_iter_keyword_chunks_detects_columns_and_streams(tmp_path):
+    path = tmp_path / "kw.csv"
+    path.write_text("Keyword,Search Volume\ngiá vàng,\"1,200\"\n,5\nxe máy,30\nmũ bảo hiểm,\n", encoding="utf-8")
+
+    chunks = list(iter_keyword_chunks(str(path), chunk_rows=2))
+
+    assert chunks == [(["giá vàng"], [1200]), (["xe máy", "mũ bảo hiểm"], [30, 0])]
+
+
+def test_spool_round_trip(tmp_path):
+    texts = ["a", "b\nc", "d", "e", "f"]
+    embeddings = np.arange(10, dtype=np.float32).reshape(5, 2)
+    spool = _spool(tmp_path, texts, [1, 2, 3, 4, 5], embeddings)
+
+    assert spool.n == 5 and spool.dim == 2
+    np.testing.assert_array_equal(spool.embeddings(), embeddings)
+    np.testing.assert_array_equal(spool.volumes(), [1, 2, 3, 4, 5])
+    assert spool.read_texts(np.array([1, 4])) == ["b c", "f"]
+    assert [len(c) for c in spool.iter_texts(2)] == [2, 2, 1]
+
+
+def test_assign_and_write_streams_labels_names_and_noise(tmp_path):
+    texts = ["giá vàng", "giá vàng sjc", "xe máy", "xe máy điện", "thời tiết", "vàng 9999"]
+    volumes = [100, 50, 10, 80, 7, 100]
+    embeddings = _unit([[1, 0.1, 0], [1, 0.2, 0], [0, 1, 0.1], [0, 1, 0], [0, 0, 1], [1, 0, 0]])
+    spool = _spool(tmp_path, texts, volumes, embeddings)
+    sample_rows = np.array([0, 2, 3])
+    sample_labels = np.array([4, 9, 9])
+    cluster_ids = np.array([4, 9])
+    centroids = _unit([[1, 0.1, 0], [0, 1, 0.05]])
+
+    outputs = []
+    for chunk_rows in (2, 100):
+        out = tmp_path / f"out{chunk_rows}"
+        summary = assign_and_write(spool, sample_rows, sample_labels, cluster_ids, centroids, str(out), chunk_rows, threshold=0.9)
+        with open(out / "keywords.csv", encoding="utf-8") as f:
+            outputs.append((summary, list(csv.reader(f)), json.loads((out / "clusters.json").read_text(encoding="utf-8"))))
+
+    assert outputs[0] == outputs[1]
+    summary, rows, clusters = outputs[0]
+    assert [r[2] for r in rows[1:]] == ["giá vàng", "giá vàng", "xe máy điện", "xe máy điện", "thời tiết", "giá vàng"]
+    assert rows[5][3] == "100.0"  # noise keyword is its own cluster
+    assert clusters == [
+        {"cluster_name": "giá vàng", "keyword_count": 3, "total_volume_topic": 250},
+        {"cluster_name": "xe máy điện", "keyword_count": 2, "total_volume_topic": 90},
+    ]
+    assert summary["noise_keywords_found"] == 1 and summary["noise_volume"] == 7
+    assert summary["total_clusters_found"] == 3
+
+
+def test_plan_memory_bounds_chunk_and_sample():
+    small = plan_memory(memory_budget_mb=512, sample_size=10 ** 7, chunk_rows=10 ** 7)
+    large = plan_memory(memory_budget_mb=8192, sample_size=10 ** 7, chunk_rows=0)
+
+    assert small["sample_size"] < large["sample_size"]
+    assert small["chunk_rows"] <= large["chunk_rows"] <= 200000
+    assert np.array_equal(choose_sample(5, 10), np.arange(5))
+    sample = choose_sample(1000, 10)
+    assert len(sample) == 10 and np.all(np.diff(sample) > 0)
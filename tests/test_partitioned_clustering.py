@@ -0,0 +1,43 @@
+import numpy as np
+
+from keyword_cluster_app.services.partitioned_clustering import merge_border_clusters, partition_rows
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_kmeans_partitions_cover_rows_near_target_size():
+    rng = np.random.default_rng(0)
+    centers = _unit(rng.normal(size=(4, 16)))
+    embeddings = _unit(np.repeat(centers, 50, axis=0) + 0.05 * rng.normal(size=(200, 16)))
+
+    partitions = partition_rows(embeddings, target_size=50, method="kmeans")
+
+    assert sorted(np.bincount(partitions).tolist()) == [50, 50, 50, 50]
+    # Rows from the same blob stay together
+    assert all(len(set(partitions[i * 50:(i + 1) * 50].tolist())) == 1 for i in range(4))
+
+
+def test_intent_partitions_pool_small_buckets():
+    embeddings = _unit(np.random.default_rng(1).normal(size=(130, 8)))
+    intents = ["INFO"] * 100 + ["BUY"] * 25 + ["NAV"] * 3 + ["LOCAL"] * 2
+
+    partitions = partition_rows(embeddings, target_size=60, method="intent", intents=intents)
+
+    assert len(np.unique(partitions[:100])) == 2  # split by k-means
+    assert len(np.unique(partitions[100:125])) == 1
+    assert len(np.unique(partitions[125:])) == 1 and partitions[125] != partitions[100]
+
+
+def test_merge_border_clusters_only_across_partitions():
+    embeddings = _unit([[1, 0, 0], [1, 0.01, 0], [1, 0, 0.01], [0, 1, 0], [0, 1, 0.01], [0, 0, 1]])
+    labels = np.array([0, 0, 2, 1, 3, -1])
+    partition_of_label = {0: 0, 1: 0, 2: 1, 3: 0}
+
+    merged_labels, merged = merge_border_clusters(embeddings, labels, partition_of_label, threshold=0.95)
+
+    # 0 and 2 are close and in different partitions; 1 and 3 are close but in the same one
+    assert merged == 1
+    np.testing.assert_array_equal(merged_labels, [0, 0, 0, 1, 3, -1])
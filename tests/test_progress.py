@@ -0,0 +1,68 @@
+import pytest
+
+from keyword_cluster_app.services.progress import STAGES, ProgressReporter, ProgressTracker
+
+
+def test_reporter_percent_grows_through_stages_and_levels():
+    events = []
+    progress = ProgressReporter(events.append, levels=["thấp", "cao"])
+
+    progress.start("cleaning")
+    encode = progress.counter("encoding")
+    encode(50, 100)
+    encode(100, 100)
+    progress.finish("intent")
+    progress.start("umap")  # a stage started late never moves progress back
+    progress.finish("hdbscan")
+    for lvl in ["thấp", "cao"]:
+        progress.start("noise_assignment", lvl)
+        progress.update("refinement", 3, 4, lvl)
+        progress.finish("results", lvl)
+
+    percents = [e["percent"] for e in events]
+    assert percents == sorted(percents) and percents[0] == 0.0 and percents[-1] == 100.0
+    assert events[1]["stage"] == "encoding" and events[1]["stage_percent"] == 50.0
+    assert events[-1]["level"] == "cao" and events[-1]["stage_index"] == len(STAGES)
+    # First level done = half of the per-level block
+    first_done = next(e for e in events if e["stage"] == "results" and e["level"] == "thấp")["percent"]
+    before_levels = next(e for e in events if e["stage"] == "hdbscan")["percent"]
+    assert first_done == pytest.approx((before_levels + 100.0) / 2, abs=0.1)
+    assert ProgressReporter().counter("encoding") is None
+
+
+def test_tracker_throttles_within_a_stage_and_estimates_eta():
+    now = [0.0]
+    tracker = ProgressTracker(min_interval=1.0, clock=lambda: now[0])
+
+    def event(stage, stage_percent, percent):
+        return {"stage": stage, "level": None, "stage_percent": stage_percent, "percent": percent}
+
+    now[0] = 2.0
+    first = tracker.update(event("encoding", 0.0, 2.0))
+    now[0] = 2.5
+    assert tracker.update(event("encoding", 10.0, 5.0)) is None
+    now[0] = 4.0
+    payload = tracker.update(event("encoding", 40.0, 20.0))
+    now[0] = 4.1
+    next_stage = tracker.update(event("intent", 0.0, 37.0))
+    done = tracker.update(event("results", 100.0, 100.0))
+
+    assert first["stage_eta_seconds"] is None and first["elapsed_seconds"] == 2.0
+    assert payload["stage_elapsed_seconds"] == 2.0 and payload["stage_eta_seconds"] == 3.0
+    assert payload["eta_seconds"] == 16.0
+    assert next_stage is not None and next_stage["stage_elapsed_seconds"] == 0.0
+    assert done["eta_seconds"] == 0.0
+
+
+def test_reporter_times_stages_without_a_callback():
+    progress = ProgressReporter()
+
+    progress.start("cleaning")
+    progress.start("encoding")
+    progress.finish("intent")  # reported as done without running: not timed
+    progress.start("umap")
+    progress.add_seconds("hybrid_lexical", 0.5)
+    progress.finish("umap")
+
+    assert list(progress.seconds) == ["cleaning", "encoding", "hybrid_lexical", "umap"]
+    assert progress.seconds["hybrid_lexical"] == 0.5
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from keyword_cluster_app.config import get_level_config
+from keyword_cluster_app.services import project_store
+from keyword_cluster_app.services.clustering_service import ClusteringService
+from keyword_cluster_app.services.result_builder import build_cluster_map
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _blobs(rng, centers, per_blob, noise=0.05):
+    return _unit(np.repeat(centers, per_blob, axis=0) + noise * rng.normal(size=(len(centers) * per_blob, centers.shape[1])))
+
+
+@pytest.fixture
+def projects_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(project_store, "PROJECTS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _save_demo_project(rng, centers, words):
+    embeddings = _blobs(rng, centers, 20)
+    texts = [f"{words[i // 20]} {i}" for i in range(len(embeddings))]
+    level = "trung bình"
+    artifacts = {"cluster_rows": {}}
+    level_labels, _ = ClusteringService._reduce_and_cluster_levels(
+        embeddings, texts, {level: (get_level_config(level), 5)}, artifacts=artifacts
+    )
+    artifacts["labels"] = level_labels[level]
+    clusters, _, _, _ = build_cluster_map(texts, [10] * len(texts), artifacts["labels"], embeddings, cluster_rows=artifacts["cluster_rows"])
+    prepared = {"original_texts": texts, "volumes": [10] * len(texts), "embeddings": embeddings, "row_map": None}
+    return project_store.save_project("demo", prepared, artifacts, level, {"clusters": clusters}, {}), clusters, texts
+
+
+def test_saved_project_places_new_keywords(projects_dir):
+    rng = np.random.default_rng(0)
+    centers = _unit(rng.normal(size=(3, 32)))
+    words = ["alpha", "beta", "gamma"]
+    info, clusters, texts = _save_demo_project(rng, centers, words)
+    assert info["clusters"] == 3
+
+    project = project_store.load_project("demo")
+    new = _unit(np.vstack([centers + 0.05 * rng.normal(size=centers.shape), rng.normal(size=(1, 32))]))
+    placement = project.assign(new, ["alpha new", "beta new", "gamma new", "unrelated"])
+
+    key_of_word = {w: next(k for k, c in clusters.items() if c["cluster_name"].startswith(w)) for w in words}
+    assert placement["cluster_keys"][:3] == [key_of_word[w] for w in words]
+    assert list(placement["status"][:3]) == ["clustered"] * 3
+    assert placement["cluster_keys"][3] is None and placement["status"][3] == "noise"
+    assert all(project.assignments[t] for t in texts)
+
+
+def test_delta_updates_drift_and_rejects_stale_versions(projects_dir, monkeypatch):
+    monkeypatch.setattr(project_store, "PROJECT_DRIFT_MIN_KEYWORDS", 4)
+    monkeypatch.setattr(project_store, "PROJECT_MAX_GROWTH", 0.5)
+    rng = np.random.default_rng(1)
+    _save_demo_project(rng, _unit(rng.normal(size=(3, 32))), ["alpha", "beta", "gamma"])
+    version = project_store.read_meta("demo")["version"]
+
+    rows = [{"text": f"kw {i}", "volume": 1, "cluster_name": f"kw {i}", "status": "noise"} for i in range(3)]
+    drift = project_store.append_delta("demo", version, rows, noise=3)
+    assert drift["added_keywords"] == 3 and not drift["recluster_required"]  # below the minimum
+    drift = project_store.append_delta("demo", version, rows[:1], noise=1)
+    assert drift["noise_ratio"] == 1.0 and drift["recluster_required"]
+
+    assert "kw 0" in project_store.load_project("demo").assignments
+    assert len(project_store.project_keywords("demo")) == 60 + 4
+    with pytest.raises(RuntimeError):
+        project_store.append_delta("demo", "stale", rows, noise=0)
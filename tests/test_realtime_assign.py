@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import numpy as np
+
+from keyword_cluster_app.services import realtime_assign
+from keyword_cluster_app.services.realtime_assign import CentroidIndex, MicroBatcher, get_centroid_index
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_top_k_orders_clusters_by_centroid_similarity():
+    centroids = _unit([[1, 0, 0], [0, 1, 0], [0, 0, 1]])
+    index = CentroidIndex("p", "v1", ["a", "b", "c"], centroids, centroids)
+
+    result = index.top_k(_unit([[0.2, 1, 0.5]]), k=2)[0]
+
+    assert [c["cluster_name"] for c in result] == ["b", "c"]
+    assert result[0]["score"] > result[1]["score"]
+    assert result[0]["matching_point"] == round(result[0]["score"] * 100, 1)
+    assert len(index.top_k(_unit([[1, 0, 0]]), k=10)[0]) == 3
+
+
+def test_micro_batcher_shares_encoder_calls_between_concurrent_requests():
+    batches = []
+
+    def encode(texts):
+        batches.append(list(texts))
+        time.sleep(0.02)
+        return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+    batcher = MicroBatcher(encode, max_batch=8, max_wait_ms=1)
+    texts = [f"kw {'x' * i}" for i in range(20)]
+
+    async def run():
+        return await asyncio.gather(*(batcher.encode(t) for t in texts))
+
+    results = asyncio.run(run())
+
+    assert [float(r[0]) for r in results] == [float(len(t)) for t in texts]
+    assert len(batches) < len(texts) and max(len(b) for b in batches) <= 8
+    assert batcher.stats["texts"] == 20 and batcher.stats["batches"] == len(batches)
+
+
+def test_centroid_index_reloads_when_project_version_changes(monkeypatch):
+    state = {"version": "v1", "keys": ["a"]}
+    monkeypatch.setattr(realtime_assign, "read_meta", lambda project_id: {"version": state["version"]})
+    monkeypatch.setattr(realtime_assign, "read_centroids", lambda project_id: {
+        "cluster_keys": np.array(state["keys"]),
+        "centroids": np.eye(len(state["keys"]), 2, dtype=np.float32),
+        "name_embeddings": np.eye(len(state["keys"]), 2, dtype=np.float32),
+    })
+    monkeypatch.setattr(realtime_assign, "ASSIGN_INDEX_REFRESH_SECONDS", 0.0)
+    monkeypatch.setattr(realtime_assign, "_indexes", {})
+
+    first = get_centroid_index("p")
+    assert get_centroid_index("p") is first
+
+    state.update(version="v2", keys=["a", "b"])
+    second = get_centroid_index("p")
+    assert second is not first and second.cluster_keys == ["a", "b"]
@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from keyword_cluster_app.services.result_builder import (
+    add_cluster_intents,
+    add_keyword_intents,
+    add_singleton_clusters,
+    build_cluster_map,
+)
+
+
+def test_build_cluster_map_names_sorts_and_scores_clusters():
+    texts = ["toán lớp 1", "toán lớp 2", "văn lớp 1", "văn mẫu", "toán 1", "lạc đề"]
+    volumes = [100, 300, 50, 50, 300, 7]
+    labels = np.array([0, 0, 1, 1, 0, -1])
+    embeddings = np.eye(6, dtype=np.float32)
+    embeddings[4] = embeddings[1]
+
+    clusters, noise_keywords, noise_volume, _ = build_cluster_map(texts, volumes, labels, embeddings)
+
+    assert list(clusters) == ["toán lớp 2", "văn lớp 1", "lạc đề"]
+    toan = clusters["toán lớp 2"]
+    assert toan["total_volume_topic"] == 700
+    assert [kw["text"] for kw in toan["keywords"]] == ["toán lớp 1", "toán lớp 2", "toán 1"]
+    assert [kw["matching_point"] for kw in toan["keywords"]] == [0.0, 100.0, 100.0]
+    assert (noise_keywords, noise_volume) == (1, 7)
+
+
+def test_duplicate_cluster_names_do_not_overwrite():
+    texts = ["giải toán", "giải toán", "x", "y"]
+    labels = np.array([0, 1, 0, 1])
+    embeddings = np.eye(4, dtype=np.float32)
+
+    clusters, _, _, used = build_cluster_map(texts, [10, 10, 1, 1], labels, embeddings)
+    add_singleton_clusters(clusters, [{"text": "giải toán", "volume": 3}], used)
+
+    assert set(clusters) == {"giải toán", "giải toán (2)", "giải toán (3)"}
+    assert all(c["cluster_name"] == "giải toán" for c in clusters.values())
+    assert sum(len(c["keywords"]) for c in clusters.values()) == 5
+
+
+def test_intents_follow_keywords_into_clusters_and_singletons():
+    texts = ["mua xe", "giá xe", "xe là gì", "xe cũ"]
+    intents = [
+        {"intent": "TRANSACTIONAL", "sub_intent": "BUY"},
+        {"intent": "TRANSACTIONAL", "sub_intent": "PRICE"},
+        {"intent": "INFORMATIONAL", "sub_intent": "KNOWLEDGE"},
+        {"intent": "INFORMATIONAL", "sub_intent": "NONE"},
+    ]
+    cluster_rows = {}
+    clusters, _, _, used = build_cluster_map(texts, [10, 20, 50, 5], np.array([0, 0, 0, -1]), np.eye(4, dtype=np.float32), cluster_rows)
+
+    add_keyword_intents(clusters, cluster_rows, intents)
+    rejected = clusters["xe là gì"]["keywords"].pop()
+    add_singleton_clusters(clusters, [rejected], used)
+    add_cluster_intents(clusters)
+
+    assert [kw["sub_intent"] for kw in clusters["xe là gì"]["keywords"]] == ["BUY", "PRICE"]
+    assert clusters["xe là gì"]["cluster_intent"] == "TRANSACTIONAL"
+    assert clusters["xe là gì (2)"]["keywords"][0]["intent"] == "INFORMATIONAL"
+    assert clusters["xe cũ"]["cluster_intent"] == "INFORMATIONAL"
+
+
+def test_build_cluster_map_scales_linearly():
+    rng = np.random.default_rng(0)
+    n = 100_000
+    texts = [f"kw {i}" for i in range(n)]
+    volumes = rng.integers(0, 1000, size=n).tolist()
+    labels = rng.integers(-1, 5000, size=n)
+    embeddings = rng.normal(size=(n, 32)).astype(np.float32)
+
+    start = time.perf_counter()
+    clusters, _, _, _ = build_cluster_map(texts, volumes, labels, embeddings)
+    elapsed = time.perf_counter() - start
+
+    assert sum(len(c["keywords"]) for c in clusters.values()) == n
+    assert elapsed < 5.0
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("hdbscan")
+
+from hdbscan import HDBSCAN
+
+from keyword_cluster_app.services import task_artifacts
+from keyword_cluster_app.services.clustering_service import ClusteringService
+
+
+@pytest.fixture
+def tasks_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(task_artifacts, "TASK_ARTIFACTS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _prepared(cluster_unique_only):
+    rng = np.random.default_rng(0)
+    unique_embeddings = rng.normal(size=(3, 4)).astype(np.float16).astype(np.float32)
+    intents = [{"intent": "INFO", "sub_intent": "NONE"}, {"intent": "BUY", "sub_intent": "PRICE"}, {"intent": "INFO", "sub_intent": "NONE"}]
+    return ClusteringService._assemble_prepared(
+        ["giá vàng", "Giá Vàng", "xe máy", "mũ"], [10, 30, 5, 1], np.array([0, 0, 1, 2]), unique_embeddings, intents, cluster_unique_only, {}
+    )
+
+
+@pytest.mark.parametrize("cluster_unique_only", [False, True])
+def test_keyword_stage_round_trip(tasks_dir, cluster_unique_only):
+    prepared = _prepared(cluster_unique_only)
+    directory = task_artifacts.save_task_artifacts("t1", prepared, {"level": "cao"})
+
+    stage = task_artifacts.load_keyword_stage(directory)
+    manifest = task_artifacts.read_manifest(directory)
+    restored = ClusteringService._assemble_prepared(
+        stage["original_texts"], stage["volumes"], stage["codes"], stage["unique_embeddings"],
+        stage["unique_intents"], manifest["cluster_unique_only"], {},
+    )
+
+    assert manifest["settings"] == {"level": "cao"} and manifest["keywords"] == 4
+    np.testing.assert_array_equal(restored["cluster_embeddings"], prepared["cluster_embeddings"])
+    assert restored["lexical_texts"] == prepared["lexical_texts"]
+    assert restored["intents"] == prepared["intents"]
+    assert (restored["row_map"] is None) == (prepared["row_map"] is None)
+
+
+def test_cluster_selection_on_stored_tree_matches_a_fresh_fit(tasks_dir):
+    rng = np.random.default_rng(1)
+    reduced = np.vstack([c + rng.normal(size=(30, 3)) for c in rng.normal(scale=10, size=(5, 3))]).astype(np.float32)
+    clusterer = HDBSCAN(min_cluster_size=5, min_samples=2, prediction_data=True).fit(reduced)
+    directory = task_artifacts.save_task_artifacts("t1", _prepared(False), {})
+
+    stages = task_artifacts.add_stage_artifacts(directory, {(10, 3): reduced}, {((10, 3), 2): clusterer.single_linkage_tree_.to_numpy()})
+    manifest = task_artifacts.read_manifest(directory)
+    tree = task_artifacts.load_tree(directory, manifest, (10, 3), 2)
+
+    assert stages == ["prepare", "reduce:10x3", "cluster:10x3_ms2"]
+    assert task_artifacts.load_tree(directory, manifest, (10, 3), 1) is None
+    np.testing.assert_array_equal(task_artifacts.load_reduced(directory, manifest, (10, 3)), reduced)
+    labels = ClusteringService._select_clusters(reduced, tree, {"cluster_selection_epsilon": 0.0}, 20)
+    expected = HDBSCAN(min_cluster_size=20, min_samples=2, cluster_selection_method="eom").fit_predict(reduced)
+    np.testing.assert_array_equal(labels, expected)
+
+
+def test_prune_keeps_newest_tasks(tasks_dir, monkeypatch):
+    monkeypatch.setattr(task_artifacts, "TASK_ARTIFACTS_MAX_TASKS", 2)
+    for i, name in enumerate(["old", "mid", "new"]):
+        os.makedirs(tasks_dir / name)
+        os.utime(tasks_dir / name, (1000 + i, 1000 + i))
+    monkeypatch.setattr(task_artifacts, "TASK_ARTIFACTS_TTL_SECONDS", 10 ** 12)
+
+    task_artifacts.prune_task_artifacts(keep=str(tasks_dir / "current"))
+
+    assert sorted(os.listdir(tasks_dir)) == ["new"]
@@ -0,0 +1,22 @@
+import unicodedata
+
+from keyword_cluster_app.utils.text_processing import clean_keyword, clean_keywords
+
+
+def test_nfc_and_nfd_forms_clean_to_the_same_text():
+    composed = "Học Toán  Lớp5"
+    decomposed = unicodedata.normalize("NFD", composed)
+
+    assert composed != decomposed
+    assert clean_keyword(composed) == clean_keyword(decomposed) == "học toán lớp 5"
+
+
+def test_column_cleaning_matches_clean_keyword():
+    texts = [
+        "  giải bài7 trang\t12 ", "tập 2\nlớp\n3", "Toán lớp 10", "Toán lớp 10", "", None, 5,
+        "bàilớp3", unicodedata.normalize("NFD", "Đề thi tập1"), "x  y",
+    ]
+
+    assert clean_keywords(texts) == [clean_keyword(t) for t in texts]
+    assert clean_keywords(texts)[:2] == ["giải bài 7 trang 12", "tập 2 lớp 3"]
+    assert clean_keywords([]) == []